@@ -0,0 +1,147 @@
+# app/act_router.py
+"""
+Coarse-to-fine act routing.
+
+Most questions concern one or two acts, so HybridRetriever.search first
+ranks whole acts cheaply and only then runs the fine search (BM25, FAISS)
+over the chunks of the top few. Ingest writes per act (acts.json):
+
+    {act_id: {"name", "scope", "rows": [[start, end), ...], "length", "terms": {term: tf}}}
+
+plus act_centroids.npy, the normalised mean embedding of each act's chunks
+in acts.json order. An act is scored as one BM25 document made of its term
+profile, blended with the cosine of the query to its centroid. An act the
+query names ("... under the BNS") is always routed to.
+
+When the chosen acts hold less than ROUTER_MIN_CONFIDENCE of the score mass,
+the query is left to the full search. Pruning is logged per query. Recall
+is measured on a sample (ROUTER_AUDIT_RATE): the routed candidates are
+compared with a full search of the same query.
+"""
+from __future__ import annotations
+import math
+import random
+import threading
+from typing import Dict, List, Optional, Sequence, Set
+
+import numpy as np
+from scipy.sparse import csr_matrix
+
+
+class Route:
+    """The acts a query was routed to and the meta rows the fine search may score."""
+
+    __slots__ = ("acts", "rows", "confidence", "pruned")
+
+    def __init__(self, acts: List[str], rows: np.ndarray, confidence: float, pruned: float):
+        self.acts = acts
+        self.rows = rows
+        self.confidence = confidence
+        self.pruned = pruned
+
+
+class ActRouter:
+    def __init__(self, acts: Dict[str, Dict], centroids: Optional[np.ndarray] = None,
+                 k1: float = 1.2, b: float = 0.75):
+        self.ids = list(acts)
+        self.names = [acts[a].get("name") for a in self.ids]
+        self.scopes = [acts[a].get("scope") for a in self.ids]
+        self.rows = [
+            np.concatenate([np.arange(s, e) for s, e in acts[a]["rows"]]).astype("int64")
+            if acts[a]["rows"] else np.zeros(0, dtype="int64")
+            for a in self.ids
+        ]
+        self.centroids = centroids if centroids is not None and len(centroids) == len(self.ids) else None
+
+        # Terms x acts BM25 weights: each act's profile is one long document
+        n = len(self.ids)
+        df: Dict[str, int] = {}
+        for a in self.ids:
+            for term in acts[a]["terms"]:
+                df[term] = df.get(term, 0) + 1
+        lengths = np.array([acts[a].get("length") or sum(acts[a]["terms"].values()) for a in self.ids], dtype="float64")
+        avgdl = lengths.mean() if n else 1.0
+        self.vocab: Dict[str, int] = {}
+        rows, cols, vals = [], [], []
+        for j, a in enumerate(self.ids):
+            norm = k1 * (1 - b + b * lengths[j] / avgdl)
+            for term, tf in acts[a]["terms"].items():
+                idf = math.log(1 + (n - df[term] + 0.5) / (df[term] + 0.5))  # always positive, even for 3 acts
+                rows.append(self.vocab.setdefault(term, len(self.vocab)))
+                cols.append(j)
+                vals.append(idf * tf * (k1 + 1) / (tf + norm))
+        self.weights = csr_matrix((np.asarray(vals, dtype="float64"), (rows, cols)), shape=(len(self.vocab), n))
+
+        self._lock = threading.Lock()
+        self._audits = 0
+        self._recall_sum = 0.0
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    # ------------------------------------------------------------------ #
+    #  Coarse stage
+    # ------------------------------------------------------------------ #
+    def scores(self, query: str, query_vec: Optional[np.ndarray] = None) -> np.ndarray:
+        """Share of the routing mass per act (sums to 1, or all zeros when nothing matched)."""
+        parts = []
+        idx = [self.vocab[t] for t in dict.fromkeys(query.split()) if t in self.vocab]  # tokenised as BM25 is
+        if idx:
+            lexical = np.asarray(self.weights[idx].sum(axis=0)).ravel()
+            if lexical.sum() > 0:
+                parts.append(lexical / lexical.sum())
+        if query_vec is not None and self.centroids is not None:
+            sim = self.centroids @ query_vec
+            dense = np.exp((sim - sim.max()) / 0.05)  # softmax over cosines; 0.05 keeps close calls close
+            parts.append(dense / dense.sum())
+        return np.mean(parts, axis=0) if parts else np.zeros(len(self.ids))
+
+    def route(self, query: str, query_vec: Optional[np.ndarray] = None, top_acts: int = 3,
+              min_confidence: float = 0.5, scopes: Optional[Sequence[str]] = None,
+              named: Sequence[str] = ()) -> Optional[Route]:
+        """
+        The acts to search, or None for a full search: too few acts in scope
+        to prune, or the top acts are not clearly ahead.
+        """
+        allowed = [j for j, s in enumerate(self.scopes) if not scopes or s in scopes]
+        if len(allowed) <= top_acts:
+            return None
+        mass = self.scores(query, query_vec)[allowed]
+        if mass.sum() > 0:
+            mass = mass / mass.sum()
+        named_set: Set[str] = set(named)
+        chosen = [i for i, j in enumerate(allowed) if self.ids[j] in named_set]  # positions in `allowed`
+        for i in np.argsort(-mass):
+            if len(chosen) >= top_acts or mass[i] <= 0:
+                break
+            if i not in chosen:
+                chosen.append(int(i))
+        confidence = 1.0 if any(self.ids[allowed[i]] in named_set for i in chosen) else float(mass[chosen].sum())
+        chosen = [allowed[i] for i in chosen]
+        total = sum(len(self.rows[j]) for j in allowed)
+        kept = np.sort(np.concatenate([self.rows[j] for j in chosen])) if chosen else np.zeros(0, dtype="int64")
+        pruned = 1.0 - len(kept) / total if total else 0.0
+        label = ", ".join(self.names[j] or self.ids[j] for j in chosen)
+        if not chosen or confidence < min_confidence:
+            print(f"[router] low confidence ({confidence:.2f} on {label or 'no act'}); full search")
+            return None
+        print(f"[router] {label} (confidence {confidence:.2f}); pruned {pruned:.0%} of {total} chunks")
+        return Route([self.ids[j] for j in chosen], kept, confidence, pruned)
+
+    # ------------------------------------------------------------------ #
+    #  Recall audit
+    # ------------------------------------------------------------------ #
+    def should_audit(self, rate: float) -> bool:
+        return rate > 0 and random.random() < rate
+
+    def record_recall(self, routed: List[Dict], full: List[Dict]) -> float:
+        """Fraction of the full search's candidates that the routed search also found."""
+        key = lambda d: d.get("id") or d["text"][:80]  # noqa: E731
+        want = {key(d) for d in full}
+        recall = len(want & {key(d) for d in routed}) / len(want) if want else 1.0
+        with self._lock:
+            self._audits += 1
+            self._recall_sum += recall
+            mean = self._recall_sum / self._audits
+        print(f"[router] recall@{len(want)} {recall:.2f} (mean {mean:.2f} over {self._audits} audited queries)")
+        return recall
@@ -0,0 +1,128 @@
+# app/chunk_store.py
+"""
+Content-addressed store of parsed uploads.
+
+An uploaded PDF is parsed, chunked and embedded once per distinct content
+and chunker (blob_key: sha256 of the file bytes + a tag of the chunker), under
+data/index/blobs/<key[:2]>/<key>/:
+
+    chunks.jsonl   the chunk texts, in order
+    vectors.npy    their embeddings (absent in BM25-only mode)
+    rows.npy       which chunk each vector belongs to
+    info.json      pages, chunker, embed model
+
+Users hold references to a blob (UserIndexStore.add(..., ref=...)) instead of
+copies, so the second upload of the same rental agreement or FIR template is a
+metadata-only operation. A changed chunker gives a new key, so stale chunks
+are never reused; references to the old blob keep expanding to what they indexed. A blob is written into a temp directory and renamed
+into place, so readers only ever see complete blobs.
+"""
+from __future__ import annotations
+import hashlib
+import json
+import os
+import shutil
+import threading
+import uuid
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.segment_store import fsync_dir, save_npy
+
+Blob = Tuple[List[str], Optional[np.ndarray], Optional[np.ndarray], Dict]
+
+
+def upload_records(chunks: List[str], filename: str, scope: str, user_id: Optional[str],
+                   content_hash: Optional[str] = None) -> List[Dict]:
+    """Meta rows for an uploaded document's chunks."""
+    return [
+        {
+            "text": chunk,
+            "filename": filename,
+            "source": filename,
+            "title": filename,
+            "chunk_id": i,
+            # --- Scope & jurisdiction metadata ---
+            "scope": scope,
+            "act_name": filename,
+            "jurisdiction": "india",
+            "user_id": user_id,
+            "content_hash": content_hash,
+        }
+        for i, chunk in enumerate(chunks)
+    ]
+
+
+def blob_key(content_hash: str, chunker: str) -> str:
+    """Blob name for this content as cut by this chunker."""
+    return f"{content_hash}-{hashlib.sha1(chunker.encode('utf-8')).hexdigest()[:8]}"
+
+
+class ChunkStore:
+    def __init__(self, root: Path, cache_size: int = 64):
+        self.root = Path(root)
+        self.cache_size = cache_size
+        # (sha, with_vectors) -> blob, shared by every user referencing it
+        self._cache: "OrderedDict[Tuple[str, bool], Blob]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _dir(self, sha: str) -> Path:
+        return self.root / sha[:2] / sha
+
+    def has(self, sha: Optional[str]) -> bool:
+        return bool(sha) and (self._dir(sha) / "info.json").exists()
+
+    def get(self, sha: str, with_vectors: bool = True) -> Optional[Blob]:
+        """(chunk texts, vectors, vector rows, info) or None if this content was never stored."""
+        key = (sha, with_vectors)  # a blob read without vectors must not answer a caller that wants them
+        with self._lock:
+            blob = self._cache.get(key)
+            if blob is not None:
+                self._cache.move_to_end(key)
+                return blob
+        if not self.has(sha):
+            return None
+        d = self._dir(sha)
+        with open(d / "chunks.jsonl", "r", encoding="utf-8") as f:
+            chunks = [json.loads(line)["text"] for line in f]
+        vectors = rows = None
+        if with_vectors and (d / "vectors.npy").exists():
+            vectors = np.load(d / "vectors.npy")
+            rows = np.load(d / "rows.npy")
+        blob = (chunks, vectors, rows, json.loads((d / "info.json").read_text(encoding="utf-8")))
+        with self._lock:
+            self._cache[key] = blob
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return blob
+
+    def put(self, sha: str, chunks: List[str], vectors: Optional[np.ndarray] = None,
+            vector_rows: Optional[Sequence[int]] = None, info: Dict = None) -> None:
+        """Store a parsed upload; a no-op if another job stored the same content first."""
+        final = self._dir(sha)
+        if self.has(sha):
+            return
+        tmp = final.with_name(f".{sha}.{uuid.uuid4().hex[:8]}.tmp")
+        tmp.mkdir(parents=True)
+        try:
+            with open(tmp / "chunks.jsonl", "w", encoding="utf-8") as f:
+                for text in chunks:
+                    f.write(json.dumps({"text": text}, ensure_ascii=False) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            if vectors is not None and len(vectors):
+                save_npy(tmp / "rows.npy", np.asarray(
+                    vector_rows if vector_rows is not None else range(len(chunks)), dtype="int64"))
+                save_npy(tmp / "vectors.npy", np.ascontiguousarray(vectors, dtype="float32"))
+            (tmp / "info.json").write_text(json.dumps({"chunks": len(chunks), **(info or {})}), encoding="utf-8")
+            fsync_dir(tmp)
+            try:
+                os.rename(tmp, final)
+            except OSError:  # lost a race with an identical upload
+                pass
+            fsync_dir(final.parent)
+        finally:
+            shutil.rmtree(tmp, ignore_errors=True)
@@ -1,10 +1,16 @@
 from __future__ import annotations
+import hashlib
+import json
+import multiprocessing
+import os
 import re
-from typing import Iterable, Dict, List
+import uuid
+from bisect import bisect_left, bisect_right
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from functools import lru_cache
+from typing import Callable, Iterable, Dict, List, Optional, Tuple
 from pathlib import Path
 from pypdf import PdfReader
-from bs4 import BeautifulSoup
-import trafilatura
 
 HEADING_RE = re.compile(r"^(Chapter|CHAPTER|Section|SECTION|\u00a7|Sec\.|Article)\b.*", re.I)
 
@@ -18,6 +24,10 @@ def _by_tokens(words: List[str], max_tokens=520, overlap=96) -> List[str]:
     for i in range(0, len(words), step):
         chunk = words[i:i + max_tokens]
         if len(chunk) < 30:
+            # With overlap the short tail is already inside the previous window;
+            # without it, fold the tail into the previous segment so no text is lost.
+            if not overlap and chunks:
+                chunks[-1] += " " + " ".join(chunk)
             continue
         chunks.append(" ".join(chunk))
     return chunks
@@ -37,23 +47,167 @@ def _split_section_first(text: str) -> List[str]:
         sections.append(" ".join(cur))
     return sections if sections else [text]
 
+# Content-addressed cache of extracted page text (keyed by file sha256)
+PARSE_CACHE_DIR = Path("data/cache/pdf_text")
+PAGES_PER_TASK = 16        # page-range size handed to each worker
+PARALLEL_MIN_PAGES = 32    # below this, process startup costs more than it saves
+
+def file_sha256(path: Path) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+def _extract_page_range(path_str: str, start: int, end: int) -> List[str]:
+    """Worker: extract text for pages [start, end). Top-level so it pickles."""
+    reader = PdfReader(path_str)
+    return [(reader.pages[i].extract_text() or "") for i in range(start, end)]
+
+def extract_pdf_pages(
+    path: Path,
+    use_cache: bool = True,
+    max_workers: Optional[int] = None,
+    on_progress: Optional[Callable[[int, int], None]] = None,
+) -> List[str]:
+    """
+    Return the text of every page in the PDF.
+    Large files are split into page ranges and extracted on a process pool
+    (spawned, never forked: the API calls this from worker threads of a
+    process with torch loaded);
+    results are cached on disk by content hash so unchanged files are never re-parsed.
+    on_progress(pages_done, pages_total) is called as ranges complete.
+    """
+    cache_file = None
+    if use_cache:
+        cache_file = PARSE_CACHE_DIR / f"{file_sha256(path)}.json"
+        if cache_file.exists():
+            try:
+                pages = json.loads(cache_file.read_text(encoding="utf-8"))["pages"]
+                if on_progress:
+                    on_progress(len(pages), len(pages))
+                return pages
+            except Exception:
+                pass  # corrupt cache entry — re-parse below
+
+    total = len(PdfReader(str(path)).pages)
+    ranges = [(i, min(i + PAGES_PER_TASK, total)) for i in range(0, total, PAGES_PER_TASK)]
+    workers = max_workers or os.cpu_count() or 1
+    pages: List[str] = [""] * total
+
+    if total < PARALLEL_MIN_PAGES or workers < 2 or len(ranges) < 2:
+        for start, end in ranges:
+            pages[start:end] = _extract_page_range(str(path), start, end)
+            if on_progress:
+                on_progress(end, total)
+    else:
+        done = 0
+        with ProcessPoolExecutor(max_workers=min(workers, len(ranges)),
+                                 mp_context=multiprocessing.get_context("spawn")) as pool:
+            futures = {pool.submit(_extract_page_range, str(path), s, e): (s, e) for s, e in ranges}
+            for fut in as_completed(futures):
+                s, e = futures[fut]
+                pages[s:e] = fut.result()
+                done += e - s
+                if on_progress:
+                    on_progress(done, total)
+
+    if cache_file is not None:
+        PARSE_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        tmp = cache_file.with_name(f"{cache_file.stem}.{os.getpid()}.{uuid.uuid4().hex[:8]}.tmp")  # concurrent uploads of one PDF
+        tmp.write_text(json.dumps({"source": str(path), "pages": pages}, ensure_ascii=False), encoding="utf-8")
+        os.replace(tmp, cache_file)
+    return pages
+
 def parse_pdf(path: Path) -> Iterable[Dict]:
-    reader = PdfReader(str(path))
-    full: List[str] = []
-    for _, page in enumerate(reader.pages):
-        txt = page.extract_text() or ""
-        full.append(txt)
+    full = extract_pdf_pages(path)
     text = _clean("\n".join(full))
     for sec in _split_section_first(text):
         yield {"title": path.stem, "text": sec, "source": str(path), "url": None}
 
 def parse_html(path: Path) -> Iterable[Dict]:
+    # HTML deps are ingest-only; imported here so the API can use the PDF helpers without them
+    from bs4 import BeautifulSoup
+    import trafilatura
     raw = path.read_text(encoding="utf-8", errors="ignore")
     extracted = trafilatura.extract(raw) or BeautifulSoup(raw, "html.parser").get_text(" ")
     text = _clean(extracted)
     for sec in _split_section_first(text):
         yield {"title": path.stem, "text": sec, "source": str(path), "url": None}
 
-def chunk_section(section_text: str, max_tokens=520, overlap=96) -> List[str]:
+# Base segments are the old 520/96 window's stride: segment k plus the first
+# 96 words of segment k+1 reproduces the old window exactly at retrieval time.
+SEGMENT_WORDS = 424
+WINDOW_OVERLAP_WORDS = 96
+
+def chunk_section(section_text: str, max_tokens=SEGMENT_WORDS, overlap=0) -> List[str]:
     words = section_text.split()
     return _by_tokens(words, max_tokens=max_tokens, overlap=overlap)
+
+
+# ---------------------------------------------------------------------- #
+#  Tokenizer-aware chunking (respects the embedding model's max_seq_length)
+# ---------------------------------------------------------------------- #
+# Places a new legal unit starts, strongest first. Text is whitespace-collapsed by
+# _clean(), so every pattern matches inline and points at the unit's first character.
+_BOUNDARY_RXES = [
+    # "303. Theft." / "24A. Power ..." — section heading
+    re.compile(r"(?<=\s)\d{1,4}[A-Z]{0,2}\.\s+(?=[A-Z])"),
+    # "CHAPTER XVII" / "PART II"
+    re.compile(r"(?<=\s)(?:CHAPTER|Chapter|PART)\s+[IVXLC\d]+\b"),
+    # "(1)" sub-section, "(a)" / "(iv)" clause, "Explanation", "Illustration", "Provided that"
+    re.compile(r"(?<=\s)(?:\((?:\d{1,3}|[a-z]{1,4})\)\s|Explanation\b|Illustrations?\b|Provided\s+that\b)"),
+    # sentence end (cut after the punctuation)
+    re.compile(r"(?<=[.;:])\s+(?=\S)"),
+]
+
+@lru_cache(maxsize=2)
+def load_embedding_tokenizer(model_name: str) -> Tuple[object, int]:
+    """Return (fast tokenizer, usable tokens per chunk) for a sentence-transformers model."""
+    from sentence_transformers import SentenceTransformer
+    model = SentenceTransformer(model_name, device="cpu")
+    # [CLS] and [SEP] take two of the model's max_seq_length positions
+    return model.tokenizer, model.max_seq_length - 2
+
+def chunk_by_tokens(text: str, tokenizer, max_tokens: int, min_tokens: Optional[int] = None) -> List[str]:
+    """
+    Cut text into pieces of at most max_tokens word-pieces, preferring the
+    strongest legal boundary (section > chapter > clause > sentence) that leaves
+    each piece at least min_tokens long. One fast-tokenizer pass with offset
+    mapping covers the whole document.
+    """
+    if not text.strip():
+        return []
+    min_tokens = min_tokens if min_tokens is not None else max_tokens // 3
+    enc = tokenizer(text, add_special_tokens=False, return_offsets_mapping=True, verbose=False)
+    offsets = [o for o in enc["offset_mapping"] if o[1] > o[0]]
+    n = len(offsets)
+    if n <= max_tokens:
+        return [text.strip()]
+    starts = [o[0] for o in offsets]
+
+    # Token index at which each boundary class starts a new unit
+    bounds: List[List[int]] = []
+    for rx in _BOUNDARY_RXES:
+        idx = {bisect_left(starts, m.end() if rx is _BOUNDARY_RXES[-1] else m.start()) for m in rx.finditer(text)}
+        bounds.append(sorted(i for i in idx if 0 < i < n))
+
+    chunks: List[str] = []
+    s = 0
+    while s < n:
+        e = s + max_tokens
+        if e >= n:
+            cut = n
+        else:
+            cut = e  # hard cut if no boundary fits
+            for cls in bounds:
+                lo = bisect_left(cls, s + min_tokens)
+                hi = bisect_right(cls, e) - 1
+                if hi >= lo:
+                    cut = cls[hi]
+                    break
+        piece = text[offsets[s][0]:offsets[cut - 1][1]].strip()
+        if piece:
+            chunks.append(piece)
+        s = cut
+    return chunks
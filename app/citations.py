@@ -0,0 +1,187 @@
+# app/citations.py
+"""
+Act-aware section index and citation parsing.
+
+Ingest builds a multi-valued (act, section number) -> chunk rows index from the
+structure tree and writes it to data/index/section_index.json. At query time
+parse() recognises "Section 303 of BNS", "BNS s. 303", "sec 24 of the Code on
+Wages", ... so explicit citations can be answered straight from the index.
+"""
+from __future__ import annotations
+import re
+from typing import Dict, List, Optional, Tuple
+
+from app.matcher import AhoCorasick
+from app.structure import StructureTree
+
+# Canonical key -> phrases a user (or a file name) may use for the act
+ACT_ALIASES: Dict[str, List[str]] = {
+    "bns": ["bns", "bharatiya nyaya sanhita", "nyaya sanhita"],
+    "bnss": ["bnss", "bharatiya nagarik suraksha sanhita", "nagarik suraksha sanhita"],
+    "bsa": ["bsa", "bharatiya sakshya adhiniyam", "sakshya adhiniyam"],
+    "ipc": ["ipc", "indian penal code", "penal code"],
+    "crpc": ["crpc", "cr.p.c", "code of criminal procedure"],
+    "iea": ["indian evidence act", "evidence act"],
+}
+
+_SECTION_Q_RE = re.compile(
+    r"\b(?:sec(?:tion)?s?\.?|u/s\.?|s\.)\s*(\d{1,4}[A-Za-z]?)\b", re.I
+)
+_YEAR_RE = re.compile(r"\b(1[89]|20)\d{2}\b")
+
+
+def _norm(text: str) -> str:
+    return " ".join(re.sub(r"[^a-z0-9.]+", " ", text.lower()).split())
+
+
+_ALIAS_AC = AhoCorasick()
+for _key, _phrases in ACT_ALIASES.items():
+    for _p in _phrases:
+        _ALIAS_AC.add(_p, _key)
+_ALIAS_AC.build()
+
+
+def act_phrases(act_name: str) -> List[str]:
+    """Phrases that refer to an indexed act: matching alias keys plus its own title."""
+    phrases = list(dict.fromkeys(key for _, _, key in _ALIAS_AC.find_words(_norm(act_name))))
+    # The title itself, minus years and parenthesised abbreviations ("Code on Wages, 2019")
+    title = _norm(_YEAR_RE.sub(" ", re.sub(r"\(.*?\)", " ", act_name)))
+    if len(title.split()) >= 2:
+        phrases.append(title)
+    return phrases
+
+
+def section_of(query: str) -> Optional[str]:
+    m = _SECTION_Q_RE.search(query or "")
+    return m.group(1).upper() if m else None
+
+
+def row_spans(rows: List[int]) -> List[List[int]]:
+    """Sorted rows -> [start, end) runs, e.g. [3, 4, 5, 9] -> [[3, 6], [9, 10]]."""
+    spans: List[List[int]] = []
+    for r in rows:
+        if spans and spans[-1][1] == r:
+            spans[-1][1] = r + 1
+        else:
+            spans.append([r, r + 1])
+    return spans
+
+
+class SectionIndex:
+    """
+    {"sections": {num: [{act_id, section_id, act_name, scope, heading, rows, spans}]},
+     "acts": {act_id: {name, scope, phrases}}}
+
+    rows are the section's chunk rows in document order; spans are the same
+    rows as [start, end) runs so a section can be sliced out of meta directly.
+    """
+
+    def __init__(self, data: Optional[Dict] = None):
+        data = data or {}
+        self.sections: Dict[str, List[Dict]] = data.get("sections", {})
+        self.acts: Dict[str, Dict] = data.get("acts", {})
+        # phrase (alias key or act title) -> act ids
+        self._phrase_acts: Dict[str, List[str]] = {}
+        for act_id, act in self.acts.items():
+            for p in act.get("phrases", ()):
+                self._phrase_acts.setdefault(p, []).append(act_id)
+        # One automaton over alias phrases and act titles for acts_in()
+        self._acts_ac = AhoCorasick()
+        for phrase, key in self.act_patterns():
+            self._acts_ac.add(phrase, key)
+        self._acts_ac.build()
+
+    @classmethod
+    def from_tree(cls, tree: StructureTree) -> "SectionIndex":
+        sections: Dict[str, List[Dict]] = {}
+        acts: Dict[str, Dict] = {}
+        for node_id, node in tree.nodes.items():
+            if node["type"] == "act":
+                acts[node_id] = {
+                    "name": node.get("title"),
+                    "scope": node.get("scope"),
+                    "phrases": act_phrases(node.get("title") or node_id),
+                }
+            elif node["type"] == "section":
+                rows = list(dict.fromkeys(tree.rows_under(node_id)))
+                if not rows:
+                    continue
+                act_id = node_id.split("/", 1)[0]
+                sections.setdefault(str(node.get("num")).upper(), []).append({
+                    "act_id": act_id,
+                    "section_id": node_id,
+                    "heading": node.get("heading"),
+                    "rows": rows,
+                    "spans": row_spans(sorted(rows)),
+                })
+        for entries in sections.values():
+            for e in entries:
+                e["act_name"] = acts.get(e["act_id"], {}).get("name")
+                e["scope"] = acts.get(e["act_id"], {}).get("scope")
+        return cls({"sections": sections, "acts": acts})
+
+    @classmethod
+    def from_meta(cls, meta: List[Dict]) -> "SectionIndex":
+        """
+        Build the index from chunk records that carry section_id / section_number
+        (indexes ingested before section_index.json existed).
+        """
+        sections: Dict[str, Dict[str, Dict]] = {}
+        for row, rec in enumerate(meta):
+            sid, num = rec.get("section_id"), rec.get("section_number")
+            if not sid or not num:
+                continue
+            e = sections.setdefault(str(num).upper(), {}).setdefault(sid, {
+                "act_id": rec.get("act_id") or sid.split("/", 1)[0],
+                "section_id": sid,
+                "act_name": rec.get("act_name"),
+                "scope": rec.get("scope"),
+                "heading": rec.get("section_heading"),
+                "rows": [],
+            })
+            e["rows"].append(row)
+        for by_id in sections.values():
+            for e in by_id.values():
+                e["spans"] = row_spans(e["rows"])
+        return cls({"sections": {num: list(by_id.values()) for num, by_id in sections.items()}})
+
+    def to_json(self) -> Dict:
+        return {"sections": self.sections, "acts": self.acts}
+
+    def act_patterns(self) -> List[Tuple[str, str]]:
+        """(phrase, act key) pairs: every alias of ACT_ALIASES plus indexed act titles."""
+        pairs = [(_norm(p), key) for key, phrases in ACT_ALIASES.items() for p in phrases]
+        pairs += [(p, p) for p in self._phrase_acts if p not in ACT_ALIASES]
+        return pairs
+
+    def pick_act(self, keys: List[str]) -> Tuple[Optional[str], List[str]]:
+        """
+        (act mentioned, indexed act ids it refers to) from matched act keys: an
+        alias key ("bns") wins over a title; an alias such as "IPC" may match none.
+        """
+        if not keys:
+            return None, []
+        aliases = [k for k in keys if k in ACT_ALIASES]
+        key = aliases[0] if aliases else max(keys, key=len)
+        return key, list(self._phrase_acts.get(key, ()))
+
+    def acts_in(self, query: str) -> Tuple[Optional[str], List[str]]:
+        keys = list(dict.fromkeys(key for _, _, key in self._acts_ac.find_words(_norm(query))))
+        return self.pick_act(keys)
+
+    def parse(self, query: str, act_keys: Optional[List[str]] = None) -> Optional[Tuple[str, Optional[str], List[str]]]:
+        """
+        (section number, act mentioned or None, act ids it resolves to) for a
+        citation query; act_keys are QueryMatcher act signals when already scanned.
+        """
+        num = section_of(query)
+        if num is None:
+            return None
+        act, act_ids = self.pick_act(act_keys) if act_keys is not None else self.acts_in(query)
+        return num, act, act_ids
+
+    def lookup(self, num: str, act_ids: Optional[List[str]] = None) -> List[Dict]:
+        entries = self.sections.get(str(num).upper(), [])
+        if act_ids is not None:
+            entries = [e for e in entries if e["act_id"] in act_ids]
+        return entries
@@ -0,0 +1,78 @@
+# app/dedup.py
+"""
+Near-duplicate chunk detection with MinHash + LSH banding.
+
+Each chunk is reduced to a MinHash signature over word shingles; signatures
+are bucketed band by band, and only chunks sharing a bucket are compared.
+Used by scripts/ingest.py to collapse near-identical chunks within one act
+(repeated boilerplate, re-extracted pages) into one canonical chunk; the
+namespace keeps different acts apart.
+"""
+from __future__ import annotations
+import re
+import zlib
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+_PRIME = np.uint64((1 << 31) - 1)
+_WORD_RE = re.compile(r"\w+")
+
+
+class MinHashLSH:
+    def __init__(
+        self,
+        num_perm: int = 64,
+        bands: int = 16,
+        shingle: int = 5,
+        threshold: float = 0.85,
+        seed: int = 1,
+    ):
+        assert num_perm % bands == 0, "num_perm must be divisible by bands"
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle = shingle
+        self.threshold = threshold
+        rng = np.random.RandomState(seed)
+        self._a = rng.randint(1, (1 << 31) - 1, size=num_perm).astype(np.uint64)
+        self._b = rng.randint(0, (1 << 31) - 1, size=num_perm).astype(np.uint64)
+        # (namespace, band, band bytes) -> keys of canonical items in that bucket
+        self._buckets: Dict[Tuple[str, int, bytes], List[str]] = {}
+        self._sigs: Dict[str, np.ndarray] = {}
+
+    def signature(self, text: str) -> np.ndarray:
+        words = _WORD_RE.findall((text or "").lower())
+        k = self.shingle
+        grams = {" ".join(words[i:i + k]) for i in range(max(1, len(words) - k + 1))}
+        hv = np.fromiter((zlib.crc32(g.encode("utf-8")) for g in grams), dtype=np.uint64, count=len(grams))
+        # (a*x + b) mod p for every permutation x shingle, then min over shingles
+        return ((np.outer(self._a, hv) + self._b[:, None]) % _PRIME).min(axis=1).astype(np.uint32)
+
+    def _band_keys(self, sig: np.ndarray, namespace: str):
+        for b in range(self.bands):
+            yield (namespace, b, sig[b * self.rows:(b + 1) * self.rows].tobytes())
+
+    def query_or_add(self, key: str, text: str, namespace: str = "") -> Optional[Tuple[str, float]]:
+        """
+        If text is a near-duplicate of an item already added in the same
+        namespace, return (canonical_key, estimated_jaccard); otherwise add it
+        as a new canonical item and return None.
+        """
+        sig = self.signature(text)
+        best: Optional[Tuple[str, float]] = None
+        checked = set()
+        for bk in self._band_keys(sig, namespace):
+            for cand in self._buckets.get(bk, ()):
+                if cand in checked:
+                    continue
+                checked.add(cand)
+                sim = float(np.mean(self._sigs[cand] == sig))
+                if sim >= self.threshold and (best is None or sim > best[1]):
+                    best = (cand, sim)
+        if best is not None:
+            return best
+        self._sigs[key] = sig
+        for bk in self._band_keys(sig, namespace):
+            self._buckets.setdefault(bk, []).append(key)
+        return None
@@ -0,0 +1,125 @@
+# app/definitions.py
+"""
+Statutory definitions index.
+
+Ingest runs extract_definitions() over every chunk and records each defined
+term -> (act, section, chunk row, character span) in data/index/definitions.json.
+HybridRetriever answers "what is X" / "define X" queries from it with an exact,
+then fuzzy, term lookup instead of the full retrieval + rerank pipeline.
+"""
+from __future__ import annotations
+import difflib
+import re
+from typing import Dict, Iterator, List, Optional, Tuple
+
+# '"X" means ...', '"X" includes ...'
+_MEANS_RE = re.compile(
+    r"[\"“'‘]([A-Za-z][A-Za-z\- ]{1,60}?)[\"”'’]\s*,?\s+(means|includes|shall mean)\b"
+)
+# 'A person is said to commit theft', '... is said to cause hurt'
+_SAID_TO_RE = re.compile(
+    r"\b(?:is|are)\s+said\s+to\s+(?:commit|cause|have committed|do)\s+(?:the\s+offence\s+of\s+)?(?:an?\s+)?"
+    r"([a-z][a-z\- ]{1,40}?)(?=\s*[.,;:]|\s+(?:and|or|if|when|who|which|except|within)\b)"
+)
+# 'Whoever ... commits theft shall be punished ...'
+_WHOEVER_RE = re.compile(
+    r"\b[Ww]hoever\b[^.;]{0,200}?\bcommits\s+(?:the\s+offence\s+of\s+)?(?:an?\s+)?"
+    r"([a-z][a-z\- ]{1,40}?)(?=\s+shall\b|\s*[.,;:])"
+)
+_PATTERNS: List[Tuple[str, re.Pattern]] = [
+    ("means", _MEANS_RE),
+    ("said_to", _SAID_TO_RE),
+    ("whoever", _WHOEVER_RE),
+]
+# Lower is better when one term has several kinds of definition
+KIND_RANK = {"means": 0, "includes": 1, "said_to": 2, "whoever": 3}
+
+_SENT_END_RE = re.compile(r"[.;](?=\s|$)")
+_SENT_START_RE = re.compile(r"(?:^|[.;:]\s+|\(\d{1,3}[A-Z]?\)\s+)(?=\S)")
+MAX_SPAN_CHARS = 600
+MAX_TERM_WORDS = 5
+FUZZY_CUTOFF = 0.85
+
+_QUERY_RE = re.compile(
+    r"^\s*(?:(?:what\s+is\s+)?(?:the\s+)?(?:definition|meaning)\s+of\s+|"
+    r"(?:what|who)\s+(?:is|are)\s+(?:meant\s+by\s+)?|what'?s\s+|define\s+|"
+    r"explain\s+the\s+term\s+|what\s+does\s+)"
+    r"(?:the\s+term\s+|the\s+word\s+|the\s+|an?\s+)?[\"“'‘]?(?P<term>[a-z][a-z\- ]*?)[\"”'’]?"
+    r"(?:\s+mean)?(?:\s+(?:under|in|as\s+per|according\s+to|of\s+the)\b.*)?\s*[?.!]?\s*$",
+    re.I,
+)
+
+
+def normalize_term(term: str) -> str:
+    words = re.sub(r"[^a-z\- ]+", " ", (term or "").lower()).split()
+    while words and words[0] in {"a", "an", "the"}:
+        words = words[1:]
+    if words and len(words[-1]) > 3 and words[-1].endswith("s") and not words[-1].endswith("ss"):
+        words[-1] = words[-1][:-1]
+    return " ".join(words)
+
+
+def extract_definitions(text: str) -> Iterator[Tuple[str, str, int, int]]:
+    """Yield (term, kind, start, end): the span covers the whole defining sentence."""
+    for kind, rx in _PATTERNS:
+        for m in rx.finditer(text or ""):
+            term = m.group(1).strip(" -")
+            if not term or len(term.split()) > MAX_TERM_WORDS:
+                continue
+            kind_here = "includes" if kind == "means" and m.group(2) == "includes" else kind
+            lo = max(0, m.start() - MAX_SPAN_CHARS)
+            starts = [s.end() for s in _SENT_START_RE.finditer(text, lo, m.start() + 1)]
+            start = starts[-1] if starts else m.start()
+            end_m = _SENT_END_RE.search(text, m.end(), start + MAX_SPAN_CHARS)
+            end = end_m.end() if end_m else min(len(text), start + MAX_SPAN_CHARS)
+            yield term, kind_here, start, end
+
+
+def definition_query(query: str) -> Optional[str]:
+    """The term asked about in a 'what is X' / 'define X' / 'meaning of X' query."""
+    m = _QUERY_RE.match(query or "")
+    if not m:
+        return None
+    term = normalize_term(m.group("term"))
+    if not term or len(term.split()) > MAX_TERM_WORDS:
+        return None
+    return term
+
+
+class DefinitionIndex:
+    """{normalized term: [{term, kind, act_id, act_name, section_id, section_number, row, span}]}"""
+
+    def __init__(self, terms: Optional[Dict[str, List[Dict]]] = None):
+        self.terms: Dict[str, List[Dict]] = terms or {}
+
+    def add(self, row: int, r: Dict) -> None:
+        for term, kind, start, end in extract_definitions(r.get("text", "")):
+            key = normalize_term(term)
+            if not key:
+                continue
+            entries = self.terms.setdefault(key, [])
+            if any(e["row"] == row and e["kind"] == kind for e in entries):
+                continue
+            entries.append({
+                "term": term,
+                "kind": kind,
+                "act_id": r.get("act_id"),
+                "act_name": r.get("act_name"),
+                "section_id": r.get("section_id"),
+                "section_number": r.get("section_number"),
+                "row": row,
+                "span": [start, end],
+            })
+
+    def lookup(self, term: str, act_ids: Optional[List[str]] = None) -> Tuple[Optional[str], List[Dict]]:
+        """(matched key, entries best kind first); exact match, else the closest term above FUZZY_CUTOFF."""
+        key = normalize_term(term)
+        if key not in self.terms:
+            close = difflib.get_close_matches(key, self.terms.keys(), n=1, cutoff=FUZZY_CUTOFF)
+            if not close:
+                return None, []
+            key = close[0]
+        entries = self.terms[key]
+        if act_ids:
+            entries = [e for e in entries if e.get("act_id") in act_ids]
+        return key, sorted(entries, key=lambda e: KIND_RANK.get(e["kind"], 9))
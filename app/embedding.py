@@ -0,0 +1,360 @@
+# app/embedding.py
+"""
+Offline batch embedding with the same local model the query path uses
+(settings.EMBED_MODEL via sentence-transformers).
+
+Texts are sorted by length so each batch pads to a similar size, split across
+a process pool, and every worker writes its rows straight into a memory-mapped
+.npy file — the full matrix never has to sit in one process's memory.
+"""
+from __future__ import annotations
+import os
+import threading
+import time
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+from app.settings import settings
+
+EMBED_BATCH = 256
+
+# Per-process model handle (set by _init_worker)
+_model = None
+
+
+def _init_worker(model_name: str, threads: int) -> None:
+    global _model
+    import torch
+    from sentence_transformers import SentenceTransformer
+    torch.set_num_threads(max(1, threads))
+    _model = SentenceTransformer(model_name, device="cpu")
+
+
+def _encode_into(out_path: str, rows: List[int], texts: List[str]) -> int:
+    """Worker: encode one batch and write it into rows of the memmap."""
+    vecs = _encode(texts)
+    out = np.load(out_path, mmap_mode="r+")
+    out[rows] = vecs
+    out.flush()
+    del out
+    return len(rows)
+
+
+def _encode(texts: List[str]) -> np.ndarray:
+    """Worker: encode one batch and return it."""
+    return _model.encode(
+        texts, batch_size=len(texts),
+        normalize_embeddings=True, convert_to_numpy=True, show_progress_bar=False,
+    ).astype("float32")
+
+
+def _model_dim() -> int:
+    return _model.get_sentence_embedding_dimension()
+
+
+class LocalEmbedder:
+    """
+    Long-lived process pool for embedding a stream of batches (used by the
+    streaming ingest). Each embed() call is length-sorted and split across workers.
+    """
+
+    def __init__(self, model_name: Optional[str] = None, workers: Optional[int] = None, batch_size: int = EMBED_BATCH):
+        self.model_name = model_name or settings.EMBED_MODEL
+        cpus = os.cpu_count() or 1
+        self.workers = max(1, min(workers or cpus, cpus))
+        self.batch_size = batch_size
+        self._pool = None
+        if self.workers == 1:
+            _init_worker(self.model_name, cpus)
+        else:
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                initializer=_init_worker,
+                initargs=(self.model_name, cpus // self.workers),
+            )
+        self.dim = self._pool.submit(_model_dim).result() if self._pool else _model_dim()
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        out = np.empty((len(texts), self.dim), dtype="float32")
+        if not texts:
+            return out
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        # Enough sub-batches to keep every worker busy, never above batch_size
+        step = max(1, min(self.batch_size, -(-len(order) // self.workers)))
+        parts = [order[i:i + step] for i in range(0, len(order), step)]
+        if self._pool is None:
+            results = [_encode([texts[i] for i in p]) for p in parts]
+        else:
+            results = list(self._pool.map(_encode, [[texts[i] for i in p] for p in parts]))
+        for p, vecs in zip(parts, results):
+            out[p] = vecs
+        return out
+
+    def close(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class NpyAppender:
+    """
+    Stream float32 rows into a .npy file whose final row count is unknown up
+    front. A fixed-size header is reserved and rewritten with the real shape on close().
+    """
+
+    _HEADER_LEN = 128
+
+    def __init__(self, path: Path, dim: int):
+        self.path = path
+        self.dim = dim
+        self.rows = 0
+        self._f = open(path, "wb")
+        self._f.write(b"\0" * self._HEADER_LEN)
+
+    def append(self, X: np.ndarray) -> None:
+        X = np.ascontiguousarray(X, dtype="<f4")
+        assert X.ndim == 2 and X.shape[1] == self.dim, f"expected (n, {self.dim}), got {X.shape}"
+        self._f.write(X.tobytes())
+        self.rows += X.shape[0]
+
+    def close(self) -> int:
+        header = f"{{'descr': '<f4', 'fortran_order': False, 'shape': ({self.rows}, {self.dim}), }}"
+        prefix = b"\x93NUMPY\x01\x00"
+        pad = self._HEADER_LEN - len(prefix) - 2 - len(header) - 1
+        body = (header + " " * pad + "\n").encode("latin1")
+        self._f.seek(0)
+        self._f.write(prefix + len(body).to_bytes(2, "little") + body)
+        self._f.flush()
+        os.fsync(self._f.fileno())
+        self._f.close()
+        return self.rows
+
+
+def write_faiss_shards(index_dir: Path, X: np.ndarray, shard_rows: Dict[str, List[List[int]]],
+                       block: int = 65536) -> Dict[str, str]:
+    """
+    One IndexFlatIP per scope (faiss.<scope>.index) from the embedding rows in
+    shard_rows ([start, end) ranges of X, usually a memmap of embeddings.npy).
+    Scopes are built one at a time and replaced by rename. Returns scope -> file name.
+    """
+    import faiss  # type: ignore
+    files = {}
+    for scope, ranges in shard_rows.items():
+        index = faiss.IndexFlatIP(X.shape[1])
+        for start, end in ranges:
+            for s in range(start, end, block):
+                index.add(np.ascontiguousarray(X[s:min(end, s + block)], dtype="float32"))
+        name = f"faiss.{scope}.index"
+        tmp = Path(index_dir) / f"faiss.{scope}.tmp"
+        faiss.write_index(index, str(tmp))
+        tmp.replace(Path(index_dir) / name)
+        files[scope] = name
+        del index
+    return files
+
+
+def local_embedding_dim(model_name: Optional[str] = None) -> int:
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer(model_name or settings.EMBED_MODEL, device="cpu").get_sentence_embedding_dimension()
+
+
+def create_embedding_file(path: Path, n: int, dim: int) -> np.memmap:
+    """Create (or overwrite) a float32 .npy of shape (n, dim), returned as a writable memmap."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    return np.lib.format.open_memmap(str(path), mode="w+", dtype="float32", shape=(n, dim))
+
+
+def embed_into_memmap(
+    texts: Sequence[str],
+    rows: Sequence[int],
+    out_path: Path,
+    workers: Optional[int] = None,
+    batch_size: int = EMBED_BATCH,
+    model_name: Optional[str] = None,
+) -> None:
+    """
+    Embed texts[i] into row rows[i] of the .npy at out_path (created beforehand
+    with create_embedding_file). Vectors are L2-normalised, matching the query path.
+    """
+    if not texts:
+        return
+    model_name = model_name or settings.EMBED_MODEL
+    cpus = os.cpu_count() or 1
+    workers = max(1, min(workers or cpus, cpus))
+
+    # Length-sorted batches keep padding (and wasted compute) low
+    order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+    batches = [order[i:i + batch_size] for i in range(0, len(order), batch_size)]
+    total = len(texts)
+    done = 0
+
+    if workers == 1:
+        _init_worker(model_name, cpus)
+        for b in batches:
+            done += _encode_into(str(out_path), [rows[i] for i in b], [texts[i] for i in b])
+            print(f"  • embedded {done}/{total}")
+        return
+
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=_init_worker,
+        initargs=(model_name, cpus // workers),
+    ) as pool:
+        futures = [
+            pool.submit(_encode_into, str(out_path), [rows[i] for i in b], [texts[i] for i in b])
+            for b in batches
+        ]
+        for fut in futures:
+            done += fut.result()
+            print(f"  • embedded {done}/{total}")
+
+
+# ---------------------------------------------------------------------- #
+#  Remote (OpenAI-compatible) embedding with on-disk checkpointing
+# ---------------------------------------------------------------------- #
+VECTOR_STORE_DIR = Path("data/cache/vectors")
+REMOTE_BATCH = 128
+
+
+class VectorStore:
+    """
+    Chunk-hash -> vector store in SQLite, one file per embedding model.
+    Every completed batch is committed, so an interrupted run can resume.
+    """
+
+    def __init__(self, model_name: str, root: Path = VECTOR_STORE_DIR):
+        import sqlite3
+        root.mkdir(parents=True, exist_ok=True)
+        slug = "".join(c if c.isalnum() else "_" for c in model_name)
+        self.path = root / f"{slug}.sqlite"
+        self._db = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS vec (hash TEXT PRIMARY KEY, v BLOB NOT NULL)")
+        self._db.commit()
+        self._lock = threading.Lock()
+
+    def get_many(self, hashes: Sequence[str]) -> dict:
+        out = {}
+        uniq = list(dict.fromkeys(hashes))
+        with self._lock:
+            for i in range(0, len(uniq), 500):
+                part = uniq[i:i + 500]
+                q = f"SELECT hash, v FROM vec WHERE hash IN ({','.join('?' * len(part))})"
+                for h, blob in self._db.execute(q, part):
+                    out[h] = np.frombuffer(blob, dtype="float32")
+        return out
+
+    def put_many(self, hashes: Sequence[str], X: np.ndarray) -> None:
+        rows = [(h, np.asarray(v, dtype="float32").tobytes()) for h, v in zip(hashes, X)]
+        with self._lock:
+            self._db.executemany("INSERT OR REPLACE INTO vec (hash, v) VALUES (?, ?)", rows)
+            self._db.commit()
+
+    def close(self) -> None:
+        self._db.close()
+
+
+class _RateLimiter:
+    """Allow at most `rate` calls per second across threads."""
+
+    def __init__(self, rate: float):
+        self._interval = 1.0 / rate if rate > 0 else 0.0
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self) -> None:
+        if not self._interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next)
+            self._next = slot + self._interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+def _normalize(X: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(X, axis=1, keepdims=True)
+    norms = np.where(norms == 0, 1.0, norms)
+    return X / norms
+
+
+def embed_texts_remote(
+    client,
+    texts: Sequence[str],
+    hashes: Sequence[str],
+    model_name: Optional[str] = None,
+    concurrency: int = 4,
+    rate_per_s: float = 4.0,
+    batch_size: int = REMOTE_BATCH,
+    max_retries: int = 3,
+    extra_headers: Optional[dict] = None,
+) -> np.ndarray:
+    """
+    Embed texts through an OpenAI-compatible client, `concurrency` batches at a
+    time under a request rate limit. Vectors already in the VectorStore (keyed by
+    chunk hash) are reused, and each finished batch is checkpointed there, so a
+    rerun after a failure only sends the batches that did not complete.
+    Returns L2-normalised float32 vectors aligned with `texts`.
+    """
+    from concurrent.futures import ThreadPoolExecutor, as_completed
+
+    model_name = model_name or settings.EMBED_MODEL
+    store = VectorStore(model_name)
+    try:
+        cached = store.get_many(hashes)
+        pending = [i for i, h in enumerate(hashes) if h not in cached]
+        # One request per unique hash
+        first_of: dict = {}
+        for i in pending:
+            first_of.setdefault(hashes[i], i)
+        todo = list(first_of.values())
+        print(f"  • {len(texts) - len(pending)}/{len(texts)} vectors restored from checkpoint {store.path}")
+
+        limiter = _RateLimiter(rate_per_s)
+        batches = [todo[i:i + batch_size] for i in range(0, len(todo), batch_size)]
+
+        def _run(batch: List[int]) -> List[int]:
+            for attempt in range(max_retries + 1):
+                limiter.wait()
+                try:
+                    resp = client.embeddings.create(
+                        model=model_name,
+                        input=[texts[i] for i in batch],
+                        extra_headers=extra_headers or None,
+                    )
+                    break
+                except Exception:
+                    if attempt == max_retries:
+                        raise
+                    time.sleep(2 ** attempt)
+            X = np.array([d.embedding for d in resp.data], dtype="float32")
+            store.put_many([hashes[i] for i in batch], X)
+            return batch
+
+        done = len(texts) - len(pending)
+        with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+            futures = [pool.submit(_run, b) for b in batches]
+            try:
+                for fut in as_completed(futures):
+                    done += len(fut.result())
+                    print(f"  • embedded {min(done, len(texts))}/{len(texts)}")
+            except Exception:
+                for f in futures:
+                    f.cancel()
+                print("  • embedding interrupted; completed batches are checkpointed — rerun to resume.")
+                raise
+
+        vecs = store.get_many(hashes)
+        return _normalize(np.stack([vecs[h] for h in hashes]).astype("float32"))
+    finally:
+        store.close()
@@ -0,0 +1,126 @@
+# app/extractive.py
+"""
+Local extractive answer engine.
+
+Builds an answer directly from the top reranked chunks by picking their
+defining sentences ("X means ...", "Whoever ...", "... shall be punished with ...").
+No network calls — used when Sarvam misses its deadline and as the explicit
+low-latency ("fast") answer mode.
+"""
+from __future__ import annotations
+import re
+from typing import Dict, List, Tuple
+
+# Sentence boundary: end punctuation followed by whitespace and an opener
+_SENT_SPLIT_RE = re.compile(r"(?<=[.;:])\s+(?=[(\"'A-Z0-9])")
+
+# Cue phrases that mark a statutory definition / offence / penalty sentence
+_CUES: List[Tuple[re.Pattern, float]] = [
+    (re.compile(r"\bmeans\b", re.I), 3.0),
+    (re.compile(r"\bis said to\b", re.I), 2.5),
+    (re.compile(r"\bwhoever\b", re.I), 2.5),
+    (re.compile(r"\bshall be punished with\b", re.I), 2.5),
+    (re.compile(r"\bshall be liable\b", re.I), 1.5),
+    (re.compile(r"\bincludes\b", re.I), 1.0),
+    (re.compile(r"\bcommits\b", re.I), 1.0),
+    (re.compile(r"\bshall\b", re.I), 0.5),
+]
+
+_SEC_RE = re.compile(r"\b(?:section|sec\.?)\s+(\d+[A-Za-z]?)", re.I)
+_STOPWORDS = {
+    "what", "is", "the", "a", "an", "of", "under", "in", "for", "to", "and",
+    "or", "does", "do", "define", "definition", "explain", "which", "how",
+    "section", "sec", "act", "law", "me", "tell", "about", "with", "on",
+}
+
+MAX_SENTENCES = 4
+MAX_SENTENCE_CHARS = 400
+
+
+def _split_sentences(text: str) -> List[str]:
+    text = re.sub(r"\s+", " ", text or "").strip()
+    return [s.strip() for s in _SENT_SPLIT_RE.split(text) if len(s.strip()) > 25]
+
+
+def _query_terms(question: str) -> List[str]:
+    words = re.findall(r"[a-z][a-z\-]+", (question or "").lower())
+    return [w for w in words if w not in _STOPWORDS and len(w) > 2]
+
+
+def _score_sentence(sentence: str, terms: List[str]) -> float:
+    score = sum(w for rx, w in _CUES if rx.search(sentence))
+    low = sentence.lower()
+    overlap = sum(1 for t in terms if t in low)
+    # A definitional cue only matters when the sentence is about the query terms
+    if terms and overlap == 0:
+        return score * 0.2
+    return score + 1.5 * overlap
+
+
+def _citation_label(doc: Dict, sentence: str) -> str:
+    act = doc.get("act_name", "") or doc.get("filename", "") or doc.get("title", "")
+    sec = doc.get("section_number")
+    if not sec:
+        m = _SEC_RE.search(sentence) or _SEC_RE.search(doc.get("text", ""))
+        sec = m.group(1) if m else None
+    return f"Section {sec}, {act}" if sec and act else (act or "Source")
+
+
+def extractive_answer(question: str, docs: List[Dict], max_sentences: int = MAX_SENTENCES) -> Dict:
+    """
+    Pick the best defining sentences from the ranked docs and format them with citations.
+    Returns the same shape as rag.answer(): {"answer", "citations"}.
+    """
+    terms = _query_terms(question)
+    scored: List[Tuple[float, int, int, str]] = []
+    for di, d in enumerate(docs):
+        for si, sent in enumerate(_split_sentences(d.get("text", ""))):
+            s = _score_sentence(sent, terms)
+            if s > 0:
+                # Prefer higher-ranked docs on ties
+                scored.append((s - 0.1 * di, di, si, sent))
+
+    scored.sort(key=lambda x: x[0], reverse=True)
+    picked: List[Tuple[int, int, str]] = []
+    seen = set()
+    for _, di, si, sent in scored:
+        key = sent[:80].lower()
+        if key in seen:
+            continue
+        seen.add(key)
+        picked.append((di, si, sent))
+        if len(picked) >= max_sentences:
+            break
+
+    # Fall back to the lead sentence of the top doc if no cue matched
+    if not picked and docs:
+        lead = _split_sentences(docs[0].get("text", ""))
+        if lead:
+            picked = [(0, 0, lead[0])]
+
+    cites: List[Dict] = []
+    ref_of: Dict[int, str] = {}
+    bullets: List[str] = []
+    # Keep document order so related sentences read together
+    for di, _, sent in sorted(picked, key=lambda x: (x[0], x[1])):
+        d = docs[di]
+        if di not in ref_of:
+            ref_of[di] = f"[{len(ref_of) + 1}]"
+            cites.append({
+                "ref": ref_of[di],
+                "title": d.get("title", "Section"),
+                "where": _citation_label(d, sent),
+            })
+        quote = sent if len(sent) <= MAX_SENTENCE_CHARS else sent[:MAX_SENTENCE_CHARS].rsplit(" ", 1)[0] + " …"
+        bullets.append(f"- {ref_of[di]} \"{quote}\" — {_citation_label(d, sent)}")
+
+    if not bullets:
+        return {"answer": "", "citations": []}
+
+    answer_text = (
+        "**Relevant provisions (extracted directly from the legal text)**\n"
+        + "\n".join(bullets)
+        + "\n\n_This is an extractive answer quoted from the indexed documents; "
+        "no AI summary was generated._"
+    )
+    return {"answer": answer_text, "citations": cites}
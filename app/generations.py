@@ -0,0 +1,153 @@
+# app/generations.py
+"""
+Versioned index generations published by scripts/ingest.py.
+
+Ingest builds the index in data/index as before, then publish() snapshots the
+files into data/index/generations/<name>/ (hard links, so no copy) together
+with generation.json: a sha256 and size per file. The CURRENT pointer file is
+rewritten last, durably, so a reader either sees the old generation or the
+complete new one.
+
+The API runs a GenerationWatcher that polls CURRENT; on a change it verifies
+the checksums, loads and warms the new generation in the background and swaps
+it in (see RetrieverHandle.reload in app.hybrid_retriever).
+"""
+from __future__ import annotations
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional
+
+from app.segment_store import durable_write
+
+GENERATIONS = "generations"
+CURRENT = "CURRENT"
+GENERATION_MANIFEST = "generation.json"
+
+
+def _sha256(path: Path) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def active_name(root: Path) -> Optional[str]:
+    """Name of the published generation, None for the legacy flat layout."""
+    pointer = Path(root) / CURRENT
+    if not pointer.exists():
+        return None
+    name = pointer.read_text(encoding="utf-8").strip()
+    return name or None
+
+
+def active_dir(root: Path) -> Path:
+    """Directory the API should load: the published generation, else the flat data/index."""
+    name = active_name(root)
+    if name and (Path(root) / GENERATIONS / name).is_dir():
+        return Path(root) / GENERATIONS / name
+    return Path(root)
+
+
+def read_manifest(gen_dir: Path) -> Dict:
+    path = Path(gen_dir) / GENERATION_MANIFEST
+    if not path.exists():
+        return {}
+    return json.loads(path.read_text(encoding="utf-8"))
+
+
+def verify(gen_dir: Path) -> List[str]:
+    """Files that are missing or whose checksum does not match generation.json."""
+    manifest = read_manifest(gen_dir)
+    if not manifest:
+        return [GENERATION_MANIFEST]
+    bad = []
+    for name, info in manifest["files"].items():
+        path = Path(gen_dir) / name
+        if not path.exists() or path.stat().st_size != info["bytes"] or _sha256(path) != info["sha256"]:
+            bad.append(name)
+    return bad
+
+
+def publish(root: Path, files: Iterable[Path], info: Dict = None, keep: int = 3) -> Path:
+    """Snapshot files into a new generation directory, write its manifest, then flip CURRENT."""
+    root = Path(root)
+    name = time.strftime("g%Y%m%d-%H%M%S")
+    gen_dir = root / GENERATIONS / name
+    n = 1
+    while gen_dir.exists():
+        n += 1
+        gen_dir = root / GENERATIONS / f"{name}-{n}"
+    gen_dir.mkdir(parents=True)
+
+    entries = {}
+    for src in files:
+        src = Path(src)
+        if not src.exists():
+            continue
+        dst = gen_dir / src.name
+        try:
+            os.link(src, dst)  # ingest replaces files by rename, so the linked inode never changes
+        except OSError:
+            shutil.copy2(src, dst)
+        entries[src.name] = {"sha256": _sha256(dst), "bytes": dst.stat().st_size}
+
+    manifest = {"name": gen_dir.name, "created_at": time.time(), "files": entries, **(info or {})}
+    durable_write(gen_dir / GENERATION_MANIFEST, json.dumps(manifest, indent=2).encode("utf-8"))
+    durable_write(root / CURRENT, gen_dir.name.encode("utf-8"))
+    _prune(root, keep)
+    return gen_dir
+
+
+def _prune(root: Path, keep: int) -> None:
+    """Delete all but the newest `keep` generations (never the active one)."""
+    gens = sorted((d for d in (root / GENERATIONS).iterdir() if d.is_dir()), key=lambda d: d.name)
+    current = active_name(root)
+    for d in gens[:-keep] if keep else []:
+        if d.name != current:
+            shutil.rmtree(d, ignore_errors=True)
+
+
+class GenerationWatcher:
+    """Polls CURRENT and calls on_change(gen_dir) once per newly published, verified generation."""
+
+    def __init__(self, root: Path, on_change: Callable[[Path], None], interval: float = 5.0,
+                 loaded: Optional[str] = None):
+        self.root = Path(root)
+        self.on_change = on_change
+        self.interval = interval
+        self._seen = loaded
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="generation-watcher", daemon=True)
+
+    def start(self) -> "GenerationWatcher":
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def check(self) -> bool:
+        name = active_name(self.root)
+        if not name or name == self._seen:
+            return False
+        self._seen = name  # tried once, even if it fails; ingest publishes a new name next time
+        gen_dir = self.root / GENERATIONS / name
+        bad = verify(gen_dir)
+        if bad:
+            print(f"[generation] {name} failed verification ({', '.join(bad)}); keeping the current index.")
+            return False
+        self.on_change(gen_dir)
+        return True
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            try:
+                self.check()
+            except Exception as e:
+                print(f"[generation] reload failed: {e}")
@@ -1,13 +1,25 @@
 import json
 import re
+import time
+import threading
 import datetime
 import numpy as np
 from pathlib import Path
 from typing import List, Dict, Optional
-from rank_bm25 import BM25Okapi
 from sentence_transformers import CrossEncoder
 
 from app.settings import settings
+from app.structure import StructureTree
+from app.citations import SectionIndex
+from app.definitions import DefinitionIndex, definition_query
+from app.matcher import QueryMatcher
+from app.index_state import FaissSegment, IndexGeneration
+from app.segment_store import SegmentStore
+from app.generations import active_dir, read_manifest
+from app.user_index import UserIndex, UserIndexStore
+from app.chunk_store import ChunkStore, blob_key, upload_records
+from app.scatter import ShardCoordinator
+from app.act_router import ActRouter, Route
 
 
 # Keywords that suggest the user is asking about their own uploaded document
@@ -19,56 +31,189 @@ USER_DOC_SIGNALS = [
 
 LAW_SCOPES = ["global_law", "supreme_court", "labour_law", "state_law"]
 
+# Word windows for uploads when no embedding tokenizer is loaded
+UPLOAD_CHUNK_WORDS = 300
+UPLOAD_CHUNK_OVERLAP = 50
+
 
 class HybridRetriever:
-    def __init__(self):
+    def __init__(self, index_dir: Path = None, shared: "HybridRetriever" = None):
+        """
+        index_dir: a published generation (default: the one CURRENT points at, else data/index).
+        shared: a retriever whose models and upload delta store are reused (hot reload).
+        """
         print("[init] Loading Hybrid Retriever components...")
-        self.index_dir = Path("data/index")
+        self.index_root = Path("data/index")
+        self.index_dir = Path(index_dir) if index_dir else active_dir(self.index_root)
+        self.generation_info = {k: v for k, v in read_manifest(self.index_dir).items() if k != "files"}
+        self.loaded_at = time.time()
+        if self.generation_info:
+            print(f"[init] Index generation {self.generation_info.get('name')} ({self.index_dir})")
         self.meta_path = self.index_dir / "meta.jsonl"
         self.faiss_path = self.index_dir / "faiss.index"
+        self.shards_path = self.index_dir / "shards.json"
         self.sec_map_path = self.index_dir / "section_map.json"
+        self.aliases_path = self.index_dir / "aliases.json"
+        self.structure_path = self.index_dir / "structure.json"
+        self.sec_index_path = self.index_dir / "section_index.json"
+        self.definitions_path = self.index_dir / "definitions.json"
+        self.xrefs_path = self.index_dir / "xrefs.json"
+        self.acts_path = self.index_dir / "acts.json"
+        self.centroids_path = self.index_dir / "act_centroids.npy"
 
         # 1. Load Metadata
-        self.meta = []
+        meta = []
         if self.meta_path.exists():
             with open(self.meta_path, "r", encoding="utf-8") as f:
-                self.meta = [json.loads(line) for line in f]
-            print(f"[init] Loaded {len(self.meta)} chunks from metadata.")
+                meta = [json.loads(line) for line in f]
+            print(f"[init] Loaded {len(meta)} chunks from metadata.")
             # Show scope distribution on startup
             from collections import Counter
-            scope_dist = Counter(d.get("scope", "unknown") for d in self.meta)
+            scope_dist = Counter(d.get("scope", "unknown") for d in meta)
             print(f"[init] Scope distribution: {dict(scope_dist)}")
         else:
             print("[warning] No metadata found. Please run ingest.")
 
-        # 2. Build BM25
-        if self.meta:
-            print("[init] Building BM25 index...")
-            tokenized_corpus = [doc["text"].split() for doc in self.meta]
-            self.bm25 = BM25Okapi(tokenized_corpus)
-        else:
-            self.bm25 = None
+        # 2. Per-scope shard layout from ingest (rows + one FAISS index per scope); without
+        # it shards are derived from each row's scope and faiss.index is split
+        shard_rows, shard_files = None, {}
+        if self.shards_path.exists():
+            layout = json.loads(self.shards_path.read_text(encoding="utf-8"))
+            shard_rows = {
+                scope: [r for start, end in info["rows"] for r in range(start, end)]
+                for scope, info in layout.items()
+            }
+            shard_files = {scope: info.get("faiss") for scope, info in layout.items()}
 
-        # 3. Load FAISS Index (only if USE_FAISS=true)
-        self.faiss_index = None
-        if settings.USE_FAISS and self.faiss_path.exists():
+        # 2a. Load FAISS Index (only if USE_FAISS=true)
+        segments = []
+        if settings.USE_FAISS and (self.faiss_path.exists() or any(shard_files.values())):
             try:
                 import faiss
-                print("[init] Loading FAISS index...")
-                self.faiss_index = faiss.read_index(str(self.faiss_path))
+                if shard_files and all(f and (self.index_dir / f).exists() for f in shard_files.values()):
+                    print(f"[init] Loading {len(shard_files)} FAISS shard(s)...")
+                    for scope, f in shard_files.items():
+                        index = faiss.read_index(str(self.index_dir / f))
+                        segments.append(FaissSegment(index, np.asarray(shard_rows[scope][:index.ntotal])))
+                else:
+                    print("[init] Loading FAISS index...")
+                    index = faiss.read_index(str(self.faiss_path))
+                    segments.append(FaissSegment(index, np.arange(index.ntotal)))
             except ImportError:
                 print("[warning] faiss-cpu not installed. Vector search disabled.")
         elif settings.USE_FAISS:
             print("[warning] USE_FAISS=true but no FAISS index found. Run ingest first.")
 
-        # 4. Load Section Map
+        # 2b. Upload delta segments on top of the ingest base, in manifest order; they live
+        # beside the generations so uploads survive a re-ingest
+        self.segments = shared.segments if shared else SegmentStore(self.index_root)
+        n_delta = 0
+        for entry, delta_meta, vectors, rows in self.segments.iter_segments(with_vectors=settings.USE_FAISS):
+            if vectors is not None:
+                try:
+                    import faiss
+                    index = faiss.IndexFlatIP(vectors.shape[1])
+                    index.add(vectors)
+                    segments.append(FaissSegment(index, rows + len(meta)))
+                except ImportError:
+                    pass
+            meta.extend(delta_meta)
+            n_delta += len(delta_meta)
+        if n_delta:
+            print(f"[init] Loaded {n_delta} uploaded chunks from {len(self.segments.deltas)} delta segment(s).")
+
+        # 3. Build per-shard BM25 and publish generation 0 (meta + shards, swapped as a unit)
+        if meta:
+            print("[init] Building BM25 index...")
+        self._gen = IndexGeneration.build(0, meta, segments, shard_rows)
+        print("[init] Shards: " + ", ".join(
+            f"{s.scope}={len(s.rows)}" for s in self._gen.shards.values()
+        ))
+        self._write_lock = threading.Lock()
+        self._successor = None  # set when a hot reload replaces this instance
+
+        # 3b. Parsed uploads by content hash, shared across users
+        self.blobs = shared.blobs if shared else ChunkStore(self.index_root / "blobs")
+        # 3c. Per-user upload sub-indexes (resident on demand); users whose uploads
+        # predate them still have rows in the shared index
+        self.user_indexes = shared.user_indexes if shared else UserIndexStore(
+            self.index_root / "users",
+            ttl_s=settings.USER_INDEX_TTL_S,
+            max_bytes=int(settings.USER_INDEX_MAX_MB * 1e6),
+            compact_min_deltas=settings.COMPACT_MIN_DELTAS,
+            chunks=self.blobs,
+        )
+        self._legacy_upload_users = {
+            rec["user_id"] for rec in meta if rec.get("scope") == "user_upload" and rec.get("user_id")
+        }
+
+        # 3d. Remote shard servers the law corpus is spread over (scatter-gather)
+        self.shard_servers = shared.shard_servers if shared else None
+        if settings.SHARD_SERVERS and not shared:
+            self.shard_servers = ShardCoordinator(
+                settings.SHARD_SERVERS.split(","),
+                timeout=settings.SHARD_TIMEOUT_S,
+                concurrency=settings.SHARD_CONCURRENCY,
+            )
+            print(f"[init] Scatter-gather over {len(self.shard_servers.urls)} shard server(s).")
+
+        # 4. Load Section Map (legacy, first mention only) and the act-aware (act, section) index
         self.section_map = {}
         if self.sec_map_path.exists():
             self.section_map = json.loads(self.sec_map_path.read_text(encoding="utf-8"))
+        self.sec_index = SectionIndex()
+        if self.sec_index_path.exists():
+            self.sec_index = SectionIndex(json.loads(self.sec_index_path.read_text(encoding="utf-8")))
+            print(f"[init] Section index: {len(self.sec_index.sections)} section numbers across {len(self.sec_index.acts)} acts.")
+        self.definitions = DefinitionIndex()
+        if self.definitions_path.exists():
+            self.definitions = DefinitionIndex(json.loads(self.definitions_path.read_text(encoding="utf-8")))
+            print(f"[init] Definitions index: {len(self.definitions.terms)} terms.")
+
+        # 4e. One Aho-Corasick automaton for every query signal (user-doc intent, acts, synonyms, definitions)
+        self.matcher = QueryMatcher(USER_DOC_SIGNALS, self.sec_index.act_patterns())
+        print(f"[init] Query matcher: {self.matcher.size} patterns.")
+
+        # 4b. Attach near-duplicate aliases (copies collapsed at ingest) to their canonical chunk
+        if self.aliases_path.exists() and self.meta:
+            aliases = json.loads(self.aliases_path.read_text(encoding="utf-8"))
+            for rec in self.meta:
+                if rec.get("id") in aliases:
+                    rec["aliases"] = aliases[rec["id"]]
+            print(f"[init] Loaded aliases for {len(aliases)} deduplicated chunks.")
+
+        # 4c. (source, seg) -> (meta idx, section_idx) for context-time window assembly
+        self.seg_pos = {}
+        for idx, rec in enumerate(self.meta):
+            if rec.get("seg") is None:
+                continue
+            self.seg_pos[(rec["source"], rec["seg"])] = (idx, rec.get("section_idx"))
+            for a in rec.get("aliases", ()):
+                if a.get("seg") is not None:
+                    self.seg_pos.setdefault((a["source"], a["seg"]), (idx, a.get("section_idx")))
+
+        # 4d. Act -> chapter -> section -> clause tree for parent-section context
+        self.tree = StructureTree()
+        if self.structure_path.exists():
+            self.tree = StructureTree(json.loads(self.structure_path.read_text(encoding="utf-8")))
+            print(f"[init] Loaded structure tree ({len(self.tree.nodes)} nodes).")
+        self.row_of = {rec["id"]: idx for idx, rec in enumerate(self.meta) if rec.get("id")}
+        # section_id -> [[referenced section_id, kind], ...]
+        self.xrefs = {}
+        if self.xrefs_path.exists():
+            self.xrefs = json.loads(self.xrefs_path.read_text(encoding="utf-8"))
+            print(f"[init] Cross references for {len(self.xrefs)} sections.")
+
+        # 4f. Per-act term profiles and centroids for coarse-to-fine routing
+        self.router = None
+        if self.acts_path.exists():
+            centroids = np.load(self.centroids_path) if settings.USE_FAISS and self.centroids_path.exists() else None
+            self.router = ActRouter(json.loads(self.acts_path.read_text(encoding="utf-8")), centroids)
+            print(f"[init] Act router: {len(self.router)} acts" + (" with centroids." if self.router.centroids is not None else "."))
 
         # 5. Load Sentence-Transformers embedding model (only if USE_EMBEDDINGS=true)
-        self.embed_model = None
-        if settings.USE_EMBEDDINGS:
+        self.embed_model = shared.embed_model if shared else None
+        if settings.USE_EMBEDDINGS and not shared:
             try:
                 from sentence_transformers import SentenceTransformer
                 print(f"[init] Loading embedding model: {settings.EMBED_MODEL} ...")
@@ -78,7 +223,9 @@ class HybridRetriever:
                 print(f"[warning] Failed to load embedding model: {e}")
 
         # 6. Load Cross-Encoder reranker
-        if settings.ENABLE_RERANKING:
+        if shared:
+            self.reranker = shared.reranker
+        elif settings.ENABLE_RERANKING:
             print("[init] Loading Cross-Encoder model...")
             self.reranker = CrossEncoder("cross-encoder/ms-marco-TinyBERT-L-2-v2")
         else:
@@ -87,13 +234,45 @@ class HybridRetriever:
 
         print("[init] Hybrid Retriever ready.")
 
+    # ------------------------------------------------------------------ #
+    #  Index generations
+    # ------------------------------------------------------------------ #
+    @property
+    def generation(self) -> IndexGeneration:
+        """The current generation; pin it once per request and read only from it."""
+        return self._gen
+
+    @property
+    def meta(self) -> List[Dict]:
+        # Ingested rows never move, so row lookups from the ingest-time indexes are
+        # safe on whichever generation is current
+        return self._gen.meta
+
+    @property
+    def bm25(self):
+        """Corpus-wide BM25 statistics (idf, avgdl, k1, b) across every shard."""
+        return self._gen.stats
+
     # ------------------------------------------------------------------ #
     #  Intent Detection
     # ------------------------------------------------------------------ #
-    def _query_is_about_user_doc(self, query: str) -> bool:
+    def _query_is_about_user_doc(self, query: str, signals: Dict = None) -> bool:
         """Return True if the query seems to be about the user's uploaded document."""
-        q = query.lower()
-        return any(sig in q for sig in USER_DOC_SIGNALS)
+        signals = signals or self.matcher.scan(query)
+        return bool(signals["user_doc"])
+
+    def query_variants(self, query: str, signals: Dict) -> List[str]:
+        """
+        The query plus its expansions: "X means" / "definition of X" for
+        definitional queries, and the query with statutory synonyms added.
+        """
+        variants = [query]
+        term = definition_query(query) if signals["definition"] else None
+        if term:
+            variants += [f"{term} means", f"definition of {term}"]
+        if signals["synonyms"]:
+            variants.append(f"{query} {' '.join(signals['synonyms'])}")
+        return variants[:max(1, settings.MAX_QUERY_VARIANTS)]
 
     # ------------------------------------------------------------------ #
     #  Retrieval Logging
@@ -116,15 +295,31 @@ class HybridRetriever:
     # ------------------------------------------------------------------ #
     def _get_query_embedding(self, text: str) -> Optional[np.ndarray]:
         """Embed query using local sentence-transformers model."""
+        return self._get_query_embeddings([text])
+
+    def _get_query_embeddings(self, texts: List[str]) -> Optional[np.ndarray]:
+        """Embed several queries in one batch: (len(texts), dim)."""
         if self.embed_model is None:
             return None
         try:
-            vec = self.embed_model.encode([text], normalize_embeddings=True)
+            vec = self.embed_model.encode(texts, normalize_embeddings=True)
             return vec.astype("float32")
         except Exception as e:
             print(f"[error] Embedding failed: {e}")
             return None
 
+    def _passes_filters(self, rec: Dict, filename: str, scope_filter: List[str], user_id: str) -> bool:
+        # Filename filter (legacy support)
+        if filename and rec.get("filename") != filename:
+            return False
+        # Scope filter
+        if scope_filter and rec.get("scope") not in scope_filter:
+            return False
+        # User isolation for user_upload scope
+        if rec.get("scope") == "user_upload" and user_id and rec.get("user_id") != user_id:
+            return False
+        return True
+
     # ------------------------------------------------------------------ #
     #  FAISS Retrieval (with scope filter)
     # ------------------------------------------------------------------ #
@@ -135,32 +330,41 @@ class HybridRetriever:
         user_id: str = None
     ) -> List[Dict]:
         """Fetch vectors, then filter by scope/filename/user_id."""
-        if not self.faiss_index or query_vec is None:
-            return []
+        return self._retrieve_faiss_batch(query_vec, k, filename, scope_filter, user_id)[0]
 
-        search_k = k * 4 if (filename or scope_filter) else k
-        if search_k > len(self.meta):
-            search_k = len(self.meta)
+    def _retrieve_faiss_batch(
+        self, query_vecs, k=30,
+        filename: str = None,
+        scope_filter: List[str] = None,
+        user_id: str = None,
+        gen: IndexGeneration = None,
+        rows: np.ndarray = None,
+    ) -> List[List[Dict]]:
+        """One FAISS search for a (n_queries, dim) matrix; a filtered hit list per query (only `rows` when routed)."""
+        gen = gen or self._gen
+        if not gen.has_vectors or query_vecs is None:
+            return [[]]
 
-        scores, indices = self.faiss_index.search(query_vec, search_k)
-        results = []
-        for score, idx in zip(scores[0], indices[0]):
-            if idx == -1 or idx >= len(self.meta):
-                continue
-            rec = self.meta[idx]
-            # Filename filter (legacy support)
-            if filename and rec.get("filename") != filename:
-                continue
-            # Scope filter
-            if scope_filter and rec.get("scope") not in scope_filter:
-                continue
-            # User isolation for user_upload scope
-            if rec.get("scope") == "user_upload" and user_id and rec.get("user_id") != user_id:
-                continue
-            results.append({**rec, "score": float(score), "retrieval_type": "faiss"})
-            if len(results) >= k:
-                break
-        return results
+        # Scope is handled by shard selection; only filename/user_id still over-fetch
+        search_k = k * 4 if (filename or user_id) else k
+        if search_k > len(gen.meta):
+            search_k = len(gen.meta)
+
+        scores, indices = gen.faiss_search(query_vecs, search_k, scopes=scope_filter, rows=rows)
+        out = []
+        for row_scores, row_idx in zip(scores, indices):
+            results = []
+            for score, idx in zip(row_scores, row_idx):
+                if idx == -1 or idx >= len(gen.meta):
+                    continue
+                rec = gen.meta[idx]
+                if not self._passes_filters(rec, filename, scope_filter, user_id):
+                    continue
+                results.append({**rec, "score": float(score), "retrieval_type": "faiss"})
+                if len(results) >= k:
+                    break
+            out.append(results)
+        return out
 
     # ------------------------------------------------------------------ #
     #  BM25 Retrieval (with scope filter)
@@ -172,31 +376,46 @@ class HybridRetriever:
         user_id: str = None
     ) -> List[Dict]:
         """Fetch keyword matches, then filter by scope/user_id."""
-        if not self.bm25:
-            return []
+        return self._retrieve_bm25_batch([query], k, filename, scope_filter, user_id)[0]
 
-        scores = self.bm25.get_scores(query.split())
-        top_n = np.argsort(scores)[::-1]
-
-        results = []
-        for idx in top_n:
-            if len(results) >= k:
-                break
-            rec = self.meta[idx]
-            if filename and rec.get("filename") != filename:
-                continue
-            if scope_filter and rec.get("scope") not in scope_filter:
-                continue
-            if rec.get("scope") == "user_upload" and user_id and rec.get("user_id") != user_id:
-                continue
-            results.append({**rec, "score": float(scores[idx]), "retrieval_type": "bm25"})
-        return results
+    def _retrieve_bm25_batch(
+        self, queries: List[str], k=30,
+        filename: str = None,
+        scope_filter: List[str] = None,
+        user_id: str = None,
+        gen: IndexGeneration = None,
+        rows: np.ndarray = None,
+    ) -> List[List[Dict]]:
+        """
+        BM25 for every query, one sparse matrix product per shard, only on the
+        shards of scope_filter (in parallel); a filtered hit list per query.
+        rows: the routed acts' meta rows; other rows are never ranked.
+        """
+        gen = gen or self._gen
+        accept = lambda idx: self._passes_filters(gen.meta[idx], filename, scope_filter, user_id)  # noqa: E731
+        return [
+            [{**gen.meta[idx], "score": score, "retrieval_type": "bm25"} for idx, score in hits]
+            for hits in gen.bm25_search(queries, k, scopes=scope_filter, accept=accept, rows=rows)
+        ]
 
     # ------------------------------------------------------------------ #
     #  Section-map Retrieval
     # ------------------------------------------------------------------ #
-    def _retrieve_section(self, query, scope_filter: List[str] = None) -> List[Dict]:
-        """Deterministic regex lookup for Section numbers."""
+    def _retrieve_section(self, query, scope_filter: List[str] = None, signals: Dict = None) -> List[Dict]:
+        """Deterministic lookup for Section numbers: the head chunk of the section in every matching act."""
+        if self.sec_index.sections:
+            parsed = self.sec_index.parse(query, signals["acts"] if signals else None)
+            if parsed is None:
+                return []
+            num, act, act_ids = parsed
+            results = []
+            for e in self.sec_index.lookup(num, act_ids if act else None):
+                if scope_filter and e.get("scope") not in scope_filter:
+                    continue
+                rec = self.meta[e["rows"][0]]
+                results.append({**rec, "score": 999.0, "retrieval_type": "section_map"})
+            return results
+
         match = re.search(r"sec(?:tion)?\.?\s+(\d+[A-Za-z]?)", query, re.I)
         if match:
             sec_num = match.group(1)
@@ -211,6 +430,193 @@ class HybridRetriever:
                     return [{**rec, "score": 999.0, "retrieval_type": "section_map"}]
         return []
 
+    def _citation_fast_path(self, query: str, top_k: int, signals: Dict,
+                            scopes: List[str] = LAW_SCOPES) -> Optional[List[Dict]]:
+        """
+        Answer an explicit "Section N of <Act>" straight from the section index,
+        skipping BM25/FAISS, fusion and reranking. A bare "Section N" qualifies
+        only when exactly one indexed act has that section.
+        """
+        t0 = time.perf_counter()
+        parsed = self.sec_index.parse(query, signals["acts"])
+        if parsed is None:
+            return None
+        num, act, act_ids = parsed
+        entries = self.sec_index.lookup(num, act_ids if act else None)
+        if act is None and len({e["act_id"] for e in entries}) != 1:
+            return None
+        entries = [e for e in entries if e.get("scope") in scopes]
+        if not entries:
+            return None
+        results, seen = [], set()
+        for e in entries:
+            for row in e["rows"]:
+                if row in seen or row >= len(self.meta):
+                    continue
+                seen.add(row)
+                results.append({**self.meta[row], "score": 999.0, "retrieval_type": "citation"})
+        ms = (time.perf_counter() - t0) * 1000
+        print(f"[citation] section {num} of {act or entries[0]['act_id']} -> {len(results)} chunk(s) in {ms:.3f} ms")
+        return results[:top_k]
+
+    def _definition_fast_path(self, query: str, top_k: int, signals: Dict,
+                              scopes: List[str] = LAW_SCOPES) -> Optional[List[Dict]]:
+        """
+        Answer "what is X" / "define X" from the definitions index (exact, then
+        fuzzy term match), optionally narrowed to an act named in the query.
+        """
+        t0 = time.perf_counter()
+        term = definition_query(query) if signals["definition"] else None
+        if term is None:
+            return None
+        act, act_ids = self.sec_index.pick_act(signals["acts"])
+        if act and not act_ids:
+            return None  # asked about an act we have not indexed
+        key, entries = self.definitions.lookup(term, act_ids or None)
+        results, seen = [], set()
+        for e in entries:
+            if e["row"] in seen or e["row"] >= len(self.meta):
+                continue
+            seen.add(e["row"])
+            rec = self.meta[e["row"]]
+            if rec.get("scope") not in scopes:
+                continue
+            results.append({
+                **rec, "score": 999.0, "retrieval_type": "definition",
+                "definition": {"term": e["term"], "kind": e["kind"],
+                               "text": rec["text"][e["span"][0]:e["span"][1]]},
+            })
+        if not results:
+            return None
+        ms = (time.perf_counter() - t0) * 1000
+        print(f"[definition] '{term}' -> '{key}': {len(results)} chunk(s) in {ms:.3f} ms")
+        return results[:top_k]
+
+    # ------------------------------------------------------------------ #
+    #  Context assembly from non-overlapping base segments
+    # ------------------------------------------------------------------ #
+    def _neighbor(self, source: str, seg: int, section_idx) -> Optional[Dict]:
+        hit = self.seg_pos.get((source, seg))
+        if hit is None or hit[1] != section_idx:
+            return None
+        return self.meta[hit[0]]
+
+    def _parent_section(self, d: Dict) -> Optional[str]:
+        """The clause's whole section from the structure tree, centred on the clause, capped at CONTEXT_MAX_CHARS."""
+        row = self.row_of.get(d.get("id"))
+        rows = list(dict.fromkeys(self.tree.rows_under(d.get("section_id"))))
+        if row is None or row not in rows:
+            return None
+        pos = rows.index(row)
+        lo, hi = pos, pos + 1
+        chars = len(self.meta[row]["text"])
+        while (lo > 0 or hi < len(rows)) and chars < settings.CONTEXT_MAX_CHARS:
+            if lo > 0:
+                lo -= 1
+                chars += len(self.meta[rows[lo]]["text"])
+            if hi < len(rows) and chars < settings.CONTEXT_MAX_CHARS:
+                chars += len(self.meta[rows[hi]]["text"])
+                hi += 1
+        return " ".join(self.meta[r]["text"] for r in rows[lo:hi])
+
+    def expand_context(self, docs: List[Dict], mode: str = None) -> List[Dict]:
+        """
+        Rebuild the text the LLM sees around each retrieved base segment.
+        parent:  the clause's parent section from the structure tree, capped at
+                 CONTEXT_MAX_CHARS; later hits in an already-returned section are
+                 dropped (falls back to window for chunks outside the tree)
+        window:  segment + the first WINDOW_OVERLAP_WORDS of the next segment
+                 (identical to the old overlapping 520/96 chunk)
+        section: every segment of the same section, capped at CONTEXT_MAX_CHARS
+        segment: the segment as indexed
+        """
+        from app.chunking import WINDOW_OVERLAP_WORDS
+
+        mode = mode or settings.CONTEXT_MODE
+        if mode == "segment":
+            return docs
+        out = []
+        seen_sections = set()
+        for d in docs:
+            seg, src, sec = d.get("seg"), d.get("source"), d.get("section_idx")
+            if mode == "parent" and d.get("section_id"):
+                if d["section_id"] in seen_sections:
+                    continue
+                text = self._parent_section(d)
+                if text is not None:
+                    seen_sections.add(d["section_id"])
+                    out.append({**d, "text": text, "segment_text": d["text"]})
+                    continue
+            if seg is None:
+                out.append(d)
+                continue
+            if mode == "section":
+                parts = [d["text"]]
+                chars = len(d["text"])
+                lo, hi = seg - 1, seg + 1
+                while chars < settings.CONTEXT_MAX_CHARS:
+                    prev = self._neighbor(src, lo, sec)
+                    nxt = self._neighbor(src, hi, sec)
+                    if prev is None and nxt is None:
+                        break
+                    if nxt is not None:
+                        parts.append(nxt["text"])
+                        chars += len(nxt["text"])
+                        hi += 1
+                    if prev is not None and chars < settings.CONTEXT_MAX_CHARS:
+                        parts.insert(0, prev["text"])
+                        chars += len(prev["text"])
+                        lo -= 1
+                text = " ".join(parts)
+            else:
+                nxt = self._neighbor(src, seg + 1, sec)
+                tail = " ".join(nxt["text"].split()[:WINDOW_OVERLAP_WORDS]) if nxt else ""
+                text = f"{d['text']} {tail}" if tail else d["text"]
+            out.append({**d, "text": text, "segment_text": d["text"]})
+        return out
+
+    def section_text(self, section_id: str, max_chars: int = None) -> Optional[Dict]:
+        """A whole section from the structure tree as one doc (its first chunk's metadata)."""
+        max_chars = max_chars or settings.CONTEXT_MAX_CHARS
+        rows = [r for r in dict.fromkeys(self.tree.rows_under(section_id)) if r < len(self.meta)]
+        if not rows:
+            return None
+        parts, chars = [], 0
+        for r in rows:
+            if chars >= max_chars:
+                break
+            parts.append(self.meta[r]["text"])
+            chars += len(parts[-1])
+        return {**self.meta[rows[0]], "section_id": section_id, "text": " ".join(parts)}
+
+    def referenced_sections(self, docs: List[Dict], limit: int = None) -> List[Dict]:
+        """
+        One-hop prefetch: sections the retrieved ones refer to ("punishable under
+        section N", "read with section N"), best-ranked doc first, skipping
+        sections already in docs.
+        """
+        limit = settings.XREF_PREFETCH if limit is None else limit
+        if not limit or not self.xrefs:
+            return []
+        have = {d.get("section_id") for d in docs if d.get("section_id")}
+        out = []
+        for d in docs:
+            for target, kind in self.xrefs.get(d.get("section_id"), ()):
+                if len(out) >= limit:
+                    return out
+                if target in have:
+                    continue
+                doc = self.section_text(target)
+                if doc is None:
+                    continue
+                have.add(target)
+                out.append({
+                    **doc,
+                    "retrieval_type": "xref",
+                    "referenced_by": {"section_number": d.get("section_number"), "act_name": d.get("act_name"), "kind": kind},
+                })
+        return out
+
     # ------------------------------------------------------------------ #
     #  Reciprocal Rank Fusion
     # ------------------------------------------------------------------ #
@@ -227,6 +633,25 @@ class HybridRetriever:
         sorted_ids = sorted(fused_scores.keys(), key=lambda x: fused_scores[x], reverse=True)
         return [doc_map[doc_id] for doc_id in sorted_ids]
 
+    # ------------------------------------------------------------------ #
+    #  Act Routing (coarse stage)
+    # ------------------------------------------------------------------ #
+    def _route(self, queries: List[str], q_vecs, scope_filter: List[str], signals: Dict) -> Optional[Route]:
+        """
+        The top acts for a law-corpus query, or None to search everything
+        (no router, routing off, uploads in scope, or a low-confidence route).
+        """
+        if self.router is None or settings.ROUTER_TOP_ACTS <= 0:
+            return None
+        if not scope_filter or "user_upload" in scope_filter:
+            return None
+        named = self.sec_index.pick_act(signals["acts"])[1] if signals["acts"] else []
+        return self.router.route(
+            " ".join(queries), q_vecs[0] if q_vecs is not None else None,
+            top_acts=settings.ROUTER_TOP_ACTS, min_confidence=settings.ROUTER_MIN_CONFIDENCE,
+            scopes=scope_filter, named=named,
+        )
+
     # ------------------------------------------------------------------ #
     #  Core Search (scoped)
     # ------------------------------------------------------------------ #
@@ -235,27 +660,115 @@ class HybridRetriever:
         filename: str = None,
         scope_filter: List[str] = None,
         user_id: str = None,
-        top_k: int = 5
+        top_k: int = 5,
+        signals: Dict = None,
+        user_index: UserIndex = None,
     ) -> List[Dict]:
         """
-        Core search with optional scope filtering and user isolation.
+        Core search with optional scope filtering and user isolation. Law-scope
+        citation and definition queries take their fast paths (see search_multi).
         scope_filter: list of allowed scopes e.g. ["global_law", "supreme_court"]
         user_id: isolates user_upload scope per user
+        signals: QueryMatcher.scan(query), when the caller already has it
+        user_index: search this user's upload sub-index instead of the shared index
+        The query is expanded into variants (see query_variants) and searched together.
         """
-        q_vec = None
-        if settings.USE_FAISS and settings.USE_EMBEDDINGS:
-            q_vec = self._get_query_embedding(query)
+        signals = signals or self.matcher.scan(query)
+        return self.search_multi(
+            self.query_variants(query, signals),
+            filename=filename, scope_filter=scope_filter, user_id=user_id,
+            top_k=top_k, signals=signals, user_index=user_index,
+        )
 
-        faiss_hits = self._retrieve_faiss(q_vec, k=30, filename=filename, scope_filter=scope_filter, user_id=user_id)
-        bm25_hits = self._retrieve_bm25(query, k=30, filename=filename, scope_filter=scope_filter, user_id=user_id)
-        sec_hits = self._retrieve_section(query, scope_filter=scope_filter)
+    def candidate_lists(
+        self, queries: List[str],
+        filename: str = None,
+        scope_filter: List[str] = None,
+        user_id: str = None,
+        signals: Dict = None,
+        user_index: UserIndex = None,
+        q_vecs: Optional[np.ndarray] = None,
+        k: int = 30,
+        rows: Optional[np.ndarray] = None,
+    ) -> Dict[str, List[Dict]]:
+        """
+        The ranked lists search_multi fuses, before RRF and reranking: section
+        hits plus one FAISS and one BM25 list per query variant. Also what a
+        shard server returns to the coordinator. rows: restrict FAISS and BM25
+        to these meta rows (a Route's).
+        """
+        gen = self._gen  # pinned: every list below comes from the same snapshot
+        if user_index is not None:
+            faiss_lists = user_index.search_vectors(q_vecs, k=k, filename=filename)
+            bm25_lists = user_index.search_bm25(queries, k=k, corpus=gen.stats, filename=filename)
+            sec_hits = []
+        else:
+            faiss_lists = self._retrieve_faiss_batch(q_vecs, k=k, filename=filename, scope_filter=scope_filter, user_id=user_id, gen=gen, rows=rows)
+            bm25_lists = self._retrieve_bm25_batch(queries, k=k, filename=filename, scope_filter=scope_filter, user_id=user_id, gen=gen, rows=rows)
+            sec_hits = self._retrieve_section(queries[0], scope_filter=scope_filter, signals=signals)
 
-        candidates = self.reciprocal_rank_fusion(
-            {"faiss": faiss_hits, "bm25": bm25_hits, "section": sec_hits},
-            k=settings.RRF_K,
-        )
+        ranked_lists = {"section": sec_hits}
+        for i, hits in enumerate(faiss_lists):
+            ranked_lists[f"faiss{i}"] = hits
+        for i, hits in enumerate(bm25_lists):
+            ranked_lists[f"bm25{i}"] = hits
+        return ranked_lists
+
+    def search_multi(
+        self, queries: List[str],
+        filename: str = None,
+        scope_filter: List[str] = None,
+        user_id: str = None,
+        top_k: int = 5,
+        signals: Dict = None,
+        user_index: UserIndex = None,
+    ) -> List[Dict]:
+        """
+        Search several variants of one question at roughly the cost of one:
+        all variants are embedded in one batch and searched in one FAISS call,
+        BM25-scored in one sparse matrix product, fused with RRF, and the
+        deduplicated union is reranked once against queries[0].
+        With SHARD_SERVERS, law-corpus searches (no user index, filename or
+        user_id) gather the lists from the shard servers instead; locally they
+        are first routed to their top acts (see _route).
+        """
+        query = queries[0]
+        signals = signals or self.matcher.scan(query)
+        law_search = user_index is None and not (filename or user_id)
+
+        # Explicit "Section N of <Act>" and "what is X" are answered from the section and
+        # definitions indexes, before any embedding
+        if law_search and scope_filter and set(scope_filter) <= set(LAW_SCOPES):
+            cited = (
+                self._citation_fast_path(query, top_k, signals, scope_filter)
+                or self._definition_fast_path(query, top_k, signals, scope_filter)
+            )
+            if cited:
+                return cited
+
+        q_vecs = None
+        if settings.USE_FAISS and settings.USE_EMBEDDINGS:
+            q_vecs = self._get_query_embeddings(queries)
+
+        route = None
+        if self.shard_servers is not None and law_search:
+            ranked_lists = self.shard_servers.gather(queries, q_vecs, k=30, scope_filter=scope_filter)
+        else:
+            if law_search:
+                route = self._route(queries, q_vecs, scope_filter, signals)
+            ranked_lists = self.candidate_lists(
+                queries, filename=filename, scope_filter=scope_filter, user_id=user_id,
+                signals=signals, user_index=user_index, q_vecs=q_vecs,
+                rows=route.rows if route else None,
+            )
+        candidates = self.reciprocal_rank_fusion(ranked_lists, k=settings.RRF_K)
 
         top_candidates = candidates[:settings.RERANK_CANDIDATES]
+        if route is not None and self.router.should_audit(settings.ROUTER_AUDIT_RATE):
+            full = self.reciprocal_rank_fusion(self.candidate_lists(
+                queries, scope_filter=scope_filter, signals=signals, q_vecs=q_vecs,
+            ), k=settings.RRF_K)
+            self.router.record_recall(top_candidates, full[:settings.RERANK_CANDIDATES])
 
         if not top_candidates:
             return []
@@ -284,16 +797,31 @@ class HybridRetriever:
         6. Log retrieval for debugging
         """
         # Detect intent
-        user_intent = self._query_is_about_user_doc(query) if user_id else False
+        signals = self.matcher.scan(query)
+        user_intent = self._query_is_about_user_doc(query, signals) if user_id else False
 
-        # Retrieve from both pools
+        # Explicit statute citations and definitional queries are answered from their indexes directly
+        if not user_intent:
+            cited = (
+                self._citation_fast_path(query, top_k, signals)
+                or self._definition_fast_path(query, top_k, signals)
+            )
+            if cited:
+                self._log_retrieval(query, cited)
+                return cited
+
+        # Retrieve from both pools: the caller's own sub-index and the law corpus
         user_docs = []
         if user_id:
-            user_docs = self.search(
-                query, scope_filter=["user_upload"], user_id=user_id, top_k=10
-            )
+            user_index = self.user_indexes.get(user_id, with_vectors=settings.USE_FAISS)
+            if user_index is not None:
+                user_docs = self.search(query, top_k=10, signals=signals, user_index=user_index)
+            if user_id in self._legacy_upload_users:
+                user_docs += self.search(
+                    query, scope_filter=["user_upload"], user_id=user_id, top_k=10, signals=signals
+                )
         law_docs = self.search(
-            query, scope_filter=LAW_SCOPES, top_k=10
+            query, scope_filter=LAW_SCOPES, top_k=10, signals=signals
         )
 
         # Boost user doc scores if intent suggests user is asking about their document
@@ -336,15 +864,27 @@ class HybridRetriever:
     def add_document(
         self, text: str, filename: str,
         scope: str = "user_upload",
-        user_id: str = None
+        user_id: str = None,
+        content_hash: str = None,
     ) -> int:
+        """
+        Chunk, embed and index an uploaded document. With content_hash (sha256
+        of the uploaded file) the parsed chunks and vectors are also stored in
+        the shared ChunkStore, so the next upload of the same file is a reference.
+        """
         print(f"[index] Adding document: {filename}  scope={scope}  user_id={user_id}")
 
         words = text.split()
         chunks = []
-        chunk_size = 300
-        overlap = 50
-        if len(words) <= chunk_size:
+        chunk_size = UPLOAD_CHUNK_WORDS
+        overlap = UPLOAD_CHUNK_OVERLAP
+        if self.embed_model is not None:
+            # Cut on clause boundaries within what the embedding model actually reads
+            from app.chunking import chunk_by_tokens, _clean
+            chunks = chunk_by_tokens(
+                _clean(text), self.embed_model.tokenizer, self.embed_model.max_seq_length - 2
+            )
+        elif len(words) <= chunk_size:
             chunks.append(text)
         else:
             for i in range(0, len(words), chunk_size - overlap):
@@ -353,72 +893,155 @@ class HybridRetriever:
         if not chunks:
             return 0
 
-        new_meta = []
-        new_embeddings = []
+        new_meta = upload_records(chunks, filename, scope, user_id, content_hash)
+        vectors = vector_rows = None
 
         print(f"[index] Processing {len(chunks)} chunks...")
-        for i, chunk in enumerate(chunks):
-            rec = {
-                "text": chunk,
-                "filename": filename,
-                "source": filename,
-                "title": filename,
-                "chunk_id": i,
-                # --- Scope & jurisdiction metadata ---
-                "scope": scope,
-                "act_name": filename,
-                "jurisdiction": "india",
-                "user_id": user_id,
-            }
-            new_meta.append(rec)
+        if settings.USE_FAISS and settings.USE_EMBEDDINGS:
+            # One batched encode for the whole document
+            vectors = self._get_query_embeddings(chunks)
+            if vectors is None:
+                print("[warning] Embedding failed; indexing this document for BM25 only.")
+            else:
+                vector_rows = list(range(len(chunks)))
+        key = blob_key(content_hash, self._upload_chunker()) if content_hash else None
+        if key:
+            try:
+                self.blobs.put(key, chunks, vectors, vector_rows, info={
+                    "filename": filename,
+                    "chunker": self._upload_chunker(),
+                    "embed_model": settings.EMBED_MODEL if vectors is not None else None,
+                })
+            except Exception as e:
+                print(f"[warning] Failed to store chunks for {content_hash[:12]}: {e}")
+        return self._index_upload(new_meta, vectors, vector_rows, filename, scope, user_id, content_hash, key)
 
-            if settings.USE_FAISS and settings.USE_EMBEDDINGS:
-                emb = self._get_query_embedding(chunk)
-                if emb is not None:
-                    new_embeddings.append(emb)
-                else:
-                    print(f"[warning] Embedding failed for chunk {i}, skipping vector index.")
+    def _upload_chunker(self) -> str:
+        """How add_document cuts uploads right now; part of the blob key, so a change re-parses."""
+        if self.embed_model is not None:
+            return f"tok{self.embed_model.max_seq_length - 2}:{settings.EMBED_MODEL}"
+        return f"w{UPLOAD_CHUNK_WORDS}o{UPLOAD_CHUNK_OVERLAP}"
+
+    def add_cached_upload(
+        self, content_hash: str, filename: str,
+        scope: str = "user_upload",
+        user_id: str = None,
+    ) -> Optional[int]:
+        """
+        Index a file whose exact content was uploaded before (by anyone) from the
+        shared ChunkStore: no parsing, chunking or embedding. None if the content is
+        new or was only stored as cut by a different chunker.
+        """
+        key = blob_key(content_hash, self._upload_chunker())
+        blob = self.blobs.get(key, with_vectors=settings.USE_FAISS)
+        if blob is None:
+            return None
+        chunks, vectors, vector_rows, info = blob
+        if vectors is not None and info.get("embed_model") != settings.EMBED_MODEL:
+            print(f"[warning] Stored vectors for {content_hash[:12]} come from {info.get('embed_model')}; indexing BM25 only.")
+            vectors = vector_rows = None
+        print(f"[index] {filename}: content already stored ({len(chunks)} chunks), adding a reference for user_id={user_id}")
+        new_meta = upload_records(chunks, filename, scope, user_id, content_hash)
+        return self._index_upload(new_meta, vectors, vector_rows, filename, scope, user_id, content_hash, key)
 
-        if not new_meta:
-            print("[error] No chunks processed")
+    def _index_upload(self, new_meta, vectors, vector_rows, filename, scope, user_id, content_hash, key=None) -> int:
+        if scope == "user_upload" and user_id:
+            ref = None
+            if key and self.blobs.has(key):
+                ref = {"ref": key, "content_hash": content_hash, "filename": filename, "scope": scope, "user_id": user_id}
+            try:
+                ix = self.user_indexes.add(
+                    user_id, new_meta, vectors, vector_rows,
+                    with_vectors=settings.USE_FAISS, ref=ref,
+                )
+            except Exception as e:
+                print(f"[error] Failed to update sub-index for {user_id}: {e}")
+                return 0
+            print(f"[index] Added {len(new_meta)} chunks from {filename} to {user_id}'s sub-index ({len(ix.meta)} chunks)")
+            return len(new_meta)
+
+        # Anything else joins the shared index
+        if not self._add_shared(new_meta, vectors, vector_rows):
             return 0
+        print(f"[index] Successfully added {len(new_meta)} chunks from {filename} (scope={scope})")
+        return len(new_meta)
 
-        # Update FAISS (only in hybrid mode)
-        if new_embeddings and settings.USE_FAISS:
+    def _add_shared(self, new_meta: List[Dict], vectors, vector_rows) -> bool:
+        """Build the next generation off to the side and swap it in; searches in flight keep reading the one they pinned."""
+        with self._write_lock:
+            if self._successor is not None:
+                # A newly ingested index was swapped in while this upload was being chunked
+                return self._successor._add_shared(new_meta, vectors, vector_rows)
             try:
-                import faiss
-                vectors = np.vstack(new_embeddings)
-                if self.faiss_index is None:
-                    self.faiss_index = faiss.IndexFlatIP(vectors.shape[1])
-                self.faiss_index.add(vectors)
+                gen = self._gen.with_documents(new_meta, vectors, vector_rows)
             except Exception as e:
-                print(f"[error] Failed to update FAISS index: {e}")
+                print(f"[error] Failed to build index generation: {e}")
+                return False
+            self._gen = gen
+            print(f"[index] Generation {gen.number} live: {len(gen.meta)} chunks, {len(gen.faiss_segments)} vector segment(s)")
+
+            # Persist as a new delta segment: O(upload) I/O, live once its manifest is fsync'd
+            try:
+                entry = self.segments.append(new_meta, vectors, vector_rows)
+                print(f"[index] Persisted delta segment {entry['name']}.")
+            except Exception as e:
+                print(f"[warning] Failed to persist index: {e}")
+
+        if settings.COMPACT_MIN_DELTAS and len(self.segments.deltas) >= settings.COMPACT_MIN_DELTAS:
+            threading.Thread(target=self._compact, name="compact", daemon=True).start()
+        return True
 
-        # Update metadata and BM25
-        self.meta.extend(new_meta)
+    def _compact(self) -> None:
+        """Merge the on-disk deltas, then fold the in-memory upload vector segments the same way."""
         try:
-            tokenized_corpus = [doc["text"].split() for doc in self.meta]
-            self.bm25 = BM25Okapi(tokenized_corpus)
+            if self.segments.compact() is None:
+                return
+            with self._write_lock:
+                self._gen = self._gen.with_merged_segments()
         except Exception as e:
-            print(f"[error] Failed to update BM25 index: {e}")
+            print(f"[warning] Compaction failed: {e}")
 
-        # Persist metadata
+    def warm(self) -> None:
+        """One throwaway search so the first real request doesn't pay for lazy initialisation."""
+        t0 = time.perf_counter()
         try:
-            self.index_dir.mkdir(parents=True, exist_ok=True)
-            with open(self.meta_path, "a", encoding="utf-8") as f:
-                for rec in new_meta:
-                    f.write(json.dumps(rec) + "\n")
-
-            if new_embeddings and settings.USE_FAISS and self.faiss_index is not None:
-                import faiss
-                faiss.write_index(self.faiss_index, str(self.faiss_path))
-            print("[index] Persisted updates to disk.")
+            self.search("punishment for theft", top_k=1)
         except Exception as e:
-            print(f"[warning] Failed to persist index: {e}")
+            print(f"[warning] Warm-up search failed: {e}")
+        print(f"[init] Warmed up in {(time.perf_counter() - t0) * 1000:.0f} ms.")
 
-        print(f"[index] Successfully added {len(new_meta)} chunks from {filename} (scope={scope})")
-        return len(new_meta)
+
+class RetrieverHandle:
+    """
+    The live HybridRetriever. Attribute access goes to the active instance, so
+    `hybrid_retriever.search(...)` always hits the current index generation;
+    code that makes several calls per request should pin `.active` once.
+    """
+
+    def __init__(self, retriever: HybridRetriever):
+        self._active = retriever
+
+    @property
+    def active(self) -> HybridRetriever:
+        return self._active
+
+    def __getattr__(self, name):
+        return getattr(self._active, name)
+
+    def reload(self, index_dir: Path) -> HybridRetriever:
+        """Load and warm a new generation beside the active one, then swap it in."""
+        old = self._active
+        t0 = time.perf_counter()
+        # Uploads wait for the swap (so none land only in the old instance); searches don't
+        with old._write_lock:
+            fresh = HybridRetriever(index_dir, shared=old)
+            fresh.warm()
+            self._active = fresh
+            old._successor = fresh
+        print(f"[generation] now serving {fresh.generation_info.get('name', index_dir)} "
+              f"({len(fresh.meta)} chunks, loaded in {time.perf_counter() - t0:.1f}s); previous index released.")
+        return fresh
 
 
 # Global singleton
-hybrid_retriever = HybridRetriever()
\ No newline at end of file
+hybrid_retriever = RetrieverHandle(HybridRetriever())
\ No newline at end of file
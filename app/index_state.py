@@ -0,0 +1,317 @@
+# app/index_state.py
+"""
+Immutable index generations for HybridRetriever.
+
+A generation bundles everything a search reads together: chunk metadata and,
+per scope, a shard with its own BM25 index (and sparse matrix) and FAISS
+vectors. Readers pin the current generation once per request; add_document()
+builds the next generation and swaps the reference, so a search never sees
+BM25, FAISS and meta of different lengths and uploads never block readers.
+
+Shards keep global meta row numbers, so the structure tree, section index and
+definitions (all keyed by row) work unchanged. A scoped query fans out only to
+its scopes' shards, in parallel, and the per-shard hits are merged by score.
+Each shard holds its own postings, but scores with the corpus-wide IDF and
+average length (CorpusStats): per-shard IDF makes scores from a 20-chunk
+state act and the 80-chunk BNS incomparable, and the merge would favour
+whichever shard happens to find the query's words rare.
+
+FAISS vectors live in immutable segments (a faiss index + the meta rows its
+vectors belong to); a new upload adds a segment to its shard instead of
+mutating an index another thread may be searching.
+"""
+from __future__ import annotations
+import math
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+from rank_bm25 import BM25Okapi
+
+from app.settings import settings
+from app.sparse_bm25 import SparseBM25
+
+_pool = ThreadPoolExecutor(max_workers=max(1, settings.SHARD_WORKERS), thread_name_prefix="shard")
+
+Hits = List[Tuple[int, float]]  # (global meta row, score), best first
+
+
+def _fan_out(fn: Callable, items: Sequence) -> List:
+    """fn over every item, in parallel when there is more than one."""
+    if len(items) <= 1:
+        return [fn(item) for item in items]
+    return list(_pool.map(fn, items))
+
+
+class FaissSegment:
+    """A read-only faiss index and the meta row of each of its vectors."""
+
+    __slots__ = ("index", "rows")
+
+    def __init__(self, index, rows: np.ndarray):
+        self.index = index
+        self.rows = np.asarray(rows, dtype="int64")
+
+
+def _flat_index(vectors: np.ndarray):
+    import faiss
+    index = faiss.IndexFlatIP(vectors.shape[1])
+    index.add(np.ascontiguousarray(vectors, dtype="float32"))
+    return index
+
+
+def split_by_scope(seg: FaissSegment, meta: List[Dict]) -> Dict[str, FaissSegment]:
+    """A segment spanning several scopes as one segment per scope (vectors are copied only when mixed)."""
+    scopes = np.array([meta[r].get("scope", "unknown") for r in seg.rows])
+    if len(set(scopes)) <= 1:
+        return {str(scopes[0]): seg} if len(scopes) else {}
+    vectors = seg.index.reconstruct_n(0, seg.index.ntotal)
+    return {
+        str(scope): FaissSegment(_flat_index(vectors[scopes == scope]), seg.rows[scopes == scope])
+        for scope in dict.fromkeys(scopes)
+    }
+
+
+def _merge_segments(segments: Sequence[FaissSegment]) -> FaissSegment:
+    return FaissSegment(
+        _flat_index(np.vstack([seg.index.reconstruct_n(0, seg.index.ntotal) for seg in segments])),
+        np.concatenate([seg.rows for seg in segments]),
+    )
+
+
+class CorpusStats:
+    """BM25Okapi's IDF / avgdl / k1 / b over every shard (also used for user sub-indexes)."""
+
+    def __init__(self, bm25s: Iterable, k1: float = 1.5, b: float = 0.75, epsilon: float = 0.25):
+        self.k1, self.b = k1, b
+        nd: Counter = Counter()
+        n = total = 0
+        for bm25 in bm25s:
+            if bm25 is None:
+                continue
+            for freqs in bm25.doc_freqs:
+                nd.update(freqs.keys())
+            n += bm25.corpus_size
+            total += sum(bm25.doc_len)
+        self.avgdl = total / n if n else 1.0
+        self.idf: Dict[str, float] = {
+            word: math.log(n - freq + 0.5) - math.log(freq + 0.5) for word, freq in nd.items()
+        }
+        if self.idf:
+            eps = epsilon * sum(self.idf.values()) / len(self.idf)
+            for word, idf in self.idf.items():
+                if idf < 0:
+                    self.idf[word] = eps
+        self.unseen_idf = max(self.idf.values(), default=1.0)
+
+    def idf_of(self, term: str) -> float:
+        """Terms added after these stats were taken (uploads) count as the rarest."""
+        return self.idf.get(term, self.unseen_idf)
+
+
+class Shard:
+    """One scope's rows with their own BM25 statistics and vectors. Never mutated."""
+
+    __slots__ = ("scope", "rows", "bm25", "bm25_matrix", "faiss_segments")
+
+    def __init__(self, scope: str, rows: np.ndarray, bm25, bm25_matrix, faiss_segments: Sequence[FaissSegment]):
+        self.scope = scope
+        self.rows = rows
+        self.bm25 = bm25
+        self.bm25_matrix = bm25_matrix
+        self.faiss_segments = tuple(faiss_segments)
+
+    @classmethod
+    def build(cls, scope: str, meta: List[Dict], rows: Sequence[int],
+              faiss_segments: Sequence[FaissSegment] = (), stats: CorpusStats = None,
+              bm25=None) -> "Shard":
+        rows = np.asarray(rows, dtype="int64")
+        if bm25 is None and len(rows):
+            bm25 = BM25Okapi([meta[r]["text"].split() for r in rows])
+        return cls(scope, rows, bm25, SparseBM25(bm25, stats) if bm25 else None, faiss_segments)
+
+    @property
+    def has_vectors(self) -> bool:
+        return any(seg.index.ntotal for seg in self.faiss_segments)
+
+    def bm25_search(self, queries: List[List[str]], k: int, accept: Callable[[int], bool],
+                    rows: Optional[np.ndarray] = None) -> List[Hits]:
+        """Top k accepted rows per tokenised query; only among `rows` (sorted meta rows) when given."""
+        if self.bm25_matrix is None:
+            return [[] for _ in queries]
+        candidates = None if rows is None else np.flatnonzero(np.isin(self.rows, rows, assume_unique=True))
+        if candidates is not None and not len(candidates):
+            return [[] for _ in queries]
+        out = []
+        for scores in self.bm25_matrix.get_scores_batch(queries):
+            if candidates is None:
+                order = np.argsort(scores)[::-1]
+            else:
+                order = candidates[np.argsort(scores[candidates])[::-1]]
+            hits = []
+            for local in order:
+                if len(hits) >= k:
+                    break
+                row = int(self.rows[local])
+                if accept(row):
+                    hits.append((row, float(scores[local])))
+            out.append(hits)
+        return out
+
+    def faiss_search(self, query_vecs: np.ndarray, k: int,
+                     rows: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        (scores, global rows), each (n_queries, <=k), best first, merged over
+        segments; with `rows`, only those vectors are scored (an ID selector).
+        """
+        parts = []
+        for seg in self.faiss_segments:
+            if not seg.index.ntotal:
+                continue
+            if rows is None:
+                scores, local = seg.index.search(query_vecs, min(k, seg.index.ntotal))
+            else:
+                import faiss
+                ids = np.flatnonzero(np.isin(seg.rows, rows, assume_unique=True)).astype("int64")
+                if not len(ids):
+                    continue
+                params = faiss.SearchParameters(sel=faiss.IDSelectorBatch(ids))
+                scores, local = seg.index.search(query_vecs, min(k, len(ids)), params=params)
+            parts.append((scores, np.where(local >= 0, seg.rows[np.clip(local, 0, None)], -1)))
+        return _merge_topk(parts, query_vecs.shape[0], k)
+
+
+def _merge_topk(results: List[Tuple[np.ndarray, np.ndarray]], n: int, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Concatenate per-part (scores, rows) and keep the k best per query; -inf / -1 when empty."""
+    results = [r for r in results if r[0].shape[1]]
+    if not results:
+        return np.full((n, 0), -np.inf, dtype="float32"), np.full((n, 0), -1, dtype="int64")
+    scores = np.hstack([s for s, _ in results])
+    rows = np.hstack([r for _, r in results])
+    order = np.argsort(-scores, axis=1)[:, :k]
+    return np.take_along_axis(scores, order, axis=1), np.take_along_axis(rows, order, axis=1)
+
+
+class IndexGeneration:
+    """One consistent, never-mutated snapshot of the searchable index."""
+
+    __slots__ = ("number", "meta", "shards", "stats")
+
+    def __init__(self, number: int, meta: List[Dict], shards: Dict[str, Shard], stats: CorpusStats):
+        self.number = number
+        self.meta = meta  # never appended to in place; the next generation gets a new list
+        self.shards = shards
+        self.stats = stats
+
+    @classmethod
+    def build(cls, number: int, meta: List[Dict], faiss_segments: Sequence[FaissSegment] = (),
+              shard_rows: Optional[Dict[str, Sequence[int]]] = None) -> "IndexGeneration":
+        """
+        shard_rows: scope -> meta rows as written by ingest (shards.json); rows
+        past those it covers (uploads) and every row when it is absent are
+        grouped by their own scope. Segments spanning scopes are split.
+        """
+        grouped: Dict[str, List[int]] = {s: list(rows) for s, rows in (shard_rows or {}).items()}
+        for row in range(sum(len(rows) for rows in grouped.values()), len(meta)):
+            grouped.setdefault(meta[row].get("scope", "unknown"), []).append(row)
+        shard_rows = grouped
+        by_scope: Dict[str, List[FaissSegment]] = {}
+        for seg in faiss_segments:
+            for scope, part in split_by_scope(seg, meta).items():
+                by_scope.setdefault(scope, []).append(part)
+        scopes = list(dict.fromkeys([*shard_rows, *by_scope]))
+        # Tokenise every shard, take corpus-wide statistics, then lay out each shard's matrix
+        bm25s = _fan_out(
+            lambda scope: BM25Okapi([meta[r]["text"].split() for r in shard_rows[scope]])
+            if shard_rows.get(scope) else None,
+            scopes,
+        )
+        stats = CorpusStats(bm25s)
+        shards = _fan_out(
+            lambda i: Shard.build(scopes[i], meta, shard_rows.get(scopes[i], ()), by_scope.get(scopes[i], ()),
+                                  stats=stats, bm25=bm25s[i]),
+            range(len(scopes)),
+        )
+        return cls(number, meta, dict(zip(scopes, shards)), stats)
+
+    @property
+    def has_vectors(self) -> bool:
+        return any(shard.has_vectors for shard in self.shards.values())
+
+    @property
+    def faiss_segments(self) -> Tuple[FaissSegment, ...]:
+        return tuple(seg for shard in self.shards.values() for seg in shard.faiss_segments)
+
+    def shards_for(self, scopes: Optional[Iterable[str]] = None) -> List[Shard]:
+        if not scopes:
+            return list(self.shards.values())
+        return [self.shards[s] for s in dict.fromkeys(scopes) if s in self.shards]
+
+    def bm25_search(self, queries: List[str], k: int, scopes: Optional[Iterable[str]] = None,
+                    accept: Callable[[int], bool] = lambda row: True,
+                    rows: Optional[np.ndarray] = None) -> List[Hits]:
+        """
+        Each selected shard's top k per query, merged by score (comparable:
+        shards share corpus-wide IDF); rows (sorted) restricts the candidates.
+        """
+        tokens = [q.split() for q in queries]
+        per_shard = _fan_out(lambda shard: shard.bm25_search(tokens, k, accept, rows), self.shards_for(scopes))
+        if not per_shard:
+            return [[] for _ in queries]
+        return [
+            sorted((hit for hits in per_query for hit in hits), key=lambda h: h[1], reverse=True)[:k]
+            for per_query in zip(*per_shard)
+        ]
+
+    def faiss_search(self, query_vecs: np.ndarray, k: int, scopes: Optional[Iterable[str]] = None,
+                     rows: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Search every selected shard and merge: (scores, meta rows), each
+        (n_queries, k), best first, padded with -inf / -1. rows (sorted)
+        restricts the vectors scored.
+        """
+        results = _fan_out(lambda shard: shard.faiss_search(query_vecs, k, rows), self.shards_for(scopes))
+        return _merge_topk(results, query_vecs.shape[0], k)
+
+    def with_documents(self, new_meta: List[Dict], vectors: Optional[np.ndarray] = None,
+                       vector_rows: Optional[Sequence[int]] = None) -> "IndexGeneration":
+        """
+        The next generation: this one plus new_meta. vectors[i] belongs to
+        new_meta[vector_rows[i]] (all of new_meta when vector_rows is None).
+        Only the shards of the new rows' scopes are rebuilt.
+        """
+        base = len(self.meta)
+        meta = self.meta + new_meta
+        new_rows: Dict[str, List[int]] = {}
+        for i, rec in enumerate(new_meta):
+            new_rows.setdefault(rec.get("scope", "unknown"), []).append(base + i)
+        new_segs: Dict[str, FaissSegment] = {}
+        if vectors is not None and len(vectors):
+            local = np.arange(len(new_meta)) if vector_rows is None else np.asarray(vector_rows, dtype="int64")
+            new_segs = split_by_scope(FaissSegment(_flat_index(vectors), local + base), meta)
+
+        shards = dict(self.shards)
+        for scope, rows in new_rows.items():
+            old = shards.get(scope)
+            old_rows = old.rows if old is not None else np.zeros(0, dtype="int64")
+            segments = list(old.faiss_segments) if old is not None else []
+            if scope in new_segs:
+                segments.append(new_segs[scope])
+            shards[scope] = Shard.build(scope, meta, np.concatenate([old_rows, rows]), segments, stats=self.stats)
+        return IndexGeneration(self.number + 1, meta, shards, self.stats)
+
+    def with_merged_segments(self) -> "IndexGeneration":
+        """
+        Same rows, with every upload segment after the first (the ingest base)
+        of each shard folded into one; used after the on-disk deltas are compacted.
+        """
+        if all(len(shard.faiss_segments) <= 2 for shard in self.shards.values()):
+            return self
+        shards = {}
+        for scope, shard in self.shards.items():
+            segs = shard.faiss_segments
+            if len(segs) > 2:
+                segs = (segs[0], _merge_segments(segs[1:]))
+            shards[scope] = Shard(scope, shard.rows, shard.bm25, shard.bm25_matrix, segs)
+        return IndexGeneration(self.number + 1, self.meta, shards, self.stats)
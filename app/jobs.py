@@ -0,0 +1,136 @@
+# app/jobs.py
+"""
+Background ingestion queue for /upload.
+
+Uploaded PDFs are saved to disk by the endpoint and handed to a small thread
+pool which parses and indexes them off the event loop. Threads (not processes)
+because indexing mutates the in-process hybrid_retriever singleton.
+Finished jobs are kept for JOB_TTL_S so clients can read the result, then
+forgotten.
+"""
+from __future__ import annotations
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, Optional
+
+from app.chunking import extract_pdf_pages
+from app.settings import settings
+
+
+class UploadJobQueue:
+    def __init__(self, max_workers: int = 2, ttl_s: float = 3600):
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ingest")
+        self.ttl_s = ttl_s
+        self._jobs: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+
+    # ------------------------------------------------------------------ #
+    #  Job bookkeeping
+    # ------------------------------------------------------------------ #
+    def _update(self, job_id: str, **fields) -> None:
+        with self._lock:
+            self._jobs[job_id].update(fields, updated_at=time.time())
+
+    def _expire(self) -> None:
+        """Drop finished jobs not updated for ttl_s (caller holds the lock)."""
+        cutoff = time.time() - self.ttl_s
+        for job_id in [j for j, job in self._jobs.items()
+                       if job["status"] in ("done", "failed") and job["updated_at"] < cutoff]:
+            del self._jobs[job_id]
+
+    def status(self, job_id: str) -> Optional[Dict]:
+        with self._lock:
+            self._expire()
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+    def submit(self, file_path: Path, filename: str, user_id: Optional[str] = None,
+               content_hash: Optional[str] = None) -> str:
+        """
+        Queue a saved PDF. If content_hash (sha256 of the file) was uploaded
+        before, the worker indexes it from the shared chunk store instead of parsing.
+        """
+        job_id = uuid.uuid4().hex[:16]
+        now = time.time()
+        with self._lock:
+            self._expire()
+            self._jobs[job_id] = {
+                "job_id": job_id,
+                "filename": filename,
+                "user_id": user_id,
+                "status": "queued",
+                "pages_total": None,
+                "pages_parsed": 0,
+                "chunks_added": 0,
+                "deduplicated": False,
+                "error": None,
+                "created_at": now,
+                "updated_at": now,
+            }
+        self._pool.submit(self._run, job_id, file_path, filename, user_id, content_hash)
+        print(f"[jobs] queued {job_id}: {filename} (user_id={user_id})")
+        return job_id
+
+    # ------------------------------------------------------------------ #
+    #  Worker
+    # ------------------------------------------------------------------ #
+    def _run_cached(self, job_id: str, file_path: Path, filename: str, user_id: Optional[str],
+                    content_hash: str) -> bool:
+        """Metadata-only indexing of content seen before; False if it has to be parsed."""
+        from app.hybrid_retriever import hybrid_retriever
+
+        try:
+            num_chunks = hybrid_retriever.add_cached_upload(
+                content_hash, filename, scope="user_upload", user_id=user_id,
+            )
+        except Exception as e:
+            print(f"[jobs] {job_id}: cached upload failed ({e}); parsing instead.")
+            return False
+        if num_chunks is None:
+            return False
+        self._update(job_id, status="done", chunks_added=num_chunks, deduplicated=True)
+        Path(file_path).unlink(missing_ok=True)  # the stored chunks are all that is needed
+        print(f"[jobs] {job_id} done: {filename} matched stored content {content_hash[:12]} ({num_chunks} chunks)")
+        return True
+
+    def _run(self, job_id: str, file_path: Path, filename: str, user_id: Optional[str],
+             content_hash: Optional[str] = None) -> None:
+        # Imported lazily so the queue can be constructed before the retriever loads
+        from app.hybrid_retriever import hybrid_retriever
+
+        if content_hash and self._run_cached(job_id, file_path, filename, user_id, content_hash):
+            return
+        try:
+            self._update(job_id, status="parsing")
+            pages = extract_pdf_pages(
+                file_path,
+                on_progress=lambda done, total: self._update(job_id, pages_parsed=done, pages_total=total),
+            )
+            text = "\n".join(p for p in pages if p)
+
+            if not text.strip():
+                self._update(
+                    job_id, status="failed",
+                    error="PDF contains no extractable text (scanned/image-based PDF is not supported).",
+                )
+                return
+
+            self._update(job_id, status="indexing")
+            num_chunks = hybrid_retriever.add_document(
+                text, filename,
+                scope="user_upload",
+                user_id=user_id,
+                content_hash=content_hash,
+            )
+            self._update(job_id, status="done", chunks_added=num_chunks)
+            print(f"[jobs] {job_id} done: {num_chunks} chunks from {filename}")
+        except Exception as e:
+            print(f"[jobs] {job_id} failed: {e}")
+            self._update(job_id, status="failed", error=str(e))
+
+
+# Global singleton
+upload_jobs = UploadJobQueue(max_workers=settings.UPLOAD_WORKERS, ttl_s=settings.JOB_TTL_S)
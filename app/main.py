@@ -3,13 +3,16 @@ from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel
 from typing import Optional
-import shutil
 import os
+import uuid
+import hashlib
 from pathlib import Path
-from pypdf import PdfReader
 from app.rag import answer, _call_sarvam
+from app.extractive import extractive_answer
 from app.prompts import GENERAL_SYSTEM_PROMPT
 from app.hybrid_retriever import hybrid_retriever
+from app.jobs import upload_jobs
+from app.generations import GenerationWatcher, active_name
 from app.settings import settings
 
 app = FastAPI(title="LegalAid RAG", version="2.0")
@@ -27,6 +30,7 @@ class AskIn(BaseModel):
     question: str
     filter_filename: Optional[str] = None
     user_id: Optional[str] = None   # NEW: identifies the user for scoped retrieval
+    fast: bool = False              # extractive answer only, no LLM call
 
 
 class ChatIn(BaseModel):
@@ -34,64 +38,89 @@ class ChatIn(BaseModel):
 
 
 # ── API Routes (defined BEFORE static mount) ──────────
+@app.on_event("startup")
+def watch_index_generations():
+    """Hot-swap the index when scripts/ingest.py publishes a new generation."""
+    if settings.GENERATION_POLL_S > 0:
+        GenerationWatcher(
+            hybrid_retriever.index_root, hybrid_retriever.reload,
+            interval=settings.GENERATION_POLL_S,
+            loaded=hybrid_retriever.generation_info.get("name"),
+        ).start()
+
+
 @app.get("/health")
 def health():
     return {"ok": True, "jurisdiction": settings.JURISDICTION}
 
 
+@app.get("/admin/generation")
+def active_generation():
+    """The index generation being served and the newest one published on disk."""
+    retriever = hybrid_retriever.active
+    return {
+        "active": retriever.generation_info.get("name"),
+        "index_dir": str(retriever.index_dir),
+        "published": active_name(retriever.index_root),
+        "created_at": retriever.generation_info.get("created_at"),
+        "loaded_at": retriever.loaded_at,
+        "chunks": len(retriever.meta),
+        "delta_segments": len(retriever.segments.deltas),
+        "info": retriever.generation_info,
+    }
+
+
+@app.get("/admin/shards")
+def shard_servers():
+    """Health of the shard servers law searches fan out to (empty without SHARD_SERVERS)."""
+    coordinator = hybrid_retriever.shard_servers
+    if coordinator is None:
+        return {"shards": []}
+    return {"timeout_s": coordinator.timeout, "shards": coordinator.health()}
+
+
 @app.post("/upload")
 async def upload_file(
     file: UploadFile = File(...),
     user_id: Optional[str] = Form(default=None),   # NEW: optional user_id form field
 ):
-    """Upload and index a PDF file tagged with scope=user_upload."""
+    """Save a PDF and queue it for background indexing (scope=user_upload).
+    Returns immediately with a job_id; poll GET /upload/{job_id} for progress.
+    """
     if not file.filename.lower().endswith(".pdf"):
         raise HTTPException(status_code=400, detail="Only PDF files are supported.")
 
     upload_dir = Path("data/uploads")
     upload_dir.mkdir(parents=True, exist_ok=True)
-    file_path = upload_dir / file.filename
+    file_path = upload_dir / f"{uuid.uuid4().hex[:8]}_{Path(file.filename).name}"
 
+    digest = hashlib.sha256()  # content address: identical files are parsed and embedded once
     try:
         with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
+            while chunk := await file.read(1 << 20):
+                buffer.write(chunk)
+                digest.update(chunk)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to save upload: {e}")
 
-        try:
-            reader = PdfReader(str(file_path))
-            text = ""
-            for page in reader.pages:
-                txt = page.extract_text()
-                if txt:
-                    text += txt + "\n"
-        except Exception as e:
-            raise HTTPException(status_code=500, detail=f"Failed to parse PDF: {e}")
-
-        if not text.strip():
-            raise HTTPException(
-                status_code=400,
-                detail="PDF contains no extractable text (scanned/image-based PDF is not supported).",
-            )
+    job_id = upload_jobs.submit(file_path, file.filename, user_id=user_id, content_hash=digest.hexdigest())
+    return {
+        "job_id": job_id,
+        "filename": file.filename,
+        "scope": "user_upload",
+        "user_id": user_id,
+        "status": "queued",
+        "message": f"Queued {file.filename} for indexing. Poll /upload/{job_id} for status.",
+    }
 
-        # Tag with scope=user_upload and user_id for isolation
-        num_chunks = hybrid_retriever.add_document(
-            text, file.filename,
-            scope="user_upload",
-            user_id=user_id,
-        )
 
-        return {
-            "filename": file.filename,
-            "chunks_added": num_chunks,
-            "scope": "user_upload",
-            "user_id": user_id,
-            "status": "success",
-            "message": f"Successfully indexed {num_chunks} chunks from {file.filename}",
-        }
-
-    except HTTPException:
-        raise
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+@app.get("/upload/{job_id}")
+def upload_status(job_id: str):
+    """Progress of a background upload job (pages parsed, chunks added)."""
+    job = upload_jobs.status(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown upload job: {job_id}")
+    return job
 
 
 @app.post("/ask")
@@ -99,12 +128,14 @@ def ask(payload: AskIn):
     """RAG-powered Q&A with scoped retrieval.
     - If user_id is set: hybrid_search (user uploads + law corpus merged by score)
     - Otherwise: searches law corpus only
+    - fast=true: skips Sarvam and returns an extractive answer in milliseconds
     """
     try:
         out = answer(
             payload.question,
             filter_filename=payload.filter_filename,
             user_id=payload.user_id,
+            fast=payload.fast,
         )
         disclaimer = (
             "This is general legal information, not legal advice. "
@@ -116,11 +147,15 @@ def ask(payload: AskIn):
         print(f"[error] Generation failed: {e}")
         try:
             # Fallback retrieval: scoped to law corpus
-            docs = hybrid_retriever.hybrid_search(
+            retriever = hybrid_retriever.active
+            docs = retriever.hybrid_search(
                 payload.question,
                 user_id=payload.user_id,
                 top_k=5,
             )
+            extracted = extractive_answer(payload.question, retriever.expand_context(docs))
+            if extracted["answer"]:
+                return {**extracted, "fallback": True, "mode": "extractive"}
             fallback = (
                 "⚠️ **AI generation temporarily unavailable.**\n\n"
                 "Below are the most relevant sections from the legal corpus:"
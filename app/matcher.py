@@ -0,0 +1,146 @@
+# app/matcher.py
+"""
+Multi-pattern query matching with an Aho-Corasick automaton.
+
+Every phrase list the query path checks (user-document signals, act names and
+aliases, legal synonyms, definition triggers) is compiled into one automaton
+at startup; a single pass over the normalised query yields every signal.
+"""
+from __future__ import annotations
+import re
+from collections import deque
+from typing import Dict, Iterable, Iterator, List, Tuple
+
+# Everyday wording -> the statutory term BM25 should also look for
+LEGAL_SYNONYMS: Dict[str, List[str]] = {
+    "steal": ["theft"],
+    "stealing": ["theft"],
+    "stolen": ["theft"],
+    "robbed": ["robbery"],
+    "murder": ["culpable homicide"],
+    "killing": ["culpable homicide"],
+    "kidnap": ["kidnapping"],
+    "cheat": ["cheating"],
+    "beaten": ["hurt"],
+    "beat": ["hurt"],
+    "salary": ["wages"],
+    "pay": ["wages"],
+    "boss": ["employer"],
+    "fired": ["termination", "retrenchment"],
+    "sacked": ["termination", "retrenchment"],
+    "landlady": ["landlord"],
+    "owner": ["landlord"],
+    "renter": ["tenant"],
+    "kicked out": ["eviction"],
+    "evicted": ["eviction"],
+    "police complaint": ["first information report"],
+    "fir": ["first information report"],
+}
+
+# Phrases that make a query definitional ("what is X" -> also search "X means")
+DEFINITION_TRIGGERS = [
+    "what is", "what are", "what's", "define", "definition of", "meaning of",
+    "meant by", "what does", "explain the term",
+]
+
+
+def normalize(text: str) -> str:
+    return " ".join(re.sub(r"[^a-z0-9'.]+", " ", (text or "").lower()).split())
+
+
+class AhoCorasick:
+    """Character-level Aho-Corasick automaton; every match yields its pattern's payload."""
+
+    def __init__(self):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[List[Tuple[int, object]]] = [[]]  # (pattern length, payload)
+        self._built = False
+
+    def add(self, pattern: str, payload: object) -> None:
+        assert not self._built, "add() after build()"
+        node = 0
+        for ch in pattern:
+            nxt = self._goto[node].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[node][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+            node = nxt
+        self._out[node].append((len(pattern), payload))
+
+    def build(self) -> "AhoCorasick":
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, nxt in self._goto[node].items():
+                queue.append(nxt)
+                f = self._fail[node]
+                while f and ch not in self._goto[f]:
+                    f = self._fail[f]
+                self._fail[nxt] = self._goto[f].get(ch, 0)
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+        self._built = True
+        return self
+
+    def iter(self, text: str) -> Iterator[Tuple[int, int, object]]:
+        """Yield (start, end, payload) for every occurrence, in order of end position."""
+        node = 0
+        for i, ch in enumerate(text):
+            while node and ch not in self._goto[node]:
+                node = self._fail[node]
+            node = self._goto[node].get(ch, 0)
+            for length, payload in self._out[node]:
+                yield i + 1 - length, i + 1, payload
+
+    def find_words(self, text: str) -> Iterator[Tuple[int, int, object]]:
+        """Matches that start and end on word boundaries."""
+        for start, end, payload in self.iter(text):
+            if (start == 0 or not text[start - 1].isalnum()) and (end == len(text) or not text[end].isalnum()):
+                yield start, end, payload
+
+
+class QueryMatcher:
+    """
+    One automaton for all query signals. scan() returns
+    {"user_doc": [...], "acts": [...], "synonyms": [...], "definition": [...]}
+    with the matched phrase (or, for acts/synonyms, its key/expansions).
+    """
+
+    CATEGORIES = ("user_doc", "acts", "synonyms", "definition")
+
+    def __init__(
+        self,
+        user_doc_signals: Iterable[str] = (),
+        act_phrases: Iterable[Tuple[str, str]] = (),
+        synonyms: Dict[str, List[str]] = None,
+        definition_triggers: Iterable[str] = DEFINITION_TRIGGERS,
+    ):
+        self._ac = AhoCorasick()
+        self.size = 0
+        for p in user_doc_signals:
+            self._add(p, ("user_doc", p))
+        for phrase, key in act_phrases:
+            self._add(phrase, ("acts", key))
+        for p, targets in (LEGAL_SYNONYMS if synonyms is None else synonyms).items():
+            self._add(p, ("synonyms", tuple(targets)))
+        for p in definition_triggers:
+            self._add(p, ("definition", p))
+        self._ac.build()
+
+    def _add(self, phrase: str, payload: Tuple[str, object]) -> None:
+        phrase = normalize(phrase)
+        if phrase:
+            self._ac.add(phrase, payload)
+            self.size += 1
+
+    def scan(self, query: str) -> Dict[str, List]:
+        signals: Dict[str, List] = {c: [] for c in self.CATEGORIES}
+        for _, _, (category, value) in self._ac.find_words(normalize(query)):
+            if category == "synonyms":
+                signals[category].extend(t for t in value if t not in signals[category])
+            elif value not in signals[category]:
+                signals[category].append(value)
+        return signals
@@ -4,13 +4,19 @@ from pathlib import Path
 import re
 import traceback
 import requests
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
 
 from app.hybrid_retriever import hybrid_retriever, LAW_SCOPES
+from app.extractive import extractive_answer
 from app.prompts import SYSTEM_PROMPT, USER_PROMPT
 from app.settings import settings
 
 
-def _call_sarvam(messages: list) -> str:
+# Runs Sarvam calls so answer() can stop waiting at the deadline
+_llm_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="sarvam")
+
+
+def _call_sarvam(messages: list, timeout: float = 120) -> str:
     """Call Sarvam AI chat completions API and strip reasoning tags."""
     headers = {
         "Content-Type": "application/json",
@@ -24,7 +30,7 @@ def _call_sarvam(messages: list) -> str:
         "max_tokens": 900,
         "reasoning_effort": "low",   # keeps think blocks minimal
     }
-    resp = requests.post(settings.SARVAM_API_URL, json=payload, headers=headers, timeout=120)
+    resp = requests.post(settings.SARVAM_API_URL, json=payload, headers=headers, timeout=timeout)
     if resp.status_code != 200:
         raise Exception(f"Sarvam API error {resp.status_code}: {resp.text}")
 
@@ -44,32 +50,66 @@ def _build_context(docs: List[Dict]) -> tuple[str, List[Dict]]:
         fname = d.get("filename", Path(d.get("source", "unknown")).name)
         # Improved citation formatting: include scope and act name
         source_label = f"{act} — {scope}" if act else fname
-        lines.append(f"{tag} (Source: {source_label})\n{d['text'][:1200]}")
+        # Only exact copies (similarity 1.0) are "the same text"; near-duplicates differ somewhere
+        also_in = sorted({
+            a["act_name"] or a["filename"] for a in d.get("aliases", [])
+            if a.get("similarity", 1.0) >= 1.0 and (a["act_name"] or a["filename"]) != act
+        })
+        if also_in:
+            source_label += f" (same text also in: {', '.join(also_in)})"
+        ref = d.get("referenced_by")
+        if ref:
+            source_label += f" (referenced by Section {ref['section_number']}: {ref['kind'].replace('_', ' ')})"
+        limit = settings.CONTEXT_MAX_CHARS if settings.CONTEXT_MODE in ("section", "parent") else 1200
+        lines.append(f"{tag} (Source: {source_label})\n{d['text'][:limit]}")
         cites.append({"ref": tag, "title": d.get("title", "Section"), "where": source_label})
     return "\n\n---\n\n".join(lines), cites
 
 
+def _extractive_fallback(question: str, docs: List[Dict], cites: List[Dict], reason: str) -> Dict:
+    """Extractive answer when the LLM is skipped (reason="fast") or failed; same shape either way."""
+    out = extractive_answer(question, docs)
+    if not out["answer"]:
+        message = (
+            "I couldn't find a direct answer in the retrieved passages. Please see the cited sources."
+            if reason == "fast" else
+            "⚠️ AI generation is temporarily unavailable. Please try again in a moment."
+        )
+        return {"answer": message, "citations": cites, "mode": "extractive", "reason": reason}
+    return {**out, "fallback": reason != "fast", "mode": "extractive", "reason": reason}
+
+
 def answer(
     question: str,
     filter_filename: str = None,
     user_id: Optional[str] = None,
+    fast: bool = False,
 ) -> Dict:
     """
     Retrieve context and generate an answer.
     Routing logic:
+      - If filter_filename  → search only that file (in user_id's uploads first)
       - If user_id is set  → hybrid_search (user uploads + law corpus, merged by score)
-      - If filter_filename  → legacy: search only that file
       - Otherwise          → law corpus search only
+    fast=True skips the LLM and answers extractively from the top chunks.
+    If Sarvam misses settings.LLM_DEADLINE_S, the extractive answer is returned instead.
     """
+    retriever = hybrid_retriever.active  # one index generation for the whole request
     if filter_filename:
-        # Legacy filename-filter path (backward compatible)
-        docs = hybrid_retriever.search(question, filename=filter_filename, top_k=settings.TOP_K)
+        # Filename-filter path: uploads made with a user_id live only in that user's sub-index;
+        # the shared index still holds legacy uploads
+        docs = []
+        user_index = retriever.user_indexes.get(user_id, with_vectors=settings.USE_FAISS) if user_id else None
+        if user_index is not None:
+            docs = retriever.search(question, filename=filter_filename, top_k=settings.TOP_K, user_index=user_index)
+        if not docs:
+            docs = retriever.search(question, filename=filter_filename, top_k=settings.TOP_K)
     elif user_id:
         # Scoped hybrid: user uploads first, law corpus as fallback, merged by score
-        docs = hybrid_retriever.hybrid_search(question, user_id=user_id, top_k=settings.TOP_K)
+        docs = retriever.hybrid_search(question, user_id=user_id, top_k=settings.TOP_K)
     else:
         # No user context — search law corpus only
-        docs = hybrid_retriever.search(
+        docs = retriever.search(
             question, scope_filter=LAW_SCOPES, top_k=settings.TOP_K
         )
 
@@ -82,7 +122,13 @@ def answer(
             "citations": [],
         }
 
+    docs = retriever.expand_context(docs)
+    # Sections the hits point at (penalty, definitions) come along without another retrieval round
+    docs = docs + retriever.referenced_sections(docs)
     context, cites = _build_context(docs)
+    if fast:
+        return _extractive_fallback(question, docs, cites, reason="fast")
+
     user_content = USER_PROMPT.format(
         jurisdiction=settings.JURISDICTION,
         question=question,
@@ -94,14 +140,18 @@ def answer(
         {"role": "user",   "content": user_content},
     ]
 
+    deadline = settings.LLM_DEADLINE_S
+    future = _llm_pool.submit(_call_sarvam, messages, deadline)
     try:
-        answer_text = _call_sarvam(messages)
+        answer_text = future.result(timeout=deadline)
         return {"answer": answer_text, "citations": cites}
 
+    except FutureTimeout:
+        future.cancel()
+        print(f"[rag.answer] Sarvam missed the {deadline:.1f}s deadline; answering extractively.")
+        return _extractive_fallback(question, docs, cites, reason="llm_timeout")
+
     except Exception as e:
         print("[rag.answer] Sarvam API error:", e)
         traceback.print_exc()
-        return {
-            "answer": "⚠️ AI generation is temporarily unavailable. Please try again in a moment.",
-            "citations": cites,
-        }
\ No newline at end of file
+        return _extractive_fallback(question, docs, cites, reason="llm_error")
\ No newline at end of file
@@ -6,34 +6,50 @@ from pathlib import Path
 from typing import List, Dict, Tuple, Optional
 from rank_bm25 import BM25Okapi
 from .settings import settings
+from .citations import SectionIndex
+from .structure import act_id_for
 
 INDEX_DIR = Path("data/index")
 META_FILE = INDEX_DIR / "meta.jsonl"
-SECTION_MAP_FILE = INDEX_DIR / "section_map.json"
+SECTION_INDEX_FILE = INDEX_DIR / "section_index.json"
 
 # Load meta chunks
 _meta: List[Dict] = [json.loads(l) for l in open(META_FILE, encoding="utf-8")]
 _docs = [m["text"] for m in _meta]
 
-# optional pre-built section map (may be incomplete)
-_section_map: Dict[str, Dict] = {}
-if SECTION_MAP_FILE.exists():
-    try:
-        _section_map = json.loads(SECTION_MAP_FILE.read_text(encoding="utf-8"))
-    except Exception:
-        _section_map = {}
-
 # BM25 index
 _bm25 = BM25Okapi([d.split() for d in _docs]) if settings.USE_BM25 else None
 
 # regexes
 _Q_SEC_RE = re.compile(r"\bsec(?:tion)?\.?\s+(\d+[A-Za-z]?)\b", re.I)
-_CHUNK_SEC_PATTERNS = [
-    re.compile(r"(?mi)\bsection\s+(?P<num>\d+[A-Za-z]?)\b"),
-    re.compile(r"(?mi)\bsec\.?\s*(?P<num>\d+[A-Za-z]?)\b"),
-    re.compile(r"(?m)^\s*(?P<num>\d+[A-Za-z]?)\s*[\.\:\-–—]\s"),
-]
-_CHUNK_SEC_PATTERNS_ANY = [re.compile(p.pattern, re.I) for p in _CHUNK_SEC_PATTERNS]  # copy
+_HEADING_RE = re.compile(r"(?:^|\s)(\d{1,4}[A-Z]?)\s*[\.\:\-–—]\s+[A-Z\"“]")
+
+def _annotate_legacy_sections(meta: List[Dict]) -> None:
+    """
+    Indexes ingested before the structure tree carry no section ids: tag each
+    chunk with the section whose heading it (or an earlier chunk of the same
+    source) starts, in one pass at load time.
+    """
+    current: Dict[str, str] = {}
+    for rec in meta:
+        src = rec.get("source", "")
+        m = _HEADING_RE.search(rec.get("text", "")[:200])
+        if m:
+            current[src] = m.group(1)
+        num = current.get(src)
+        if num:
+            rec["act_id"] = act_id_for(rec.get("act_name") or src)
+            rec["section_number"] = num
+            rec["section_id"] = f"{rec['act_id']}/s-{num}"
+
+# (act, section) -> chunk spans: written by ingest, else derived from chunk metadata
+_sections: SectionIndex
+if SECTION_INDEX_FILE.exists():
+    _sections = SectionIndex(json.loads(SECTION_INDEX_FILE.read_text(encoding="utf-8")))
+else:
+    if not any(m.get("section_id") for m in _meta):
+        _annotate_legacy_sections(_meta)
+    _sections = SectionIndex.from_meta(_meta)
 
 def _bm25_scores(query: str) -> List[Tuple[int, float]]:
     if _bm25 is None:
@@ -55,79 +71,26 @@ def _keyword_bump(query: str, idx: int) -> float:
             bump += 0.15
     return min(bump, 0.45) if bump else 0.0
 
-def _find_section_in_chunk_text(text: str, target: str) -> bool:
-    """Return True if this chunk contains an explicit heading for target."""
-    if not target:
-        return False
-    for rx in _CHUNK_SEC_PATTERNS_ANY:
-        m = rx.search(text or "")
-        if m:
-            num = (m.group("num") or "").strip().lower() if m and m.groupdict().get("num") else None
-            # If pattern captured a num use that; else fallback to searching literal
-            if num:
-                if num == target.lower():
-                    return True
-            else:
-                # fallback literal search of '229.' style
-                if re.search(rf"\b{re.escape(target)}\s*[\.\:\-–—]\s", text):
-                    return True
-    # also check any literal like "229." somewhere
-    if re.search(rf"\b{re.escape(target)}\s*[\.\:\-–—]|\b{re.escape(target)}\b", text):
-        # require the numeric to be near punctuation/heading to avoid accidental numeric matches
-        if re.search(rf"\b{re.escape(target)}\s*[\.\:\-–—]\s", text) or re.search(rf"(?m)^\s*{re.escape(target)}\s*$", text):
-            return True
-    return False
-
-def _scan_find_section_index(target: str) -> Optional[int]:
-    """Scan the whole meta to find the earliest chunk that looks like the section heading."""
-    if not target:
-        return None
-    for i, m in enumerate(_meta):
-        if _find_section_in_chunk_text(m["text"], target):
-            return i
-    return None
-
-def _find_next_section_in_text(text: str) -> Optional[str]:
-    """Return the first section number found in text if any."""
-    for rx in _CHUNK_SEC_PATTERNS_ANY:
-        m = rx.search(text or "")
-        if m:
-            return (m.group("num") or "").strip() if m.groupdict().get("num") else None
-    # fallback: look for '###. ' style at line start
-    m2 = re.search(r"(?m)^\s*(\d+[A-Za-z]?)\s*[\.\:\-–—]\s", text or "")
-    if m2:
-        return m2.group(1)
-    return None
-
-def _stitch_from_index(start_idx: int, target_section: str, max_steps: int = 12, max_chars: int = 4000) -> str:
-    pieces: List[str] = []
-    chars = 0
-    steps = 0
-    i = start_idx
-    started = False
-    while 0 <= i < len(_meta) and steps < max_steps and chars < max_chars:
-        t = _meta[i]["text"]
-        sec_here = _find_next_section_in_text(t)
-        if sec_here:
-            if not started:
-                # first heading must match the target (tolerant compare)
-                if sec_here and sec_here.lower() != target_section.lower():
-                    # if first chunk contains a different section, can't start here
-                    # but sometimes the chunk contains the number inside body; accept if target present literally
-                    if not re.search(rf"\b{re.escape(target_section)}\b", t):
-                        break
-                started = True
-            else:
-                # encountered a different section -> stop
-                if sec_here.lower() != target_section.lower():
+def _section_rows(target: str) -> List[int]:
+    """Chunk rows of the first act that has section `target` (array lookup, no scanning)."""
+    for e in _sections.lookup(target):
+        return [r for r in e["rows"] if r < len(_meta)]
+    return []
+
+def _stitch_section(target: str, max_chars: int = 4000) -> Optional[Tuple[int, str]]:
+    """(first row, section text) sliced straight out of meta via the span table."""
+    for e in _sections.lookup(target):
+        pieces: List[str] = []
+        chars = 0
+        for start, end in e["spans"]:
+            for m in _meta[start:min(end, len(_meta))]:
+                if chars >= max_chars:
                     break
-        pieces.append(t.strip())
-        chars += len(t)
-        steps += 1
-        i += 1
-    stitched = "\n\n".join(pieces)
-    stitched = re.sub(r"\n{2,}", "\n\n", stitched)
-    return stitched
+                pieces.append(m["text"].strip())
+                chars += len(pieces[-1])
+        if pieces:
+            return e["rows"][0], "\n\n".join(pieces)
+    return None
 
 def _section_in_query(query: str) -> Optional[str]:
     m = _Q_SEC_RE.search(query or "")
@@ -135,24 +98,22 @@ def _section_in_query(query: str) -> Optional[str]:
 
 def retrieve(query: str) -> List[Dict]:
     """
-    Robust BM25 retrieval + deterministic section stitching fallback:
-      - if user asked 'section N', try section_map first
-      - if not found, scan meta for heading that matches N
-      - if found, stitch forward and return that as first result
+    Robust BM25 retrieval + deterministic section lookup:
+      - if user asked 'section N', slice its chunks out of the section span table
+      - the section text is returned as the first result
       - then append BM25 core picks (with keyword bumps)
     """
     target_section = _section_in_query(query)
     results: List[Dict] = []
     used = set()
 
-    # 1) Try deterministic section_map
+    # 1) Deterministic section lookup via the span table
+    target_rows = set()
     if target_section:
-        if target_section in _section_map:
-            start_idx = int(_section_map[target_section]["idx"])
-        else:
-            start_idx = _scan_find_section_index(target_section)
-        if start_idx is not None:
-            stitched = _stitch_from_index(start_idx, target_section)
+        target_rows = set(_section_rows(target_section))
+        found = _stitch_section(target_section)
+        if found is not None:
+            start_idx, stitched = found
             m0 = _meta[start_idx]
             key = (m0["source"], stitched[:80])
             used.add(key)
@@ -181,7 +142,7 @@ def retrieve(query: str) -> List[Dict]:
             norm = 0.0 if smax == smin else (float(sc) - smin)/(smax - smin)
             norm += _keyword_bump(query, idx)
             # if chunk contains the explicit section heading, strongly bump
-            if target_section and _find_section_in_chunk_text(_meta[idx]["text"], target_section):
+            if idx in target_rows:
                 norm += 0.75
             normed.append((idx, norm))
         normed.sort(key=lambda x: x[1], reverse=True)
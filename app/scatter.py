@@ -0,0 +1,94 @@
+# app/scatter.py
+"""
+Scatter-gather retrieval over shard servers.
+
+A corpus too large for one process (the judgment corpus) is split across
+nodes, each running app.shard_server over its own index. With SHARD_SERVERS
+set, HybridRetriever.search_multi sends the law-corpus half of a query to
+every node at once through a ShardCoordinator. Each node answers with its
+ranked candidate lists (per query variant: FAISS, BM25, section lookup)
+and no reranking. The coordinator fuses the lists from every node with RRF
+and reranks the union once, centrally.
+
+A node that errors or misses the SHARD_TIMEOUT_S deadline is logged and
+left out, so the answer is built from the shards that did respond. The
+fan-out pool has SHARD_CONCURRENCY threads per node, so concurrent queries
+do not queue behind each other's calls; calls still queued at the deadline
+are cancelled.
+"""
+from __future__ import annotations
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from typing import Dict, List, Optional
+
+import numpy as np
+import requests
+
+
+class ShardCoordinator:
+    def __init__(self, urls: List[str], timeout: float = 2.0, concurrency: int = 8):
+        self.urls = [u.rstrip("/") for u in urls if u.strip()]
+        self.timeout = timeout
+        self._pool = ThreadPoolExecutor(
+            max_workers=max(1, len(self.urls) * max(1, concurrency)), thread_name_prefix="scatter"
+        )
+        self._local = threading.local()  # one keep-alive session per worker thread
+
+    def _session(self) -> requests.Session:
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = self._local.session = requests.Session()
+        return session
+
+    def _call(self, url: str, payload: Dict) -> Dict:
+        resp = self._session().post(f"{url}/shard/search", json=payload, timeout=self.timeout)
+        resp.raise_for_status()
+        return resp.json()
+
+    def gather(self, queries: List[str], q_vecs: Optional[np.ndarray] = None, k: int = 30,
+               scope_filter: List[str] = None) -> Dict[str, List[Dict]]:
+        """
+        Every node's ranked lists for the query variants, keyed "<node>:<list>"
+        so RRF treats each as its own source. The query vectors are computed
+        once here and sent along, so nodes need no embedding model.
+        """
+        t0 = time.perf_counter()
+        payload = {
+            "queries": queries,
+            "k": k,
+            "scope_filter": scope_filter,
+            "vectors": q_vecs.tolist() if q_vecs is not None else None,
+        }
+        futures = {url: self._pool.submit(self._call, url, payload) for url in self.urls}
+        deadline = time.monotonic() + self.timeout
+        lists, answered = {}, 0
+        for i, (url, future) in enumerate(futures.items()):
+            try:
+                body = future.result(timeout=max(0.0, deadline - time.monotonic()))
+            except FutureTimeout:
+                future.cancel()  # still queued: never send it; in flight: bounded by the request timeout
+                print(f"[scatter] {url} timed out after {self.timeout:.1f}s; merging without it")
+                continue
+            except Exception as e:
+                print(f"[scatter] {url} failed ({type(e).__name__}); merging without it")
+                continue
+            answered += 1
+            for name, hits in body.get("lists", {}).items():
+                lists[f"s{i}:{name}"] = hits
+        print(
+            f"[scatter] {answered}/{len(self.urls)} shards answered, "
+            f"{sum(len(h) for h in lists.values())} candidates in {(time.perf_counter() - t0) * 1000:.1f} ms"
+        )
+        return lists
+
+    def health(self) -> List[Dict]:
+        """GET /shard/health of every node (unreachable nodes reported as errors)."""
+        def probe(url):
+            try:
+                resp = self._session().get(f"{url}/shard/health", timeout=self.timeout)
+                resp.raise_for_status()
+                return {"url": url, **resp.json()}
+            except Exception as e:
+                return {"url": url, "error": str(e)}
+        return list(self._pool.map(probe, self.urls))
@@ -0,0 +1,187 @@
+# app/segment_store.py
+"""
+Append-only delta segments for uploads.
+
+The ingest output (meta.jsonl + faiss.index) is the immutable base. Each
+add_document() writes one small delta segment instead of appending to
+meta.jsonl and rewriting faiss.index:
+
+    data/index/deltas/d000007/meta.jsonl    chunk metadata (also the BM25 postings source)
+    data/index/deltas/d000007/vectors.npy   float32 vectors, may be absent
+    data/index/deltas/d000007/rows.npy      which meta line each vector belongs to
+
+data/index/segments.json lists the live deltas in order. A segment only
+becomes visible once the manifest naming it has been fsync'd and renamed into
+place, so a crash mid-upload leaves at worst an orphan directory that the next
+startup or compaction deletes. The compactor merges the listed deltas into one segment
+and swaps the manifest the same way; the base is only ever rewritten by ingest.
+"""
+from __future__ import annotations
+import json
+import os
+import shutil
+import threading
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+MANIFEST_NAME = "segments.json"
+
+
+def fsync_dir(path: Path) -> None:
+    try:
+        fd = os.open(str(path), os.O_RDONLY)
+    except OSError:  # not supported on every platform (e.g. Windows)
+        return
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def durable_write(path: Path, data: bytes) -> None:
+    """Write-to-temp, fsync, rename, fsync the directory."""
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+    fsync_dir(path.parent)
+
+
+def save_npy(path: Path, arr: np.ndarray) -> None:
+    with open(path, "wb") as f:
+        np.save(f, arr)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+class SegmentStore:
+    """The delta segments under <index_dir>/deltas and the manifest that lists them."""
+
+    def __init__(self, index_dir: Path):
+        self.dir = Path(index_dir) / "deltas"
+        self.manifest_path = Path(index_dir) / MANIFEST_NAME
+        self.manifest = self._load_manifest()
+        self._lock = threading.Lock()       # manifest updates
+        self._compacting = threading.Lock()  # one compaction at a time
+        self._sweep()
+
+    def _load_manifest(self) -> Dict:
+        if self.manifest_path.exists():
+            try:
+                return json.loads(self.manifest_path.read_text(encoding="utf-8"))
+            except Exception as e:
+                print(f"[segments] unreadable manifest ({e}); ignoring delta segments.")
+        return {"deltas": [], "next": 1}
+
+    def _commit(self, manifest: Dict) -> None:
+        durable_write(self.manifest_path, json.dumps(manifest, indent=2).encode("utf-8"))
+        self.manifest = manifest
+
+    @property
+    def deltas(self) -> List[Dict]:
+        return list(self.manifest["deltas"])
+
+    # ------------------------------------------------------------------ #
+    #  Reading
+    # ------------------------------------------------------------------ #
+    def read(self, entry: Dict, with_vectors: bool = True) -> Tuple[List[Dict], Optional[np.ndarray], Optional[np.ndarray]]:
+        """(meta rows, vectors, local row of each vector) of one delta."""
+        d = self.dir / entry["name"]
+        with open(d / "meta.jsonl", "r", encoding="utf-8") as f:
+            meta = [json.loads(line) for line in f]
+        vectors = rows = None
+        if with_vectors and (d / "vectors.npy").exists():
+            vectors = np.load(d / "vectors.npy")
+            rows = np.load(d / "rows.npy")
+        return meta, vectors, rows
+
+    def iter_segments(self, with_vectors: bool = True) -> Iterator[Tuple[Dict, List[Dict], Optional[np.ndarray], Optional[np.ndarray]]]:
+        for entry in self.deltas:
+            try:
+                yield (entry, *self.read(entry, with_vectors))
+            except Exception as e:
+                print(f"[segments] skipping unreadable delta {entry['name']}: {e}")
+
+    # ------------------------------------------------------------------ #
+    #  Writing
+    # ------------------------------------------------------------------ #
+    def _write_segment(self, name: str, meta: List[Dict], vectors: Optional[np.ndarray],
+                       rows: Optional[Sequence[int]]) -> Dict:
+        d = self.dir / name
+        if d.exists():
+            shutil.rmtree(d)  # leftover from a crashed write that never reached the manifest
+        d.mkdir(parents=True)
+        with open(d / "meta.jsonl", "w", encoding="utf-8") as f:
+            for rec in meta:
+                f.write(json.dumps(rec) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        n_vec = 0
+        if vectors is not None and len(vectors):
+            save_npy(d / "rows.npy", np.asarray(rows if rows is not None else range(len(meta)), dtype="int64"))
+            save_npy(d / "vectors.npy", np.ascontiguousarray(vectors, dtype="float32"))
+            n_vec = len(vectors)
+        fsync_dir(d)
+        fsync_dir(self.dir)
+        return {"name": name, "rows": len(meta), "vectors": n_vec}
+
+    def append(self, meta: List[Dict], vectors: Optional[np.ndarray] = None,
+               vector_rows: Optional[Sequence[int]] = None) -> Dict:
+        """Persist one upload as a new delta; it is live once this returns."""
+        with self._lock:
+            seq = self.manifest["next"]
+            entry = self._write_segment(f"d{seq:06d}", meta, vectors, vector_rows)
+            self._commit({"deltas": self.manifest["deltas"] + [entry], "next": seq + 1})
+        return entry
+
+    # ------------------------------------------------------------------ #
+    #  Compaction
+    # ------------------------------------------------------------------ #
+    def compact(self) -> Optional[Dict]:
+        """Merge every delta listed right now into one segment; appends made meanwhile are kept after it."""
+        if not self._compacting.acquire(blocking=False):
+            return None
+        try:
+            with self._lock:
+                merging = self.deltas
+                seq = self.manifest["next"]
+                self.manifest = {**self.manifest, "next": seq + 1}  # reserve the name
+            if len(merging) < 2:
+                return None
+
+            meta, vecs, rows = [], [], []
+            for entry in merging:
+                m, v, r = self.read(entry)
+                if v is not None:
+                    vecs.append(v)
+                    rows.append(r + len(meta))
+                meta.extend(m)
+            merged = self._write_segment(
+                f"c{seq:06d}", meta,
+                np.vstack(vecs) if vecs else None,
+                np.concatenate(rows) if rows else None,
+            )
+
+            with self._lock:
+                current = self.manifest["deltas"]
+                assert [e["name"] for e in current[:len(merging)]] == [e["name"] for e in merging]
+                self._commit({**self.manifest, "deltas": [merged] + current[len(merging):]})
+            self._sweep()
+            print(f"[segments] compacted {len(merging)} deltas ({len(meta)} chunks) -> {merged['name']}")
+            return merged
+        finally:
+            self._compacting.release()
+
+    def _sweep(self) -> None:
+        """Delete segment directories no manifest refers to (crashed writes, old compactions)."""
+        if not self.dir.exists():
+            return
+        with self._lock:  # append() writes under this lock, so nothing live is half-written
+            live = {e["name"] for e in self.manifest["deltas"]}
+            for d in self.dir.iterdir():
+                if d.is_dir() and d.name not in live:
+                    shutil.rmtree(d, ignore_errors=True)
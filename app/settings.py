@@ -6,6 +6,7 @@ class Settings(BaseSettings):
     SARVAM_API_KEY: str
     SARVAM_API_URL: str = "https://api.sarvam.ai/v1/chat/completions"
     SARVAM_MODEL: str = "sarvam-m"
+    LLM_DEADLINE_S: float = 20.0   # past this, answer extractively instead of waiting
 
     # --- Retrieval mode flags ---
     USE_FAISS: bool = False        # True = vector+BM25 hybrid; False = BM25 only
@@ -14,6 +15,12 @@ class Settings(BaseSettings):
 
     # --- Embedding (local sentence-transformers, no API key needed) ---
     EMBED_MODEL: str = "sentence-transformers/all-MiniLM-L6-v2"
+    EMBED_BACKEND: str = "local"   # "local" (same model as queries) or "openrouter"
+    EMBED_WORKERS: int = 0         # ingest embedding processes; 0 = one per CPU
+    EMBED_CONCURRENCY: int = 4     # remote embedding: batches in flight
+    EMBED_RATE_LIMIT: float = 4.0  # remote embedding: max requests per second
+    OPENROUTER_BASE_URL: str = "https://openrouter.ai/api/v1"
+    OPENROUTER_API_KEY: str = ""
 
     # --- Reranking ---
     ENABLE_RERANKING: bool = True
@@ -24,10 +31,35 @@ class Settings(BaseSettings):
     RERANK_CANDIDATES: int = 20
     INITIAL_K: int = 30
     EXPAND_NEIGHBORS: int = 2
+    CONTEXT_MODE: str = "parent"   # how base segments are expanded for the LLM: segment | window | section | parent
+    CONTEXT_MAX_CHARS: int = 4000  # cap for section/parent-mode assembly
+    MAX_QUERY_VARIANTS: int = 4    # query + expansions searched together by HybridRetriever.search_multi
+    XREF_PREFETCH: int = 3         # sections referenced by the hits ("punishable under section N") added to the context; 0 = off
+    SHARD_WORKERS: int = 4         # threads fanning a query out to the per-scope index shards
+    ROUTER_TOP_ACTS: int = 3       # coarse-to-fine: fine search only the chunks of the query's top acts; 0 = off
+    ROUTER_MIN_CONFIDENCE: float = 0.5  # routed acts' share of the router score below this = full search
+    ROUTER_AUDIT_RATE: float = 0.05     # share of routed queries also searched in full to log the router's recall
     MIN_SIM_SCORE: float = 0.15
     BM25_WEIGHT: float = 1.0
     VEC_WEIGHT: float = 0.0
 
+    # --- Uploads ---
+    UPLOAD_WORKERS: int = 2        # background ingestion threads for /upload
+    JOB_TTL_S: float = 3600        # finished upload jobs are forgotten after this (GET /upload/{job_id} then 404s)
+    COMPACT_MIN_DELTAS: int = 8    # merge upload delta segments in the background once this many exist; 0 = never
+    USER_INDEX_TTL_S: float = 1800 # per-user upload sub-index is dropped from memory after this idle time (reloaded from disk)
+    USER_INDEX_MAX_MB: float = 256 # cap on resident per-user sub-indexes; least recently used are dropped first
+
+    # --- Index generations ---
+    GENERATION_POLL_S: float = 5.0 # how often the API checks data/index/CURRENT for a newly ingested index; 0 = off
+    GENERATIONS_KEEP: int = 3      # published generations kept on disk by ingest
+
+    # --- Scatter-gather (see app/scatter.py, app/shard_server.py) ---
+    SHARD_SERVERS: str = ""        # comma-separated shard server URLs; set = law searches fan out to them instead of the local index
+    SHARD_TIMEOUT_S: float = 2.0   # per query; shards that miss it are left out of the merge
+    SHARD_CONCURRENCY: int = 8     # queries the coordinator fans out at once (pool = shard servers x this)
+    SHARD_SCOPES: str = ""         # shard-server mode: comma-separated scopes this node serves; empty = every scope in its index
+
     # --- App ---
     JURISDICTION: str = "IN"
     SCOPE_TOPICS: str = "criminal law, procedure"
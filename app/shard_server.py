@@ -0,0 +1,80 @@
+# app/shard_server.py
+"""
+Shard-server mode: one node of a scatter-gather deployment (see app/scatter.py).
+
+Serves its own index (data/index under the working directory, hot-reloaded
+like the API) for the coordinator's fan-out. It returns ranked candidate
+lists only. Fusion and reranking happen once on the coordinator, so run
+nodes with ENABLE_RERANKING=false. SHARD_SCOPES narrows a node to some of
+its index's scopes, so several local processes can share one index for
+testing:
+
+    SHARD_SCOPES=global_law ENABLE_RERANKING=false uvicorn app.shard_server:app --port 8101
+    SHARD_SCOPES=labour_law,state_law ENABLE_RERANKING=false uvicorn app.shard_server:app --port 8102
+    SHARD_SERVERS=http://127.0.0.1:8101,http://127.0.0.1:8102 uvicorn app.main:app
+"""
+import time
+from typing import List, Optional
+
+import numpy as np
+from fastapi import FastAPI
+from pydantic import BaseModel
+
+from app.generations import GenerationWatcher
+from app.hybrid_retriever import hybrid_retriever
+from app.settings import settings
+
+app = FastAPI(title="LegalAid RAG shard", version="2.0")
+
+SERVED_SCOPES = [s.strip() for s in settings.SHARD_SCOPES.split(",") if s.strip()]
+
+
+class ShardSearchIn(BaseModel):
+    queries: List[str]
+    k: int = 30
+    scope_filter: Optional[List[str]] = None
+    vectors: Optional[List[List[float]]] = None  # query embeddings from the coordinator
+
+
+@app.on_event("startup")
+def watch_index_generations():
+    if settings.GENERATION_POLL_S > 0:
+        GenerationWatcher(
+            hybrid_retriever.index_root, hybrid_retriever.reload,
+            interval=settings.GENERATION_POLL_S,
+            loaded=hybrid_retriever.generation_info.get("name"),
+        ).start()
+
+
+@app.get("/shard/health")
+def shard_health():
+    retriever = hybrid_retriever.active
+    return {
+        "ok": True,
+        "scopes": SERVED_SCOPES or list(retriever.generation.shards),
+        "chunks": sum(len(s.rows) for s in retriever.generation.shards_for(SERVED_SCOPES or None)),
+        "generation": retriever.generation_info.get("name"),
+    }
+
+
+@app.post("/shard/search")
+def shard_search(req: ShardSearchIn):
+    """This node's ranked lists (section, faiss<i>, bm25<i>) for the query variants; no rerank."""
+    t0 = time.perf_counter()
+    retriever = hybrid_retriever.active
+    scopes = req.scope_filter
+    if SERVED_SCOPES:
+        scopes = [s for s in (scopes or SERVED_SCOPES) if s in SERVED_SCOPES]
+        if not scopes:
+            return {"lists": {}, "took_ms": 0.0}
+    q_vecs = None
+    if settings.USE_FAISS:
+        if req.vectors:
+            q_vecs = np.asarray(req.vectors, dtype="float32")
+        elif settings.USE_EMBEDDINGS:
+            q_vecs = retriever._get_query_embeddings(req.queries)
+    lists = retriever.candidate_lists(
+        req.queries, scope_filter=scopes, signals=retriever.matcher.scan(req.queries[0]),
+        q_vecs=q_vecs, k=req.k,
+    )
+    return {"lists": lists, "took_ms": round((time.perf_counter() - t0) * 1000, 2)}
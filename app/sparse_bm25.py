@@ -0,0 +1,56 @@
+# app/sparse_bm25.py
+"""
+BM25Okapi scoring as a sparse matrix product.
+
+The per-(term, doc) BM25 weights of a fitted rank_bm25.BM25Okapi are laid out
+once as a vocab x docs CSR matrix; scoring any number of queries is then one
+(queries x vocab) @ (vocab x docs) product instead of a Python loop per query.
+Scores are identical to BM25Okapi.get_scores(); with `stats` (a corpus-wide
+IDF/avgdl, see index_state.CorpusStats) a shard scores exactly as the whole
+corpus would.
+"""
+from __future__ import annotations
+from typing import Dict, List, Sequence
+
+import numpy as np
+from scipy.sparse import csr_matrix
+
+
+class SparseBM25:
+    def __init__(self, bm25, stats=None):
+        self.vocab: Dict[str, int] = {}
+        rows, cols, vals = [], [], []
+        src = stats or bm25
+        k1, b, avgdl = src.k1, src.b, src.avgdl
+        for d, (freqs, dl) in enumerate(zip(bm25.doc_freqs, bm25.doc_len)):
+            norm = k1 * (1 - b + b * dl / avgdl)
+            for term, tf in freqs.items():
+                idf = stats.idf_of(term) if stats else (bm25.idf.get(term) or 0)
+                if not idf:
+                    continue
+                rows.append(self.vocab.setdefault(term, len(self.vocab)))
+                cols.append(d)
+                vals.append(idf * tf * (k1 + 1) / (tf + norm))
+        self.n_docs = len(bm25.doc_freqs)
+        self.weights = csr_matrix(
+            (np.asarray(vals, dtype="float64"), (rows, cols)),
+            shape=(len(self.vocab), self.n_docs),
+        )
+
+    def query_matrix(self, queries: Sequence[List[str]]) -> csr_matrix:
+        """Term counts per query (a term repeated in the query counts twice, as in get_scores)."""
+        rows, cols = [], []
+        for i, tokens in enumerate(queries):
+            for t in tokens:
+                j = self.vocab.get(t)
+                if j is not None:
+                    rows.append(i)
+                    cols.append(j)
+        data = np.ones(len(rows), dtype="float64")
+        return csr_matrix((data, (rows, cols)), shape=(len(queries), len(self.vocab)))
+
+    def get_scores_batch(self, queries: Sequence[List[str]]) -> np.ndarray:
+        """(len(queries), n_docs) dense score matrix."""
+        if not queries:
+            return np.zeros((0, self.n_docs))
+        return (self.query_matrix(queries) @ self.weights).toarray()
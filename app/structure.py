@@ -0,0 +1,203 @@
+# app/structure.py
+"""
+Structural parsing of statutes into act -> chapter -> section -> clause units.
+
+Ingest runs every document through StructureParser, indexes the small clause
+units, and writes the tree (data/index/structure.json) so retrieval can return
+the parent section by id instead of stitching neighbouring chunks by regex.
+
+Node ids:
+    <act>                         act
+    <act>/ch-XVII                 chapter
+    <act>/s-303                   section
+    <act>/s-303/intro             section heading + text before the first clause
+    <act>/s-303/(1)               sub-section
+    <act>/s-303/(1)(a)            clause of a sub-section
+    <act>/preamble                text before the first section
+"""
+from __future__ import annotations
+import re
+from typing import Dict, Iterator, List, Optional
+
+# Inline patterns: text is whitespace-collapsed by app.chunking._clean()
+_CHAPTER_RE = re.compile(r"(?:(?<=\s)|^)(?:CHAPTER|Chapter)\s+([IVXLC]+|\d+)\b")
+_SECTION_RE = re.compile(r"(?:(?<=\s)|^)(\d{1,4})([A-Z]{0,2})\.\s+(?=[A-Z])")
+_SUBSEC_RE = re.compile(r"(?:(?<=\s)|^)\((\d{1,3}[A-Z]?)\)\s")
+_CLAUSE_RE = re.compile(r"(?:(?<=\s)|^)\(([a-z]{1,4})\)\s")
+# A number ending a cross-reference ("punishable under section 9. The court ...")
+# has the shape of a heading; the word before it gives it away
+_XREF_BEFORE_RE = re.compile(r"(?:\b(?:sections?|sec\.|ss?\.|under|of|and|to)|,)\s*$", re.I)
+
+# Consecutive section numbers rarely jump further than this; larger jumps are
+# usually years or cross-references ("Act, 2019. The ...")
+MAX_SECTION_GAP = 40
+MAX_FIRST_SECTION = 1000  # excerpts may start mid-act, but never at a year
+MIN_UNIT_WORDS = 12
+
+
+def act_id_for(name: str) -> str:
+    return re.sub(r"[^a-z0-9]+", "_", name.lower()).strip("_") or "act"
+
+
+def section_id(act_id: str, num: str) -> str:
+    return f"{act_id}/s-{num}"
+
+
+class StructureParser:
+    """
+    Stateful per-act parser: feed it the document text (in one or several
+    pieces) and it yields clause-level units carrying their ancestry.
+    """
+
+    def __init__(self, act_id: str):
+        self.act_id = act_id
+        self.chapter_id: Optional[str] = None
+        self._last_num = 0
+        self._section_count = 0
+
+    def _accept(self, num: int) -> bool:
+        if self._section_count == 0:
+            return num <= MAX_FIRST_SECTION
+        return self._last_num <= num <= self._last_num + MAX_SECTION_GAP
+
+    def _headings(self, text: str) -> List[re.Match]:
+        out = []
+        for m in _SECTION_RE.finditer(text):
+            num = int(m.group(1))
+            if _XREF_BEFORE_RE.search(text[max(0, m.start() - 12):m.start()]):
+                continue
+            if self._accept(num):
+                out.append(m)
+                self._last_num = num
+                self._section_count += 1
+        return out
+
+    def units(self, text: str) -> Iterator[Dict]:
+        """Yield {node_id, section_id, chapter_id, section_number, section_heading, text}."""
+        heads = self._headings(text)
+        if not heads:
+            # No section headings: whole piece is preamble / free text
+            yield from self._split_free(text)
+            return
+        if heads[0].start() > 0:
+            yield from self._split_free(text[:heads[0].start()])
+        for i, m in enumerate(heads):
+            end = heads[i + 1].start() if i + 1 < len(heads) else len(text)
+            yield from self._split_section(m, text[m.start():end])
+
+    def _note_chapters(self, text: str) -> None:
+        for m in _CHAPTER_RE.finditer(text):
+            self.chapter_id = f"{self.act_id}/ch-{m.group(1)}"
+
+    def _split_free(self, text: str) -> Iterator[Dict]:
+        self._note_chapters(text)
+        if text.strip():
+            yield {
+                "node_id": f"{self.act_id}/preamble",
+                "section_id": None,
+                "chapter_id": self.chapter_id,
+                "section_number": None,
+                "section_heading": None,
+                "text": text.strip(),
+            }
+
+    def _split_section(self, head: re.Match, text: str) -> Iterator[Dict]:
+        num = head.group(1) + head.group(2)
+        sid = section_id(self.act_id, num)
+        hlen = head.end() - head.start()  # text starts at the heading
+        body = text[hlen:]
+        # Heading = text up to the first full stop of the title, e.g. "303. Theft."
+        title_m = re.match(r"([^.]{1,160})\.", body)
+        heading = f"{num}. {title_m.group(1).strip()}" if title_m else f"{num}."
+        # A chapter heading that trails this section belongs to the next one
+        chapter_here = self.chapter_id
+
+        pieces: List[List] = [["intro", 0]]  # [label, start offset in text]
+        subsec = None
+        for m in sorted(
+            list(_SUBSEC_RE.finditer(text, hlen)) + list(_CLAUSE_RE.finditer(text, hlen)),
+            key=lambda m: m.start(),
+        ):
+            if m.re is _SUBSEC_RE:
+                subsec = f"({m.group(1)})"
+                pieces.append([subsec, m.start()])
+            else:
+                pieces.append([f"{subsec or ''}({m.group(1)})", m.start()])
+
+        units: List[Dict] = []
+        carry = ""
+        for j, (label, start) in enumerate(pieces):
+            end = pieces[j + 1][1] if j + 1 < len(pieces) else len(text)
+            chunk = text[start:end].strip()
+            if not chunk:
+                continue
+            # Fold very small pieces into a neighbour: a short heading/intro leads
+            # the next unit, a short clause joins the previous one
+            if len(chunk.split()) < MIN_UNIT_WORDS and j + 1 < len(pieces) and not units:
+                carry = f"{carry} {chunk}".strip()
+                continue
+            if carry:
+                chunk = f"{carry} {chunk}"
+                carry = ""
+            if units and len(chunk.split()) < MIN_UNIT_WORDS:
+                units[-1]["text"] += " " + chunk
+                continue
+            units.append({
+                "node_id": f"{sid}/{label}",
+                "section_id": sid,
+                "chapter_id": chapter_here,
+                "section_number": num,
+                "section_heading": heading,
+                "text": chunk,
+            })
+        self._note_chapters(text)
+        yield from units
+
+
+class StructureTree:
+    """
+    The act/chapter/section/clause tree, built from indexed records and
+    serialised to structure.json as {node_id: node}.
+    """
+
+    def __init__(self, nodes: Optional[Dict[str, Dict]] = None):
+        self.nodes: Dict[str, Dict] = nodes or {}
+
+    def _node(self, node_id: str, kind: str, parent: Optional[str], **fields) -> Dict:
+        node = self.nodes.get(node_id)
+        if node is None:
+            node = {"type": kind, "parent": parent, "children": [], "rows": [], **fields}
+            self.nodes[node_id] = node
+            if parent is not None:
+                self.nodes[parent]["children"].append(node_id)
+        return node
+
+    def add(self, row: int, r: Dict) -> None:
+        act = r.get("act_id")
+        if not act or not r.get("node_id"):
+            return
+        self._node(act, "act", None, title=r.get("act_name"), scope=r.get("scope"), source=r.get("source"))
+        parent = act
+        if r.get("chapter_id"):
+            self._node(r["chapter_id"], "chapter", act, num=r["chapter_id"].rsplit("-", 1)[-1])
+            parent = r["chapter_id"]
+        if r.get("section_id"):
+            self._node(r["section_id"], "section", parent,
+                       num=r.get("section_number"), heading=r.get("section_heading"))
+            parent = r["section_id"]
+        leaf = self._node(r["node_id"], "clause", parent)
+        if row not in leaf["rows"]:
+            leaf["rows"].append(row)
+
+    def rows_under(self, node_id: str) -> List[int]:
+        """All chunk rows below node_id, in document order."""
+        node = self.nodes.get(node_id)
+        if node is None:
+            return []
+        rows = list(node["rows"])
+        for child in node["children"]:
+            rows.extend(self.rows_under(child))
+        return rows
+
+    def sections_numbered(self, num: str) -> List[str]:
+        return [nid for nid, n in self.nodes.items() if n["type"] == "section" and n.get("num") == num]
@@ -0,0 +1,251 @@
+# app/user_index.py
+"""
+Per-user upload sub-indexes.
+
+Each user_id gets its own small BM25 index and flat vector matrix instead of
+sharing the law corpus's meta/BM25/FAISS, so law queries never scan other
+users' chunks and hybrid_search scores only the caller's uploads. A handful of
+uploaded chunks has no usable IDF of its own, so BM25 borrows the law corpus's
+IDF and average length, which also keeps user scores comparable to law scores.
+
+Sub-indexes are written through to disk on every upload (one SegmentStore per
+user under data/index/users/<key>/). An upload whose content is already in the
+shared ChunkStore is persisted as a single reference line {"ref": sha, ...}
+and expanded from the blob on load. Evicting a sub-index from memory is free: the
+store drops it after USER_INDEX_TTL_S of inactivity, or least-recently-used
+first once the resident total passes USER_INDEX_MAX_MB, and reloads it from
+disk on the user's next request.
+"""
+from __future__ import annotations
+import hashlib
+import threading
+import time
+from collections import Counter, OrderedDict
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+from app.chunk_store import ChunkStore, upload_records
+from app.index_state import CorpusStats
+from app.segment_store import MANIFEST_NAME, SegmentStore
+
+
+class UserIndex:
+    """One user's uploads: meta rows, BM25 over them and their vectors. Never mutated."""
+
+    def __init__(self, user_id: str, meta: List[Dict], vectors: Optional[np.ndarray] = None,
+                 vector_rows: Optional[np.ndarray] = None):
+        self.user_id = user_id
+        self.meta = meta
+        self.doc_freqs = [Counter(doc["text"].split()) for doc in meta]
+        self.doc_len = np.array([sum(f.values()) for f in self.doc_freqs], dtype="float64")
+        # term -> (docs containing it, its tf in each), so a query touches only its terms' postings
+        postings: Dict[str, List[List[int]]] = {}
+        for d, freqs in enumerate(self.doc_freqs):
+            for term, tf in freqs.items():
+                docs_tfs = postings.setdefault(term, [[], []])
+                docs_tfs[0].append(d)
+                docs_tfs[1].append(tf)
+        self.postings = {
+            term: (np.array(docs, dtype="int64"), np.array(tfs, dtype="float64"))
+            for term, (docs, tfs) in postings.items()
+        }
+        self.vectors = vectors
+        self.vector_rows = vector_rows
+        # Rough resident size: text (plus BM25 term dicts of similar size) and vectors
+        self.nbytes = 3 * sum(len(doc["text"]) for doc in meta) + (vectors.nbytes if vectors is not None else 0)
+        self.last_used = time.monotonic()
+
+    def with_documents(self, new_meta: List[Dict], vectors: Optional[np.ndarray] = None,
+                       vector_rows: Optional[Sequence[int]] = None) -> "UserIndex":
+        all_vecs, all_rows = self.vectors, self.vector_rows
+        if vectors is not None and len(vectors):
+            rows = np.arange(len(new_meta)) if vector_rows is None else np.asarray(vector_rows, dtype="int64")
+            rows = rows + len(self.meta)
+            all_vecs = vectors if all_vecs is None else np.vstack([all_vecs, vectors])
+            all_rows = rows if all_rows is None else np.concatenate([all_rows, rows])
+        return UserIndex(self.user_id, self.meta + new_meta, all_vecs, all_rows)
+
+    def _file_mask(self, filename: Optional[str]) -> Optional[np.ndarray]:
+        """Rows uploaded as `filename` (None: no filter)."""
+        if not filename:
+            return None
+        return np.array([doc.get("filename") == filename for doc in self.meta], dtype=bool)
+
+    def search_bm25(self, queries: List[str], k: int = 30, corpus: Optional[CorpusStats] = None,
+                    filename: Optional[str] = None) -> List[List[Dict]]:
+        """BM25 with the IDF/avgdl/k1/b of `corpus`; terms it never saw count as its rarest."""
+        if not self.meta:
+            return [[] for _ in queries]
+        mask = self._file_mask(filename)
+        if corpus is not None:
+            idf, avgdl, k1, b = corpus.idf, corpus.avgdl, corpus.k1, corpus.b
+            unseen = corpus.unseen_idf
+        else:
+            idf, avgdl, k1, b, unseen = {}, float(self.doc_len.mean()) or 1.0, 1.5, 0.75, 1.0
+        norm = k1 * (1 - b + b * self.doc_len / avgdl)
+        out = []
+        for q in queries:
+            scores = np.zeros(len(self.meta))
+            for term in q.split():
+                if term not in self.postings:
+                    continue
+                docs, tf = self.postings[term]
+                scores[docs] += idf.get(term, unseen) * tf * (k1 + 1) / (tf + norm[docs])
+            order = np.argsort(scores)[::-1]
+            if mask is not None:
+                order = order[mask[order]]
+            out.append([
+                {**self.meta[idx], "score": float(scores[idx]), "retrieval_type": "bm25"}
+                for idx in order[:k]
+            ])
+        return out
+
+    def search_vectors(self, query_vecs: Optional[np.ndarray], k: int = 30,
+                       filename: Optional[str] = None) -> List[List[Dict]]:
+        if self.vectors is None or query_vecs is None:
+            return [[]]
+        mask = self._file_mask(filename)
+        scores = query_vecs @ self.vectors.T  # inner product, as IndexFlatIP
+        out = []
+        for row in scores:
+            order = np.argsort(row)[::-1]
+            if mask is not None:
+                order = order[mask[self.vector_rows[order]]]
+            out.append([
+                {**self.meta[self.vector_rows[j]], "score": float(row[j]), "retrieval_type": "faiss"}
+                for j in order[:k]
+            ])
+        return out
+
+
+class UserIndexStore:
+    """user_id -> UserIndex, resident while in use, spilled (already on disk) when idle or over budget."""
+
+    def __init__(self, root: Path, ttl_s: float, max_bytes: int, compact_min_deltas: int = 0,
+                 chunks: ChunkStore = None):
+        self.root = Path(root)
+        self.chunks = chunks
+        self.ttl_s = ttl_s
+        self.max_bytes = max_bytes
+        self.compact_min_deltas = compact_min_deltas
+        self._resident: "OrderedDict[str, UserIndex]" = OrderedDict()  # least recently used first
+        self._lock = threading.Lock()
+        self._write_locks: Dict[str, threading.Lock] = {}
+        # One SegmentStore per user for the life of the process: constructing one sweeps
+        # unlisted segment dirs, which must never run beside that user's append()
+        self._stores: Dict[str, SegmentStore] = {}
+
+    def _dir(self, user_id: str) -> Path:
+        return self.root / hashlib.sha1(user_id.encode("utf-8")).hexdigest()[:16]
+
+    def _store(self, user_id: str) -> SegmentStore:
+        with self._lock:
+            store = self._stores.get(user_id)
+            if store is None:
+                store = self._stores[user_id] = SegmentStore(self._dir(user_id))
+            return store
+
+    def expand_ref(self, ref: Dict, with_vectors: bool = True):
+        """(meta rows, vectors, vector rows) of a reference to a shared blob; None if the blob is gone."""
+        blob = self.chunks.get(ref["ref"], with_vectors) if self.chunks else None
+        if blob is None:
+            return None
+        texts, vectors, rows, _ = blob
+        content_hash = ref.get("content_hash", ref["ref"])  # refs written before blob_key named the blob by hash
+        return upload_records(texts, ref["filename"], ref["scope"], ref["user_id"], content_hash), vectors, rows
+
+    def _load(self, user_id: str, with_vectors: bool) -> UserIndex:
+        meta, vecs, rows = [], [], []
+        for entry, lines, v, r in self._store(user_id).iter_segments(with_vectors=with_vectors):
+            vec_of = dict(zip(r.tolist(), v)) if v is not None else {}
+            for i, line in enumerate(lines):
+                if "ref" not in line:
+                    if i in vec_of:
+                        vecs.append(vec_of[i][None, :])
+                        rows.append(np.array([len(meta)]))
+                    meta.append(line)
+                    continue
+                expanded = self.expand_ref(line, with_vectors)
+                if expanded is None:
+                    print(f"[user-index] {user_id}: blob {line['ref'][:12]} missing; skipping {line['filename']}")
+                    continue
+                m, bv, br = expanded
+                if bv is not None:
+                    vecs.append(bv)
+                    rows.append(br + len(meta))
+                meta.extend(m)
+        return UserIndex(
+            user_id, meta,
+            np.vstack(vecs) if vecs else None,
+            np.concatenate(rows) if rows else None,
+        )
+
+    @property
+    def resident_bytes(self) -> int:
+        return sum(ix.nbytes for ix in self._resident.values())
+
+    def _evict(self) -> None:
+        """Drop idle sub-indexes, then the least recently used until under the memory cap."""
+        now = time.monotonic()
+        for user_id in [u for u, ix in self._resident.items() if now - ix.last_used > self.ttl_s]:
+            del self._resident[user_id]
+            print(f"[user-index] evicted {user_id} (idle > {self.ttl_s:.0f}s)")
+        while len(self._resident) > 1 and self.resident_bytes > self.max_bytes:
+            user_id, _ = self._resident.popitem(last=False)
+            print(f"[user-index] evicted {user_id} (memory cap {self.max_bytes / 1e6:.0f} MB)")
+
+    def get(self, user_id: Optional[str], with_vectors: bool = True) -> Optional[UserIndex]:
+        """The user's sub-index, reloaded from disk if it was evicted; None if they never uploaded."""
+        if not user_id:
+            return None
+        with self._lock:
+            ix = self._resident.get(user_id)
+            if ix is not None:
+                ix.last_used = time.monotonic()
+                self._resident.move_to_end(user_id)
+                self._evict()
+                return ix
+        if not (self._dir(user_id) / MANIFEST_NAME).exists():
+            return None
+        ix = self._load(user_id, with_vectors)
+        with self._lock:
+            ix = self._resident.setdefault(user_id, ix)
+            self._resident.move_to_end(user_id)
+            self._evict()
+        print(f"[user-index] loaded {user_id} from disk ({len(ix.meta)} chunks)")
+        return ix
+
+    def add(self, user_id: str, meta: List[Dict], vectors: Optional[np.ndarray] = None,
+            vector_rows: Optional[Sequence[int]] = None, with_vectors: bool = True,
+            ref: Optional[Dict] = None) -> UserIndex:
+        """
+        Persist the upload as a delta of the user's store, then publish the grown sub-index.
+        With `ref`, only that reference line is persisted (the rows live in the shared blob).
+        """
+        with self._lock:
+            write_lock = self._write_locks.setdefault(user_id, threading.Lock())
+        with write_lock:  # one writer per user; other users' uploads proceed in parallel
+            current = self.get(user_id, with_vectors) or UserIndex(user_id, [])
+            store = self._store(user_id)
+            if ref is not None:
+                store.append([ref])
+            else:
+                store.append(meta, vectors, vector_rows)
+            if self.compact_min_deltas and len(store.deltas) >= self.compact_min_deltas:
+                store.compact()
+            ix = current.with_documents(meta, vectors, vector_rows)
+            with self._lock:
+                self._resident[user_id] = ix
+                self._resident.move_to_end(user_id)
+                self._evict()
+        return ix
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "resident_users": len(self._resident),
+                "resident_mb": round(self.resident_bytes / 1e6, 2),
+                "max_mb": round(self.max_bytes / 1e6, 2),
+            }
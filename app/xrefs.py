@@ -0,0 +1,88 @@
+# app/xrefs.py
+"""
+Section-to-section cross references ("punishable under section 303",
+"read with section 61", "as defined in section 2").
+
+Ingest collects the references of every chunk per section, resolves them
+against the section index and writes a one-hop adjacency list to
+data/index/xrefs.json: {section_id: [[target_section_id, kind], ...]}.
+The RAG context builder uses it to pull referenced sections into the prompt.
+"""
+from __future__ import annotations
+import re
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from app.citations import SectionIndex
+
+_REF_RE = re.compile(
+    r"\b(?P<lead>punishable\s+under|punished\s+under|read\s+with|"
+    r"(?:as\s+)?defined\s+in|(?:assigned|given)\s+to\s+it\s+in|under)?\s*"
+    r"\b(?:sections?|secs?\.|s\.)\s*"
+    r"(?P<nums>\d{1,4}[A-Z]?(?:\s*(?:,|and|or)\s*\d{1,4}[A-Z]?)*)",
+    re.I,
+)
+_NUM_RE = re.compile(r"\d{1,4}[A-Z]?")
+_OF_ACT_RE = re.compile(r"^\s*(?:of|under)\s+(?:the\s+)?(.{0,80})", re.I)
+
+# Most useful first when the prompt budget only allows a few
+KIND_RANK = {"punishable_under": 0, "defined_in": 1, "read_with": 2, "ref": 3}
+
+
+def _kind(lead: Optional[str]) -> str:
+    lead = " ".join((lead or "").lower().split())
+    if lead.startswith("punish"):
+        return "punishable_under"
+    if lead == "read with":
+        return "read_with"
+    if "defined" in lead or lead.endswith(" in"):
+        return "defined_in"
+    return "ref"
+
+
+def extract_refs(text: str) -> Iterator[Tuple[str, str, str]]:
+    """Yield (section number, kind, text following the reference)."""
+    for m in _REF_RE.finditer(text or ""):
+        kind = _kind(m.group("lead"))
+        tail = text[m.end():m.end() + 100]
+        for num in _NUM_RE.findall(m.group("nums")):
+            yield num.upper(), kind, tail
+
+
+class XrefBuilder:
+    """Collects raw references per section at ingest; resolve() turns them into the adjacency list."""
+
+    def __init__(self):
+        self._raw: Dict[str, List[Tuple[str, str, str, str]]] = {}
+
+    def add(self, r: Dict) -> None:
+        sid = r.get("section_id")
+        if not sid:
+            return
+        for num, kind, tail in extract_refs(r.get("text", "")):
+            if num == str(r.get("section_number") or "").upper():
+                continue
+            self._raw.setdefault(sid, []).append((num, kind, tail, r.get("act_id") or ""))
+
+    def resolve(self, sec_index: SectionIndex) -> Dict[str, List[List[str]]]:
+        graph: Dict[str, List[List[str]]] = {}
+        for sid, refs in self._raw.items():
+            seen = set()
+            for num, kind, tail, act_id in refs:
+                # "section 35 of the BNSS" points into another act; otherwise the same act
+                act_ids = [act_id]
+                of_act = _OF_ACT_RE.match(tail)
+                if of_act:
+                    act, ids = sec_index.acts_in(of_act.group(1))
+                    if act:
+                        act_ids = ids
+                targets = sec_index.lookup(num, act_ids)
+                if not targets or targets[0]["section_id"] == sid:
+                    continue
+                target = targets[0]["section_id"]
+                if target in seen:
+                    continue
+                seen.add(target)
+                graph.setdefault(sid, []).append([target, kind])
+            if sid in graph:
+                graph[sid].sort(key=lambda e: KIND_RANK.get(e[1], 9))
+        return graph
@@ -1,5 +1,10 @@
 """
 Quick script to rebuild FAISS index with better Python 3.13 compatibility
+
+Rebuilds the per-scope faiss.<scope>.index shards from the mmapped
+embeddings.npy, replacing each by rename, and publishes them as a new index
+generation so a running API hot-swaps them in. Files are never rewritten in
+place: published generations hard-link them.
 """
 import sys
 from pathlib import Path
@@ -7,11 +12,14 @@ sys.path.append(str(Path(__file__).resolve().parent))
 
 import json
 import numpy as np
-from openai import OpenAI
+from app.embedding import write_faiss_shards
+from app.generations import active_dir, publish, read_manifest
 from app.settings import settings
 
+INDEX = Path("data/index")
+
 print("Loading metadata...")
-meta_path = Path("data/index/meta.jsonl")
+meta_path = INDEX / "meta.jsonl"
 meta = []
 with open(meta_path, "r", encoding="utf-8") as f:
     meta = [json.loads(line) for line in f]
@@ -19,61 +27,93 @@ with open(meta_path, "r", encoding="utf-8") as f:
 print(f"Found {len(meta)} chunks")
 
 # Use a simpler approach - save embeddings as numpy array instead of FAISS first
-embeddings_file = Path("data/index/embeddings.npy")
+embeddings_file = INDEX / "embeddings.npy"
 
 if not embeddings_file.exists():
-    print("Generating embeddings...")
-    client = OpenAI(
-        base_url=settings.OPENROUTER_BASE_URL,
-        api_key=settings.OPENROUTER_API_KEY,
-    )
-    
     texts = [m["text"] for m in meta]
-    embeddings = []
-    
-    batch_size = 128
-    for i in range(0, len(texts), batch_size):
-        batch = texts[i:i+batch_size]
-        print(f"  Embedding batch {i//batch_size + 1}/{(len(texts)-1)//batch_size + 1}")
-        resp = client.embeddings.create(
-            model=settings.EMBED_MODEL,
-            input=batch
+
+    if settings.EMBED_BACKEND == "local":
+        # Same local model as the query path; workers write straight into the memmap
+        from app.embedding import local_embedding_dim, create_embedding_file, embed_into_memmap
+        print(f"Generating embeddings locally with {settings.EMBED_MODEL}...")
+        tmp_file = embeddings_file.with_name("embeddings.tmp.npy")
+        X = create_embedding_file(tmp_file, len(texts), local_embedding_dim())
+        del X
+        embed_into_memmap(texts, list(range(len(texts))), tmp_file, workers=settings.EMBED_WORKERS or None)
+        tmp_file.replace(embeddings_file)
+        X = np.load(embeddings_file, mmap_mode="r")
+    else:
+        import hashlib
+        from openai import OpenAI
+        from app.embedding import embed_texts_remote
+        print("Generating embeddings...")
+        client = OpenAI(
+            base_url=settings.OPENROUTER_BASE_URL,
+            api_key=settings.OPENROUTER_API_KEY,
         )
-        embeddings.extend([d.embedding for d in resp.data])
-    
-    X = np.array(embeddings, dtype="float32")
-    # L2 normalize
-    norms = np.linalg.norm(X, axis=1, keepdims=True)
-    norms = np.where(norms == 0, 1.0, norms)
-    X = X / norms
-    
-    print(f"Saving embeddings to {embeddings_file}")
-    np.save(embeddings_file, X)
+        # Checkpointed by chunk hash: a rerun after a failure resumes where it stopped
+        hashes = [m.get("id") or hashlib.md5(m["text"].encode("utf-8")).hexdigest()[:12] for m in meta]
+        X = embed_texts_remote(
+            client, texts, hashes,
+            concurrency=settings.EMBED_CONCURRENCY,
+            rate_per_s=settings.EMBED_RATE_LIMIT,
+        )
+
+        print(f"Saving embeddings to {embeddings_file}")
+        tmp_file = embeddings_file.with_name("embeddings.tmp.npy")
+        np.save(tmp_file, X)
+        tmp_file.replace(embeddings_file)
 else:
     print("Loading existing embeddings...")
-    X = np.load(embeddings_file)
+    X = np.load(embeddings_file, mmap_mode="r")
 
 print(f"Embeddings shape: {X.shape}")
+if X.shape[0] != len(meta):
+    sys.exit(f"✗ embeddings.npy has {X.shape[0]} rows for {len(meta)} chunks; re-run ingest.")
+
+# Per-scope row ranges as ingest wrote them; derived from each row's scope without shards.json
+shards_path = INDEX / "shards.json"
+if shards_path.exists():
+    layout = json.loads(shards_path.read_text(encoding="utf-8"))
+else:
+    layout = {}
+    for row, m in enumerate(meta):
+        ranges = layout.setdefault(m.get("scope", "unknown"), {"rows": []})["rows"]
+        if ranges and ranges[-1][1] == row:
+            ranges[-1][1] += 1
+        else:
+            ranges.append([row, row + 1])
 
 # Now try to build FAISS index
 print("Building FAISS index...")
 try:
     import faiss
-    
-    # Try IndexFlatIP (simplest, should work)
-    index = faiss.IndexFlatIP(X.shape[1])
-    index.add(X)
-    
-    faiss_path = Path("data/index/faiss.index")
-    print(f"Writing index to {faiss_path}")
-    faiss.write_index(index, str(faiss_path))
-    print("✓ FAISS index created successfully")
-    
+
+    # IndexFlatIP per scope (simplest, should work); the API loads these, not a whole-corpus index
+    shard_files = write_faiss_shards(INDEX, X, {s: info["rows"] for s, info in layout.items()})
+    for scope, name in shard_files.items():
+        layout[scope]["faiss"] = name
+    tmp = shards_path.with_suffix(".tmp")
+    tmp.write_text(json.dumps(layout), encoding="utf-8")
+    tmp.replace(shards_path)
+    print(f"✓ {len(shard_files)} FAISS shard(s): {', '.join(shard_files.values())}")
+    (INDEX / "faiss.index").unlink(missing_ok=True)  # stale whole-corpus copy from older ingests
+
     # Test loading
     print("Testing load...")
-    test_idx = faiss.read_index(str(faiss_path))
-    print(f"✓ Index loaded successfully: {test_idx.ntotal} vectors")
-    
+    total = sum(faiss.read_index(str(INDEX / name)).ntotal for name in shard_files.values())
+    print(f"✓ Shards loaded successfully: {total} vectors")
+
+    # Publish the rebuilt files with the rest of the live generation
+    previous = read_manifest(active_dir(INDEX))
+    names = set(previous.get("files", {})) or {
+        p.name for p in INDEX.glob("*") if p.is_file() and p.suffix in (".json", ".jsonl", ".npy")
+    }
+    names = (names - {"faiss.index"}) | {"meta.jsonl", "embeddings.npy", "shards.json", *shard_files.values()}
+    info = {k: previous[k] for k in ("rows", "chunker", "embed_model") if k in previous}
+    gen_dir = publish(INDEX, [INDEX / n for n in sorted(names)], info, keep=settings.GENERATIONS_KEEP)
+    print(f"✓ Published generation {gen_dir.name} -> {gen_dir}")
+
 except MemoryError as e:
     print(f"✗ MemoryError building FAISS: {e}")
     print("Python 3.13 has issues with FAISS. Workaround:")
@@ -0,0 +1,92 @@
+# scripts/fake_embed_server.py
+"""
+Local stand-in for an OpenAI-compatible embeddings API (stdlib only).
+
+Returns deterministic pseudo-random vectors derived from each input's hash, so
+ingest / rebuild_faiss.py can be exercised without network or API keys.
+--fail-after N makes every request after the first N return HTTP 500, which is
+handy for checking that a rerun resumes from the checkpoint.
+
+Usage:
+    python scripts/fake_embed_server.py --port 8765 --fail-after 3
+    OPENROUTER_BASE_URL=http://127.0.0.1:8765/v1 OPENROUTER_API_KEY=x \
+        EMBED_BACKEND=openrouter python scripts/ingest.py
+"""
+import argparse
+import hashlib
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def _vector(text: str, dim: int):
+    seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "big")
+    rng = random.Random(seed)
+    return [rng.uniform(-1.0, 1.0) for _ in range(dim)]
+
+
+def make_handler(dim: int, fail_after: int, latency: float):
+    state = {"served": 0}
+    lock = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            if not self.path.rstrip("/").endswith("/embeddings"):
+                self.send_error(404)
+                return
+            length = int(self.headers.get("Content-Length", 0))
+            body = json.loads(self.rfile.read(length) or b"{}")
+            with lock:
+                state["served"] += 1
+                n = state["served"]
+            if fail_after >= 0 and n > fail_after:
+                self.send_error(500, "simulated failure")
+                return
+            if latency:
+                time.sleep(latency)
+            inputs = body.get("input", [])
+            if isinstance(inputs, str):
+                inputs = [inputs]
+            payload = {
+                "object": "list",
+                "model": body.get("model", "fake"),
+                "data": [
+                    {"object": "embedding", "index": i, "embedding": _vector(t, dim)}
+                    for i, t in enumerate(inputs)
+                ],
+                "usage": {"prompt_tokens": 0, "total_tokens": 0},
+            }
+            out = json.dumps(payload).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(out)))
+            self.end_headers()
+            self.wfile.write(out)
+
+        def log_message(self, fmt, *args):
+            print(f"[fake-embed] {self.address_string()} {fmt % args}")
+
+    return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--fail-after", type=int, default=-1, help="Fail every request after the first N (-1 = never)")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds to sleep per request")
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(args.dim, args.fail_after, args.latency))
+    print(f"[fake-embed] serving dim={args.dim} on http://{args.host}:{args.port}/v1/embeddings")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
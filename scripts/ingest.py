@@ -9,11 +9,24 @@ sys.path.append(str(Path(__file__).resolve().parents[1]))
 import argparse
 import json
 import hashlib
-from typing import List, Dict
-
-from openai import OpenAI, AuthenticationError, BadRequestError
-
-from app.chunking import parse_pdf, parse_html, chunk_section
+from collections import Counter
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+try:
+    from openai import OpenAI, AuthenticationError, BadRequestError
+except ImportError:  # only required for EMBED_BACKEND=openrouter
+    OpenAI = None
+    AuthenticationError = BadRequestError = ()  # empty tuple: except clauses match nothing
+
+from app.chunking import (
+    parse_pdf, parse_html, chunk_section, chunk_by_tokens, load_embedding_tokenizer,
+    file_sha256, SEGMENT_WORDS,
+)
+from app.structure import StructureParser, StructureTree, act_id_for
+from app.citations import SectionIndex
+from app.definitions import DefinitionIndex
+from app.xrefs import XrefBuilder
+from app.generations import publish
 from app.settings import settings
 print(f"DEBUG CHECK: settings.USE_EMBEDDINGS is set to: {settings.USE_EMBEDDINGS}")
 RAW = Path("data/raw")
@@ -24,6 +37,23 @@ CHUNKS = PROC / "chunks.jsonl"
 META = INDEX / "meta.jsonl"
 FAISS_FILE = INDEX / "faiss.index"
 SECTION_MAP = INDEX / "section_map.json"
+EMBEDDINGS = INDEX / "embeddings.npy"
+ALIASES = INDEX / "aliases.json"
+STRUCTURE = INDEX / "structure.json"
+SECTION_INDEX = INDEX / "section_index.json"
+DEFINITIONS = INDEX / "definitions.json"
+XREFS = INDEX / "xrefs.json"
+SHARDS = INDEX / "shards.json"
+ACTS = INDEX / "acts.json"
+ACT_CENTROIDS = INDEX / "act_centroids.npy"
+MANIFEST = INDEX / "manifest.json"
+
+# Recorded in the manifest; when chunk boundaries change, unchanged files are
+# re-chunked (vectors are still reused by _hash)
+WORD_CHUNKER = f"seg{SEGMENT_WORDS}"
+STRUCTURE_VERSION = "tree1"
+# Terms kept per act in acts.json for the act router (most frequent first)
+ACT_PROFILE_TERMS = 4000
 
 # --- Allowed scope folders (fail-fast — never silently default) ---
 ALLOWED_SCOPES = {"global_law", "supreme_court", "labour_law", "state_law"}
@@ -48,11 +78,9 @@ def _openrouter_client() -> OpenAI:
     )
 
 
-def _embed_texts_openrouter(client: OpenAI, texts: List[str]):
-    import numpy as np
-    embs: List[List[float]] = []
-    B = 128
-    total = len(texts)
+def _embed_texts_openrouter(client: OpenAI, texts: List[str], hashes: List[str]):
+    """Concurrent, rate-limited, checkpointed remote embedding (see app.embedding)."""
+    from app.embedding import embed_texts_remote
 
     extra_headers = {}
     if getattr(settings, "OR_SITE_URL", None):
@@ -60,22 +88,254 @@ def _embed_texts_openrouter(client: OpenAI, texts: List[str]):
     if getattr(settings, "OR_SITE_NAME", None):
         extra_headers["X-Title"] = settings.OR_SITE_NAME
 
-    for i in range(0, total, B):
-        batch = texts[i:i+B]
-        resp = client.embeddings.create(
-            model=settings.EMBED_MODEL,
-            input=batch,
-            extra_headers=extra_headers or None,
-        )
-        embs.extend([d.embedding for d in resp.data])
-        print(f"  • embedded {min(i + len(batch), total)}/{total}")
+    return embed_texts_remote(
+        client, texts, hashes,
+        concurrency=settings.EMBED_CONCURRENCY,
+        rate_per_s=settings.EMBED_RATE_LIMIT,
+        extra_headers=extra_headers,
+    )
 
-    X = np.array(embs, dtype="float32")
-    # Normalize with safety check to avoid division by zero
-    norms = np.linalg.norm(X, axis=1, keepdims=True)
-    norms = np.where(norms == 0, 1.0, norms)
-    X = X / norms
-    return X
+
+# ---- Incremental manifest ----
+def _load_manifest() -> Dict:
+    """file path -> {sha256, scope, chunk_ids, rows, deduped}. Empty if missing/corrupt."""
+    if MANIFEST.exists():
+        try:
+            return json.loads(MANIFEST.read_text(encoding="utf-8"))
+        except Exception as e:
+            print(f"[manifest] unreadable ({e}); doing a full rebuild.")
+    return {"files": {}}
+
+
+class _PreviousIndex:
+    """
+    Random access to the last ingest's meta rows and vectors without loading
+    them: only line offsets and a chunk-id -> row map are kept in memory.
+    """
+
+    def __init__(self, enabled: bool = True):
+        self.offsets: List[int] = []
+        self.row_of: Dict[str, int] = {}
+        self.vectors = None
+        self._f = None
+        if not enabled or not META.exists():
+            return
+        self._f = open(META, "rb")
+        pos = 0
+        for row, line in enumerate(self._f):
+            self.offsets.append(pos)
+            pos += len(line)
+            self.row_of.setdefault(json.loads(line)["id"], row)
+        if EMBEDDINGS.exists():
+            import numpy as np
+            X = np.load(EMBEDDINGS, mmap_mode="r")
+            if X.shape[0] == len(self.offsets):
+                self.vectors = X
+            else:
+                print(f"[manifest] {EMBEDDINGS.name} has {X.shape[0]} rows but meta has {len(self.offsets)}; ignoring stored vectors.")
+
+    def records(self, start: int, end: int) -> Iterator[Dict]:
+        self._f.seek(self.offsets[start])
+        for _ in range(start, end):
+            yield json.loads(self._f.readline())
+
+    def vector(self, chunk_id: str):
+        if self.vectors is None or chunk_id not in self.row_of:
+            return None
+        return self.vectors[self.row_of[chunk_id]]
+
+    def close(self) -> None:
+        self.vectors = None
+        if self._f:
+            self._f.close()
+
+
+class _IndexWriter:
+    """
+    Streams record batches into chunks.jsonl, meta.jsonl, embeddings.npy,
+    the section map, the per-act routing profiles and the manifest. Everything is written to temp files and swapped in by
+    commit(), so a failed run leaves the old index intact. The per-scope FAISS
+    shards are built at commit from the mmapped embeddings.npy, so no vectors
+    are held in memory while streaming.
+    """
+
+    def __init__(self, with_meta: bool, chunker: str, dim: Optional[int] = None):
+        self.chunker = chunker
+        self.rows = 0
+        self.scope_counts: Counter = Counter()
+        self.secmap = _SectionMapBuilder()
+        self.tree = StructureTree()
+        self.definitions = DefinitionIndex()
+        self.xrefs = XrefBuilder()
+        self.row_of_id: Dict[str, int] = {}
+        self.files: Dict[str, Dict] = {}
+        self.shard_rows: Dict[str, List[List[int]]] = {}  # scope -> [[start, end), ...] of meta rows
+        self.acts: Dict[str, Dict] = {}  # act_id -> name, scope, row ranges, term counts (acts.json)
+        self._act_vec_sums: Dict[str, object] = {}
+        self._dim = dim
+        self._tmp: List[Tuple[Path, Path]] = []
+        self._chunks = self._open(CHUNKS)
+        self._meta = self._open(META) if with_meta else None
+        self._emb = None
+        if dim is not None:
+            from app.embedding import NpyAppender
+            tmp = EMBEDDINGS.with_name("embeddings.tmp.npy")
+            self._tmp.append((tmp, EMBEDDINGS))
+            self._emb = NpyAppender(tmp, dim)
+
+    def _open(self, path: Path):
+        tmp = path.with_name(path.name + ".tmp")
+        self._tmp.append((tmp, path))
+        return open(tmp, "w", encoding="utf-8")
+
+    def add(self, batch: List[Dict], X=None) -> None:
+        for r in batch:
+            line = json.dumps(r, ensure_ascii=False) + "\n"
+            self._chunks.write(line)
+            if self._meta:
+                self._meta.write(line)
+            self.secmap.add(self.rows, r)
+            self.tree.add(self.rows, r)
+            self.definitions.add(self.rows, r)
+            self.xrefs.add(r)
+            self.row_of_id.setdefault(r["id"], self.rows)
+            self.scope_counts[r["scope"]] += 1
+            entry = self.files.setdefault(r["source"], {
+                "scope": r["scope"], "chunk_ids": [], "rows": [self.rows, self.rows],
+            })
+            entry["chunk_ids"].append(r["id"])
+            for ranges in (self.shard_rows.setdefault(r["scope"], []), self._act(r)["rows"]):
+                if ranges and ranges[-1][1] == self.rows:
+                    ranges[-1][1] += 1
+                else:
+                    ranges.append([self.rows, self.rows + 1])
+            tokens = r["text"].split()  # as the retriever's BM25 tokenises
+            self._act(r)["terms"].update(tokens)
+            self._act(r)["length"] += len(tokens)
+            self.rows += 1
+            entry["rows"][1] = self.rows
+        if X is not None:
+            self._emb.append(X)
+            act_ids = [self._act_key(r) for r in batch]
+            for act_id in dict.fromkeys(act_ids):
+                total = X[[i for i, a in enumerate(act_ids) if a == act_id]].sum(axis=0)
+                prev = self._act_vec_sums.get(act_id)
+                self._act_vec_sums[act_id] = total if prev is None else prev + total
+
+    @staticmethod
+    def _act_key(r: Dict) -> str:
+        return r.get("act_id") or r["source"]
+
+    def _act(self, r: Dict) -> Dict:
+        return self.acts.setdefault(self._act_key(r), {
+            "name": r.get("act_name"), "scope": r["scope"], "rows": [], "length": 0, "terms": Counter(),
+        })
+
+    def commit(self, file_info: Dict[str, Dict], aliases: Dict[str, List[Dict]], dry_run: bool = False) -> None:
+        self._chunks.close()
+        if self._meta:
+            self._meta.close()
+        if self._emb:
+            self._emb.close()
+        if dry_run:
+            for tmp, final in self._tmp:
+                if final != CHUNKS:
+                    tmp.unlink(missing_ok=True)
+            self._tmp = [(t, f) for t, f in self._tmp if f == CHUNKS]
+        for tmp, final in self._tmp:
+            tmp.replace(final)
+
+        # Every file is replaced by rename, never rewritten in place: published
+        # generations hard-link these inodes
+        tmp = SECTION_MAP.with_suffix(".tmp")
+        tmp.write_text(json.dumps(self.secmap.secmap, ensure_ascii=False, indent=2), encoding="utf-8")
+        tmp.replace(SECTION_MAP)
+        print(f"[sections] indexed {len(self.secmap.secmap)} section headings -> {SECTION_MAP}")
+        if dry_run:
+            return
+
+        shard_files: Dict[str, str] = {}
+        if self._emb is not None:
+            import numpy as np
+            from app.embedding import write_faiss_shards
+            shard_files = write_faiss_shards(INDEX, np.load(EMBEDDINGS, mmap_mode="r"), self.shard_rows)
+            # The API loads the shards; a whole-corpus faiss.index would only be a stale second copy
+            FAISS_FILE.unlink(missing_ok=True)
+        layout = {
+            scope: {"rows": ranges, "faiss": shard_files.get(scope)}
+            for scope, ranges in self.shard_rows.items()
+        }
+        tmp = SHARDS.with_suffix(".tmp")
+        tmp.write_text(json.dumps(layout), encoding="utf-8")
+        tmp.replace(SHARDS)
+        print(f"[shards] {', '.join(f'{s}={sum(e - b for b, e in r)}' for s, r in self.shard_rows.items())} -> {SHARDS}")
+        # Per-act term profiles (+ centroids) for the retriever's coarse act routing
+        profiles = {
+            act_id: {**act, "terms": dict(act["terms"].most_common(ACT_PROFILE_TERMS))}
+            for act_id, act in self.acts.items()
+        }
+        tmp = ACTS.with_suffix(".tmp")
+        tmp.write_text(json.dumps(profiles, ensure_ascii=False), encoding="utf-8")
+        tmp.replace(ACTS)
+        if self._act_vec_sums:
+            import numpy as np
+            centroids = np.stack([
+                self._act_vec_sums.get(act_id, np.zeros(self._dim, dtype="float32")) for act_id in self.acts
+            ]).astype("float32")
+            centroids /= np.maximum(np.linalg.norm(centroids, axis=1, keepdims=True), 1e-12)
+            tmp = ACT_CENTROIDS.with_name("act_centroids.tmp.npy")
+            np.save(tmp, centroids)
+            tmp.replace(ACT_CENTROIDS)
+        print(f"[acts] {len(self.acts)} act profiles{' + centroids' if self._act_vec_sums else ''} -> {ACTS}")
+        tmp = ALIASES.with_suffix(".tmp")
+        tmp.write_text(json.dumps(aliases, ensure_ascii=False), encoding="utf-8")
+        tmp.replace(ALIASES)
+
+        # Collapsed copies still belong in their own act's tree: point them at the canonical row
+        for canonical, entries in aliases.items():
+            for e in entries:
+                if canonical in self.row_of_id:
+                    self.tree.add(self.row_of_id[canonical], e)
+        tmp = STRUCTURE.with_suffix(".tmp")
+        tmp.write_text(json.dumps(self.tree.nodes, ensure_ascii=False), encoding="utf-8")
+        tmp.replace(STRUCTURE)
+        n_sections = sum(1 for n in self.tree.nodes.values() if n["type"] == "section")
+        print(f"[structure] {len(self.tree.nodes)} nodes ({n_sections} sections) -> {STRUCTURE}")
+        sec_index = SectionIndex.from_tree(self.tree)
+        tmp = SECTION_INDEX.with_suffix(".tmp")
+        tmp.write_text(json.dumps(sec_index.to_json(), ensure_ascii=False), encoding="utf-8")
+        tmp.replace(SECTION_INDEX)
+        n_keys = sum(len(v) for v in sec_index.sections.values())
+        print(f"[sections] {n_keys} (act, section) entries for {len(sec_index.sections)} numbers -> {SECTION_INDEX}")
+        tmp = DEFINITIONS.with_suffix(".tmp")
+        tmp.write_text(json.dumps(self.definitions.terms, ensure_ascii=False), encoding="utf-8")
+        tmp.replace(DEFINITIONS)
+        print(f"[definitions] {len(self.definitions.terms)} defined terms -> {DEFINITIONS}")
+        graph = self.xrefs.resolve(sec_index)
+        tmp = XREFS.with_suffix(".tmp")
+        tmp.write_text(json.dumps(graph, ensure_ascii=False), encoding="utf-8")
+        tmp.replace(XREFS)
+        print(f"[xrefs] {sum(len(v) for v in graph.values())} references from {len(graph)} sections -> {XREFS}")
+        for src, entry in self.files.items():
+            entry.update(file_info.get(src, {}))
+        manifest = {"embed_model": settings.EMBED_MODEL, "chunker": self.chunker, "files": self.files}
+        tmp = MANIFEST.with_suffix(".tmp")
+        tmp.write_text(json.dumps(manifest, ensure_ascii=False, indent=2), encoding="utf-8")
+        tmp.replace(MANIFEST)
+        print(f"[manifest] {len(self.files)} file(s) -> {MANIFEST}")
+
+        # Versioned snapshot + CURRENT pointer: the running API picks it up and hot-swaps
+        files = [META, SECTION_MAP, ALIASES, STRUCTURE, SECTION_INDEX, DEFINITIONS, XREFS, SHARDS, ACTS, MANIFEST]
+        if self._emb is not None:
+            files += [EMBEDDINGS] + [INDEX / f for f in shard_files.values()]
+            if self._act_vec_sums:
+                files.append(ACT_CENTROIDS)
+        gen_dir = publish(
+            INDEX, files,
+            {"rows": self.rows, "chunker": self.chunker, "embed_model": settings.EMBED_MODEL},
+            keep=settings.GENERATIONS_KEEP,
+        )
+        print(f"[generation] published {gen_dir.name} -> {gen_dir}")
 
 
 # ---- Scope detection ----
@@ -123,49 +383,29 @@ def _extract_all_section_numbers(text: str) -> List[str]:
                     found.add(clean_num)
     return list(found)
 
-def _build_section_map(records: List[Dict]) -> Dict[str, Dict]:
+class _SectionMapBuilder:
     """
-    Map section number -> {idx, source, snippet}
+    Map section number -> {idx, source, snippet}, filled one chunk at a time.
     If a chunk mentions multiple sections, we index it for ALL of them.
     """
-    secmap: Dict[str, Dict] = {}
-    print(f"[sections] Building map from {len(records)} chunks...")
-    
-    count = 0
-    for idx, r in enumerate(records):
-        nums = _extract_all_section_numbers(r["text"])
-        
-        for num in nums:
-            if num not in secmap:
-                secmap[num] = {
+
+    def __init__(self):
+        self.secmap: Dict[str, Dict] = {}
+
+    def add(self, idx: int, r: Dict) -> None:
+        for num in _extract_all_section_numbers(r["text"]):
+            if num not in self.secmap:
+                self.secmap[num] = {
                     "idx": idx,
                     "source": r["source"],
                     "filename": r.get("filename", "unknown"),
                     "scope": r.get("scope", "global_law"),
                     "snippet": " ".join(r["text"].split())[:160]
                 }
-                count += 1
-                
-    print(f"[sections] Identified {count} unique sections.")
-    return secmap
-
 
-def main() -> None:
-    _ensure_dirs()
-
-    parser = argparse.ArgumentParser()
-    parser.add_argument("--dry-run", action="store_true", help="Parse & chunk only; skip embedding/index build")
-    args = parser.parse_args()
 
-    print(f"[ingest] scanning {RAW.resolve()} ...")
-    files = sorted([p for p in RAW.rglob("*") if p.is_file()])
-    if not files:
-        print("[ingest] No files found in data/raw/. Add PDFs in scoped subfolders and retry.")
-        sys.exit(1)
-    print(f"[ingest] found {len(files)} file(s).")
-
-    # Parse -> section-first -> chunk
-    records: List[Dict] = []
+# ---- Streaming pipeline: parse -> chunk -> dedupe -> batch ----
+def _iter_sources(files: List[Path]) -> Iterator[Tuple[Path, Callable, str]]:
     for path in files:
         suffix = path.suffix.lower()
         if suffix == ".pdf":
@@ -182,79 +422,278 @@ def main() -> None:
         except ValueError as e:
             print(str(e))
             sys.exit(7)
+        yield path, loader, scope
+
+
+def _iter_records(
+    sources: Iterator[Tuple[Path, Callable, str]],
+    file_info: Dict[str, Dict],
+    manifest: Dict,
+    prev: _PreviousIndex,
+    corpus_changed: bool,
+    stats: Counter,
+    prev_aliases: Dict[str, List[Tuple[str, Dict]]],
+    aliases: Dict[str, List[Dict]],
+    chunk_fn: Callable[[str], List[str]] = chunk_section,
+) -> Iterator[Dict]:
+    """Yield chunk records file by file; unchanged files replay their previous rows."""
+    for path, loader, scope in sources:
+        src = str(path)
+        info = file_info[src]
+        old = manifest["files"].get(src)
+        reusable = (
+            old and old["rows"][1] <= len(prev.offsets)
+            and old.get("sha256") == info["sha256"] and old.get("scope") == scope
+            # chunks deduped against another file may need to come back if that file changed
+            and not (corpus_changed and old.get("deduped", 0))
+        )
+        if reusable:
+            start, end = old["rows"]
+            info["deduped"] = old.get("deduped", 0)
+            # Copies this file contributed as aliases were never written to meta; carry them over
+            for canonical, entry in prev_aliases.get(src, ()):
+                aliases.setdefault(canonical, []).append(entry)
+            stats["reused_files"] += 1
+            print(f"[skip] {path.name}  unchanged ({end - start} chunks reused)")
+            yield from prev.records(start, end)
+            continue
 
         act_name = _derive_act_name(path)
         print(f"[parse] {path.name}  ->  scope={scope}  act={act_name}")
-
-        sec_count = 0
+        act_id = act_id_for(act_name)
+        structure = StructureParser(act_id)
+        sections = set()
+        section_idx = -1
+        current = object()
         chunk_count = 0
         for sec in loader(path):
-            sec_count += 1
-            chunks = chunk_section(sec["text"], max_tokens=520, overlap=96)
-            for c in chunks:
-                records.append({
-                    "id": _hash(c),
-                    "title": sec["title"],
-                    "text": c,
-                    "source": sec["source"],
-                    "url": sec["url"],
-                    "filename": path.name,
-                    # --- NEW: scope & jurisdiction metadata ---
-                    "scope": scope,
-                    "act_name": act_name,
-                    "jurisdiction": "india",
-                })
-            chunk_count += len(chunks)
-        print(f"      sections: {sec_count}, chunks: {chunk_count}")
-
-    if not records:
-        print("[ingest] Parsed 0 chunks.")
-        sys.exit(2)
+            # act -> chapter -> section -> clause units; each unit is cut to the chunker's limit
+            for unit in structure.units(sec["text"]):
+                if unit["section_id"] != current:
+                    current = unit["section_id"]
+                    section_idx += 1
+                if unit["section_id"]:
+                    sections.add(unit["section_id"])
+                # Clause units are deliberately small; keep one whole rather than let the
+                # chunker's minimum-length rule drop it
+                for c in chunk_fn(unit["text"]) or [unit["text"]]:
+                    chunk_count += 1
+                    yield {
+                        "id": _hash(c),
+                        "title": sec["title"],
+                        "text": c,
+                        "source": sec["source"],
+                        "url": sec["url"],
+                        "filename": path.name,
+                        # --- NEW: scope & jurisdiction metadata ---
+                        "scope": scope,
+                        "act_name": act_name,
+                        "jurisdiction": "india",
+                        # --- structural position (see app/structure.py) ---
+                        "act_id": act_id,
+                        "chapter_id": unit["chapter_id"],
+                        "section_id": unit["section_id"],
+                        "node_id": unit["node_id"],
+                        "section_number": unit["section_number"],
+                        "section_heading": unit["section_heading"],
+                        # --- position of this base segment within the file ---
+                        "section_idx": section_idx,
+                        "seg": chunk_count - 1,
+                    }
+        print(f"      sections: {len(sections)}, chunks: {chunk_count}")
+
+
+_STRUCT_FIELDS = ("act_id", "scope", "chapter_id", "section_id", "node_id", "section_number", "section_heading")
+
+
+def _alias(r: Dict, similarity: float) -> Dict:
+    return {
+        **{k: r.get(k) for k in _STRUCT_FIELDS},
+        "id": r["id"],
+        "source": r["source"],
+        "filename": r.get("filename"),
+        "act_name": r.get("act_name"),
+        "section_idx": r.get("section_idx"),
+        "seg": r.get("seg"),
+        "similarity": round(similarity, 3),
+    }
+
+
+def _dedupe(
+    records: Iterator[Dict],
+    file_info: Dict[str, Dict],
+    aliases: Dict[str, List[Dict]],
+    stats: Counter,
+) -> Iterator[Dict]:
+    """Drop exact duplicate chunks (same _hash) across the corpus, keeping the first as canonical."""
+    seen = set()
+    for r in records:
+        if r["id"] in seen:
+            stats["duplicates"] += 1
+            stats["duplicate_words"] += len(r["text"].split())
+            file_info[r["source"]]["deduped"] = file_info[r["source"]].get("deduped", 0) + 1
+            if r["source"] not in {a["source"] for a in aliases.get(r["id"], ())}:
+                aliases.setdefault(r["id"], []).append(_alias(r, 1.0))
+            continue
+        seen.add(r["id"])
+        yield r
 
-    # Print scope distribution
-    from collections import Counter
-    scope_counts = Counter(r["scope"] for r in records)
-    print(f"\n[ingest] Scope distribution: {dict(scope_counts)}")
 
-    print(f"[write] writing {len(records)} chunk records -> {CHUNKS}")
-    with open(CHUNKS, "w", encoding="utf-8") as f:
-        for r in records:
-            f.write(json.dumps(r, ensure_ascii=False) + "\n")
+def _near_dedupe(
+    records: Iterator[Dict],
+    file_info: Dict[str, Dict],
+    aliases: Dict[str, List[Dict]],
+    stats: Counter,
+    threshold: float,
+) -> Iterator[Dict]:
+    """
+    Collapse near-duplicate chunks (MinHash/LSH) into the first copy seen,
+    only within one act: across acts (IPC vs BNS, an Act vs its amended
+    edition) near-identical sections differ exactly where it matters (the
+    penalty, the amendment), so only identical text is collapsed there (_dedupe).
+    Dropped copies are recorded as aliases of the canonical chunk.
+    """
+    from app.dedup import MinHashLSH
 
-    # ---- build and write section_map ----
-    secmap = _build_section_map(records)
-    with open(SECTION_MAP, "w", encoding="utf-8") as f:
-        json.dump(secmap, f, ensure_ascii=False, indent=2)
-    print(f"[sections] indexed {len(secmap)} section headings -> {SECTION_MAP}")
+    lsh = MinHashLSH(threshold=threshold)
+    for r in records:
+        hit = lsh.query_or_add(r["id"], r["text"], namespace=r.get("act_id") or r["source"])
+        if hit is None:
+            yield r
+            continue
+        canonical, sim = hit
+        aliases.setdefault(canonical, []).append(_alias(r, sim))
+        file_info[r["source"]]["deduped"] = file_info[r["source"]].get("deduped", 0) + 1
+        stats["near_duplicates"] += 1
+        stats["duplicate_words"] += len(r["text"].split())
+
+
+def _batched(records: Iterator[Dict], size: int) -> Iterator[List[Dict]]:
+    batch: List[Dict] = []
+    for r in records:
+        batch.append(r)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
 
-    if args.dry_run:
-        print("[dry-run] skipping embeddings/index build. Done.")
-        return
 
-    # ----- BM25-only path -----
-    if not getattr(settings, "USE_EMBEDDINGS", False):
+def main() -> None:
+    _ensure_dirs()
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--dry-run", action="store_true", help="Parse & chunk only; skip embedding/index build")
+    parser.add_argument("--full", action="store_true", help="Ignore the manifest and re-process every file")
+    parser.add_argument("--batch-size", type=int, default=1024, help="Chunks held in memory per embed/write batch")
+    parser.add_argument("--chunker", choices=["tokens", "words"], default="tokens",
+                        help="tokens: cut on clause boundaries within EMBED_MODEL's max_seq_length; words: fixed word segments")
+    parser.add_argument("--near-dup-threshold", type=float, default=0.85,
+                        help="MinHash Jaccard above which chunks are collapsed (0 disables)")
+    args = parser.parse_args()
+
+    print(f"[ingest] scanning {RAW.resolve()} ...")
+    files = sorted([p for p in RAW.rglob("*") if p.is_file()])
+    if not files:
+        print("[ingest] No files found in data/raw/. Add PDFs in scoped subfolders and retry.")
+        sys.exit(1)
+    print(f"[ingest] found {len(files)} file(s).")
+
+    chunker, chunk_fn = f"{STRUCTURE_VERSION}+{WORD_CHUNKER}", chunk_section
+    if args.chunker == "tokens":
+        try:
+            tokenizer, budget = load_embedding_tokenizer(settings.EMBED_MODEL)
+            chunker = f"{STRUCTURE_VERSION}+tok{budget}:{settings.EMBED_MODEL}"
+            chunk_fn = lambda text: chunk_by_tokens(text, tokenizer, budget)  # noqa: E731
+            print(f"[chunk] tokenizer-aware chunks of <= {budget} word-pieces ({settings.EMBED_MODEL})")
+        except Exception as e:
+            print(f"[chunk] tokenizer unavailable ({e}); falling back to {SEGMENT_WORDS}-word segments.")
+
+    manifest = {"files": {}} if args.full else _load_manifest()
+    if manifest["files"] and manifest.get("chunker") != chunker:
+        print(f"[manifest] chunker changed ({manifest.get('chunker')} -> {chunker}); re-chunking all files.")
+        manifest = {**manifest, "files": {}}
+    prev = _PreviousIndex(enabled=not args.full)
+    reuse_vectors = manifest.get("embed_model") in (None, settings.EMBED_MODEL)
+    if not reuse_vectors:
+        print(f"[manifest] EMBED_MODEL changed ({manifest['embed_model']} -> {settings.EMBED_MODEL}); re-embedding all chunks.")
+
+    # Hash every file up front so we know whether anything changed before streaming
+    file_info = {str(p): {"sha256": file_sha256(p)} for p in files}
+    dropped = [src for src in manifest["files"] if src not in file_info]
+    for src in dropped:
+        print(f"[drop] {Path(src).name}  removed from data/raw ({len(manifest['files'][src]['chunk_ids'])} chunks dropped)")
+    corpus_changed = bool(dropped) or any(
+        manifest["files"].get(src, {}).get("sha256") != info["sha256"] for src, info in file_info.items()
+    )
+
+    use_vectors = not args.dry_run and getattr(settings, "USE_EMBEDDINGS", False)
+    if not args.dry_run and not use_vectors:
         print("[bm25-only] USE_EMBEDDINGS=false -> skipping FAISS vector index.")
-        print(f"[meta] writing metadata -> {META}")
-        with open(META, "w", encoding="utf-8") as f:
-            for r in records:
-                f.write(json.dumps(r, ensure_ascii=False) + "\n")
-        print(f"[done] Wrote metadata for {len(records)} chunks -> {META}")
-        return
 
-    # ----- Vector path (requires embeddings + FAISS) -----
-    import numpy as np  # noqa
-    try:
-        import faiss  # type: ignore
-    except Exception:
-        print("[error] FAISS import failed. Install faiss-cpu and retry, or set USE_EMBEDDINGS=false.")
-        print("        pip install faiss-cpu")
-        sys.exit(3)
+    embedder = None
+    client = None
+    dim = None
+    if use_vectors:
+        try:
+            import faiss  # type: ignore  # noqa
+        except Exception:
+            print("[error] FAISS import failed. Install faiss-cpu and retry, or set USE_EMBEDDINGS=false.")
+            print("        pip install faiss-cpu")
+            sys.exit(3)
+        if settings.EMBED_BACKEND == "local":
+            from app.embedding import LocalEmbedder
+            print(f"[embed] starting local embedder {settings.EMBED_MODEL} ...")
+            embedder = LocalEmbedder(workers=settings.EMBED_WORKERS or None)
+            dim = embedder.dim
+        else:
+            client = _openrouter_client()
+
+    stats: Counter = Counter()
+    aliases: Dict[str, List[Dict]] = {}
+    prev_aliases: Dict[str, List[Tuple[str, Dict]]] = {}
+    if not args.full and ALIASES.exists():
+        for canonical, entries in json.loads(ALIASES.read_text(encoding="utf-8")).items():
+            for e in entries:
+                prev_aliases.setdefault(e["source"], []).append((canonical, e))
+    records = _dedupe(
+        _iter_records(
+            _iter_sources(files), file_info, manifest, prev, corpus_changed, stats,
+            prev_aliases, aliases, chunk_fn,
+        ),
+        file_info, aliases, stats,
+    )
+    if args.near_dup_threshold > 0:
+        records = _near_dedupe(records, file_info, aliases, stats, args.near_dup_threshold)
 
-    client = _openrouter_client()
+    import numpy as np
+    writer = None
     try:
-        texts = [r["text"] for r in records]
-        print(f"[embed] creating embeddings for {len(texts)} chunks using {settings.EMBED_MODEL} ...")
-        X = _embed_texts_openrouter(client, texts)
+        for batch in _batched(records, args.batch_size):
+            X = None
+            if use_vectors:
+                # Reuse stored vectors for chunks whose _hash is unchanged; embed only the rest
+                stored = [prev.vector(r["id"]) if reuse_vectors else None for r in batch]
+                todo = [i for i, v in enumerate(stored) if v is None]
+                texts = [batch[i]["text"] for i in todo]
+                if embedder is not None:
+                    X_new = embedder.embed(texts)
+                else:
+                    X_new = _embed_texts_openrouter(client, texts, [batch[i]["id"] for i in todo]) if texts else None
+                if dim is None:
+                    dim = X_new.shape[1] if X_new is not None else len(next(v for v in stored if v is not None))
+                X = np.empty((len(batch), dim), dtype="float32")
+                for i, v in enumerate(stored):
+                    if v is not None:
+                        X[i] = v
+                if todo:
+                    X[todo] = X_new
+                stats["reused_vectors"] += len(batch) - len(todo)
+                stats["embedded"] += len(todo)
+            if writer is None:
+                writer = _IndexWriter(with_meta=not args.dry_run, chunker=chunker, dim=dim if use_vectors else None)
+            writer.add(batch, X)
+            print(f"[write] {writer.rows} chunks written")
     except AuthenticationError:
         print("[error] OpenRouter authentication failed. Check OPENROUTER_API_KEY.")
         sys.exit(4)
@@ -262,20 +701,42 @@ def main() -> None:
         print(f"[error] Embedding request rejected: {e}")
         sys.exit(5)
     except Exception as e:
-        print(f"[error] Embedding failed: {e}")
+        print(f"[error] Ingest failed: {e}")
         sys.exit(6)
+    finally:
+        if embedder is not None:
+            embedder.close()
 
-    print(f"[index] building FAISS (dim={X.shape[1]}, n={X.shape[0]}) ...")
-    index = faiss.IndexFlatIP(X.shape[1])
-    index.add(X)
-    faiss.write_index(index, str(FAISS_FILE))
+    if writer is None:
+        print("[ingest] Parsed 0 chunks.")
+        sys.exit(2)
 
-    print(f"[meta] writing metadata -> {META}")
-    with open(META, "w", encoding="utf-8") as f:
-        for r in records:
-            f.write(json.dumps(r, ensure_ascii=False) + "\n")
+    # Release the mmap of the old embeddings before replacing the file
+    prev.close()
+    writer.commit(file_info, aliases, dry_run=args.dry_run)
 
-    print(f"[done] Indexed {len(records)} chunks -> {FAISS_FILE}")
+    print(f"\n[ingest] Scope distribution: {dict(writer.scope_counts)}")
+    print(
+        f"[ingest] {stats['reused_files']} unchanged, {len(file_info) - stats['reused_files']} new/changed, "
+        f"{len(dropped)} deleted file(s)."
+    )
+    collapsed = stats["duplicates"] + stats["near_duplicates"]
+    if collapsed:
+        total = writer.rows + collapsed
+        saved = f"{collapsed}/{total} chunks ({100.0 * collapsed / total:.1f}%)"
+        if dim:
+            saved += f", ~{collapsed * dim * 4 / 1e6:.2f} MB of vectors"
+        print(f"[dedup] {stats['duplicates']} exact + {stats['near_duplicates']} near-duplicate chunk(s) "
+              f"collapsed into {len(aliases)} canonical chunk(s); saved {saved}, "
+              f"{stats['duplicate_words']} words of BM25 text -> {ALIASES}")
+    if args.dry_run:
+        print("[dry-run] skipping embeddings/index build. Done.")
+        return
+    if use_vectors:
+        print(f"[embed] reused {stats['reused_vectors']} stored vectors, embedded {stats['embedded']}.")
+        print(f"[done] Indexed {writer.rows} chunks -> {INDEX}")
+    else:
+        print(f"[done] Wrote metadata for {writer.rows} chunks -> {META}")
 
 
 if __name__ == "__main__":
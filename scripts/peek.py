@@ -1,22 +1,21 @@
 import json
-import faiss
 import numpy as np
 from pathlib import Path
 
 # Paths
 INDEX_DIR = Path("data/index")
 META_FILE = INDEX_DIR / "meta.jsonl"
-FAISS_FILE = INDEX_DIR / "faiss.index"
+EMB_FILE = INDEX_DIR / "embeddings.npy"  # row i is the vector of meta row i
 
 def main():
-    if not FAISS_FILE.exists() or not META_FILE.exists():
+    if not EMB_FILE.exists() or not META_FILE.exists():
         print("❌ Error: Index files not found. Run ingest.py first.")
         return
 
-    # 1. Load the FAISS Index (The Vectors)
-    print(f"Loading index from {FAISS_FILE}...")
-    index = faiss.read_index(str(FAISS_FILE))
-    print(f"✅ Index contains {index.ntotal} vectors.")
+    # 1. Load the Embeddings (The Vectors)
+    print(f"Loading embeddings from {EMB_FILE}...")
+    X = np.load(EMB_FILE, mmap_mode="r")
+    print(f"✅ Embeddings contain {X.shape[0]} vectors.")
 
     # 2. Load the Metadata (The Text)
     print(f"Loading metadata from {META_FILE}...")
@@ -26,11 +25,10 @@ def main():
     # 3. Inspect the first 3 chunks
     print("\n--- INSPECTING FIRST 3 CHUNKS ---\n")
     for i in range(3):
-        if i >= index.ntotal: break
+        if i >= X.shape[0]: break
         
         # Get the vector (embedding) for ID 'i'
-        # Note: reconstruct() works for IndexFlatIP (simple indexes)
-        vector = index.reconstruct(i)
+        vector = X[i]
         
         doc = meta[i]
         
@@ -1,30 +1,24 @@
 import json
-import faiss
 import numpy as np
 from pathlib import Path
 
 # Paths
 INDEX_DIR = Path("data/index")
 META_FILE = INDEX_DIR / "meta.jsonl"
-FAISS_FILE = INDEX_DIR / "faiss.index"
+EMB_FILE = INDEX_DIR / "embeddings.npy"  # row i is the vector of meta row i
 
 def main():
-    if not FAISS_FILE.exists():
-        print("❌ Error: faiss.index not found.")
+    if not EMB_FILE.exists():
+        print("❌ Error: embeddings.npy not found.")
         return
 
-    print(f"🔍 Peeking into {FAISS_FILE} using Memory Mapping (Safe Mode)...")
+    print(f"🔍 Peeking into {EMB_FILE} using Memory Mapping (Safe Mode)...")
 
-    # 1. LOAD WITH MEMORY MAPPING (IO_FLAG_MMAP)
+    # 1. LOAD WITH MEMORY MAPPING
     # This prevents loading the whole file into RAM. It reads directly from disk.
-    try:
-        index = faiss.read_index(str(FAISS_FILE), faiss.IO_FLAG_MMAP)
-    except AttributeError:
-        # Fallback for older FAISS versions that might not support the flag easily
-        print("⚠️ MMAP flag not found, attempting standard read...")
-        index = faiss.read_index(str(FAISS_FILE))
+    X = np.load(EMB_FILE, mmap_mode="r")
 
-    print(f"✅ Index connected. Total Vectors: {index.ntotal}")
+    print(f"✅ Embeddings connected. Total Vectors: {X.shape[0]}")
 
     # 2. Load Metadata (Text)
     print("📖 Reading text...")
@@ -36,10 +30,10 @@ def main():
     
     # We only look at i = 0, 1, 2
     for i in range(3):
-        if i >= index.ntotal: break
+        if i >= X.shape[0]: break
         
-        # reconstruct(i) grabs ONLY the ith vector from the disk
-        vector = index.reconstruct(i)
+        # X[i] reads ONLY the ith vector from the disk
+        vector = X[i]
         
         doc = meta[i]
         
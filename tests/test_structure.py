@@ -0,0 +1,20 @@
+from app.structure import StructureParser
+
+
+def _sections(text: str):
+    units = StructureParser("act").units(text)
+    return list(dict.fromkeys(u["section_id"] for u in units if u["section_id"]))
+
+
+def test_cross_reference_at_sentence_end_is_not_a_heading():
+    body = "the person so charged shall be liable as set out in this provision and no further liability arises"
+    text = " ".join([
+        f"1. Short title. This Act may be called the Example Act and {body}.",
+        f"2. Definitions. In this Act unless the context otherwise requires {body}.",
+        f"3. Offence. Whoever contravenes this Act shall be punishable as provided under section 9. "
+        f"The court may also direct {body}.",
+        f"4. Cognizance. No court shall take cognizance of an offence except on complaint and {body}.",
+        f"5. Appeal. An appeal shall lie to the High Court from every order and {body}.",
+        f"9. Penalty. Whoever is punishable under this section shall be punished with fine and {body}.",
+    ])
+    assert _sections(text) == ["act/s-1", "act/s-2", "act/s-3", "act/s-4", "act/s-5", "act/s-9"]
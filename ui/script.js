@@ -62,18 +62,29 @@ async function uploadFile(file) {
     progressLabel.textContent = `Uploading ${file.name}…`;
     browseBtn.disabled = true;
 
-    let fake = 0;
-    const timer = setInterval(() => { fake = Math.min(fake + 7, 85); progressFill.style.width = fake + "%"; }, 250);
-
     try {
         const fd = new FormData();
         fd.append("file", file);
         const res = await fetch(`${API_BASE}/upload`, { method: "POST", body: fd });
-        const data = await res.json();
-        clearInterval(timer);
+        let data = await res.json();
+        if (!data.job_id) throw new Error(data.detail || "upload rejected");
+
+        // Poll the background ingestion job until it finishes (or is lost, e.g. after a restart)
+        progressLabel.textContent = `Indexing ${file.name}…`;
+        const jobId = data.job_id;
+        const pollUntil = Date.now() + 10 * 60 * 1000;
+        while (data.status !== "done" && data.status !== "failed") {
+            if (Date.now() > pollUntil) throw new Error("indexing is taking too long; try again later");
+            await new Promise(r => setTimeout(r, 500));
+            const poll = await fetch(`${API_BASE}/upload/${jobId}`);
+            if (!poll.ok) throw new Error(poll.status === 404 ? "upload job not found (server restarted?)" : `status check failed (${poll.status})`);
+            data = await poll.json();
+            const pct = data.pages_total ? Math.round(85 * data.pages_parsed / data.pages_total) : 5;
+            progressFill.style.width = (data.status === "indexing" ? 90 : pct) + "%";
+        }
         progressFill.style.width = "100%";
         progressLabel.textContent = "Processing complete!";
-        if (data.status === "success") {
+        if (data.status === "done") {
             uploadedDocs.push({ filename: data.filename, chunks: data.chunks_added });
             renderDocList();
             showToast(`✅ Indexed ${data.chunks_added} chunks from "${data.filename}"`, "success");
@@ -82,8 +93,7 @@ async function uploadFile(file) {
             showToast(`❌ Upload failed: ${data.error || data.detail}`, "error");
         }
     } catch (err) {
-        clearInterval(timer);
-        showToast(`❌ Network error: ${err.message}`, "error");
+        showToast(`❌ Upload failed: ${err.message}`, "error");
     } finally {
         setTimeout(() => { uploadProgress.classList.add("hidden"); browseBtn.disabled = false; fileInput.value = ""; }, 1500);
     }